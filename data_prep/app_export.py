@@ -0,0 +1,157 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Tuple, Union
+
+import pandas as pd
+
+# Low-cardinality string columns that are dictionary-encoded in Parquet
+DICTIONARY_COLUMNS = [
+    "venue",
+    "city",
+    "country",
+    "tour",
+    "song_title",
+    "album_name",
+    "category",
+    "name",
+]
+
+# Numeric columns of the app tables, all other columns are read as text
+NUMERIC_COLUMNS = [
+    "latitude",
+    "longitude",
+    "n",
+    "rank",
+    "concerts",
+    "leg_km",
+    "total_km",
+    "longest_leg_km",
+    "zoom",
+    "cities",
+]
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is only required for the Parquet output."""
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError(
+            "pyarrow is required to write Parquet/Feather output: "
+            "pip install pyarrow (or write the CSV files only with "
+            "parquet=False)"
+        ) from error
+
+    return pyarrow
+
+
+def to_arrow_table(app_df: pd.DataFrame):
+    """Convert an app DataFrame to an Arrow table with compact types:
+    dates (dd-mm-yyyy strings) become date32, coordinates float64 and
+    the low-cardinality string columns are dictionary-encoded.
+
+    Args:
+        app_df (DataFrame): app_setlist_data or app_albums_songs data
+
+    Returns:
+        table (pyarrow.Table): the typed Arrow table
+    """
+    pa = _import_pyarrow()
+
+    app_df = app_df.copy()
+
+    if "date" in app_df.columns:
+        app_df["date"] = pd.to_datetime(app_df["date"], format="%d-%m-%Y").dt.date
+
+    for column in ["latitude", "longitude"]:
+        if column in app_df.columns:
+            app_df[column] = app_df[column].astype("float64")
+
+    table = pa.Table.from_pandas(app_df, preserve_index=False)
+
+    for column in DICTIONARY_COLUMNS:
+        if column in table.column_names:
+            index = table.column_names.index(column)
+            table = table.set_column(
+                index, column, table[column].cast(pa.string()).dictionary_encode()
+            )
+
+    return table
+
+
+def write_app_data(
+    app_tables: Dict[str, pd.DataFrame],
+    out_path: Union[str, Path],
+    parquet: bool = True,
+) -> Tuple[Path, ...]:
+    """Write the app data to out_path: always as CSV (for compatibility)
+    and, if enabled, additionally as Parquet files with typed and
+    dictionary-encoded columns.
+
+    Args:
+        app_tables (dict): app DataFrames keyed by file name (without
+            extension), e.g., the output of transform_data()
+        out_path (str or Path): output directory
+        parquet (bool): if True, write the Parquet files as well. This
+            requires pyarrow, which is checked before any file is
+            written.
+
+    Returns:
+        paths (tuple): paths of all files written
+    """
+    if parquet:
+        _import_pyarrow()
+
+    os.makedirs(out_path, exist_ok=True)
+    paths = []
+
+    for name, app_df in app_tables.items():
+        csv_path = Path(out_path) / f"{name}.csv"
+        app_df.to_csv(csv_path, index=False, encoding="utf-8")
+        paths.append(csv_path)
+
+        if parquet:
+            table = to_arrow_table(app_df)
+
+            import pyarrow.parquet as pq
+
+            parquet_path = Path(out_path) / f"{name}.parquet"
+            pq.write_table(table, parquet_path)
+            paths.append(parquet_path)
+
+    return tuple(paths)
+
+
+def read_app_data(
+    out_path: Union[str, Path], names: Iterable[str]
+) -> Dict[str, pd.DataFrame]:
+    """Read app data written by write_app_data() from its CSV files. All
+    columns except NUMERIC_COLUMNS are read as text, so ids, tour names
+    and song titles that look like numbers are not converted.
+
+    Args:
+        out_path (str or Path): output directory of write_app_data()
+        names (iterable): file names (without extension) of the tables
+
+    Returns:
+        app_tables (dict): app DataFrames keyed by file name
+    """
+    app_tables = {}
+
+    for name in names:
+        app_df = pd.read_csv(Path(out_path) / f"{name}.csv", dtype=str)
+
+        for column in NUMERIC_COLUMNS:
+            if column in app_df.columns:
+                values = pd.to_numeric(app_df[column])
+
+                # pd.to_numeric() can be off in the last digit, floats are
+                # parsed exactly so updated tables keep the written values
+                if pd.api.types.is_float_dtype(values):
+                    values = app_df[column].astype(float)
+
+                app_df[column] = values
+
+        app_tables[name] = app_df
+
+    return app_tables
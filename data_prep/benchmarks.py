@@ -0,0 +1,402 @@
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+import pandas as pd
+
+from app_export import write_app_data
+from data_prep import concatenate_setlists
+from flatten_setlists import flatten_setlists
+from run_data_pipeline import TRANSFORM_STAGES
+from synthetic_data import generate_artist_data
+
+
+def measure(func: Callable, *args, **kwargs) -> Tuple[object, float, float]:
+    """Run a function and measure its wall time and peak memory.
+
+    Args:
+        func (callable): function to run
+        *args, **kwargs: arguments passed on to the function
+
+    Returns:
+        result: the return value of the function
+        seconds (float): wall time in seconds
+        peak_mib (float): peak memory allocated during the call in MiB
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    try:
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, seconds, peak / 1024**2
+
+
+def scale_setlists(raw_setlists_data: List[Dict], factor: int) -> List[Dict]:
+    """Scale the raw setlists data by repeating it with unique setlist
+    ids. The nested set and venue data is shared between the copies.
+
+    Args:
+        raw_setlists_data (list): the raw setlist.fm setlists data
+        factor (int): scaling factor
+
+    Returns:
+        scaled (list): the scaled raw setlists data
+    """
+    return [
+        {**setlist, "id": f"{setlist['id']}-{copy}"}
+        for copy in range(factor)
+        for setlist in raw_setlists_data
+    ]
+
+
+def scale_concerts(concerts_df: pd.DataFrame, factor: int) -> pd.DataFrame:
+    """Scale a song-level concerts DataFrame by repeating it with unique
+    concert ids.
+
+    Args:
+        concerts_df (DataFrame): song-level concerts data with an id
+            column
+        factor (int): scaling factor
+
+    Returns:
+        scaled (DataFrame): the scaled concerts data
+    """
+    return pd.concat(
+        [
+            concerts_df.assign(id=concerts_df["id"].astype(str) + f"-{copy}")
+            for copy in range(factor)
+        ],
+        ignore_index=True,
+    )
+
+
+def _json_normalize_setlists(raw_setlists_data: List[Dict]) -> pd.DataFrame:
+    """Reference implementation of the flattening step based on
+    pd.json_normalize and explode, as used before flatten_setlists().
+    """
+    setlists = pd.json_normalize(raw_setlists_data)
+    setlists = setlists.explode("sets.set", ignore_index=True)
+    sets = pd.json_normalize(setlists["sets.set"])
+    setlists = setlists.drop(columns=["sets.set"]).join(sets)
+    setlists = setlists.explode("song", ignore_index=True)
+    songs = pd.json_normalize(setlists["song"])
+    return setlists.drop(columns=["song"]).join(songs, rsuffix="_song")
+
+
+def iterrows_concatenate_setlists(concerts: pd.DataFrame) -> pd.DataFrame:
+    """Reference implementation of concatenate_setlists() based on a
+    loop over the rows of each concert, as used before the vectorized
+    implementation. The tests check the vectorized implementation
+    against it.
+    """
+    single_line_setlists = []
+
+    for id, setlist in concerts.groupby("id"):
+        concatenated_setlist = []
+
+        for index, row in setlist.iterrows():
+            song_title = row["song_title"] if pd.notna(row["song_title"]) else ""
+            concatenated_setlist.append(song_title)
+
+            encore_header = (
+                f"Encore {int(row['encore'])}:" if pd.notna(row["encore"]) else None
+            )
+
+            if encore_header and encore_header not in concatenated_setlist:
+                first_encore_song = concatenated_setlist.pop()
+                concatenated_setlist.extend(
+                    ["<b>", encore_header, "</b>", "<br>", first_encore_song]
+                )
+
+            concatenated_setlist.append("<br>")
+
+        single_line_setlists.append(
+            {"id": id, "song_title": "".join(concatenated_setlist)}
+        )
+
+    return pd.DataFrame(single_line_setlists)
+
+
+def benchmark_concatenate_setlists(
+    concerts_df: pd.DataFrame, factors: Tuple[int, ...] = (1, 10, 100)
+) -> pd.DataFrame:
+    """Compare the vectorized concatenate_setlists() with the row-wise
+    loop at different data sizes. That both implementations return the
+    same setlist strings is tested in tests/test_data_prep.py.
+
+    Args:
+        concerts_df (DataFrame): song-level concerts data as returned
+            by join_setlists_albums()
+        factors (tuple): scaling factors of the data
+
+    Returns:
+        results (DataFrame): rows, wall time and peak memory per
+            implementation and scaling factor
+    """
+    concerts = concerts_df.assign(
+        song_title=concerts_df["song_count"].astype(str)
+        + ". "
+        + concerts_df["song_title"].astype(str)
+    )[["id", "song_title", "encore"]]
+
+    results = []
+
+    for factor in factors:
+        scaled = scale_concerts(concerts, factor)
+
+        for name, func in [
+            ("iterrows", iterrows_concatenate_setlists),
+            ("vectorized", concatenate_setlists),
+        ]:
+            _, seconds, peak_mib = measure(func, scaled)
+            results.append(
+                {
+                    "benchmark": "concatenate_setlists",
+                    "implementation": name,
+                    "factor": factor,
+                    "rows": len(scaled),
+                    "seconds": round(seconds, 3),
+                    "peak_mib": round(peak_mib, 1),
+                }
+            )
+            print(results[-1])
+
+    return pd.DataFrame(results)
+
+
+def benchmark_flatten(
+    raw_setlists_data: List[Dict], factors: Tuple[int, ...] = (1, 10, 100)
+) -> pd.DataFrame:
+    """Compare flatten_setlists() with the json_normalize-based
+    flattening at different data sizes.
+
+    Args:
+        raw_setlists_data (list): the raw setlist.fm setlists data
+        factors (tuple): scaling factors of the data
+
+    Returns:
+        results (DataFrame): rows, wall time and peak memory per
+            implementation and scaling factor
+    """
+    results = []
+
+    for factor in factors:
+        scaled = scale_setlists(raw_setlists_data, factor)
+
+        for name, func in [
+            ("json_normalize", _json_normalize_setlists),
+            ("flatten_setlists", flatten_setlists),
+        ]:
+            setlists, seconds, peak_mib = measure(func, scaled)
+            results.append(
+                {
+                    "benchmark": "flatten",
+                    "implementation": name,
+                    "factor": factor,
+                    "rows": len(setlists),
+                    "seconds": round(seconds, 3),
+                    "peak_mib": round(peak_mib, 1),
+                }
+            )
+            print(results[-1])
+            del setlists
+
+    return pd.DataFrame(results)
+
+
+def benchmark_app_formats(
+    app_setlists: pd.DataFrame, app_albums_songs: pd.DataFrame, repeats: int = 5
+) -> pd.DataFrame:
+    """Compare file size and load time of the app data in CSV and
+    Parquet format.
+
+    Args:
+        app_setlists (DataFrame): output of prepare_setlists()
+        app_albums_songs (DataFrame): output of
+            prepare_albums_songs_played()
+        repeats (int): number of loads per file; the fastest is reported
+
+    Returns:
+        results (DataFrame): file size and load time per file and format
+    """
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app_tables = {
+            "app_setlist_data": app_setlists,
+            "app_albums_songs": app_albums_songs,
+        }
+
+        for path in write_app_data(app_tables, tmp_dir):
+            read = pd.read_csv if path.suffix == ".csv" else pd.read_parquet
+            seconds = min(measure(read, path)[1] for _ in range(repeats))
+
+            results.append(
+                {
+                    "benchmark": "app_formats",
+                    "implementation": path.suffix.lstrip("."),
+                    "file": path.stem,
+                    "mib": round(os.path.getsize(path) / 1024**2, 3),
+                    "seconds": round(seconds, 4),
+                }
+            )
+            print(results[-1])
+
+    return pd.DataFrame(results)
+
+
+def benchmark_stages(
+    missing_tour_data: pd.DataFrame,
+    factors: Tuple[int, ...] = (1, 10, 100),
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Time and memory-profile each transform stage (see
+    run_data_pipeline.TRANSFORM_STAGES) on synthetic artist data at
+    different multiples of the snapshot size.
+
+    Args:
+        missing_tour_data (DataFrame): tour names for setlists where
+            they are missing
+        factors (tuple): scaling factors of the number of shows
+        seed (int): random seed of the synthetic data
+
+    Returns:
+        results (DataFrame): input and output rows, wall time and peak
+            memory per stage and scaling factor
+    """
+    results = []
+
+    for factor in factors:
+        values = generate_artist_data(factor, seed=seed)
+        values["missing_tour_data"] = missing_tour_data
+
+        # The stages are listed in topological order
+        for stage in TRANSFORM_STAGES:
+            args = [values[name] for name in stage.inputs]
+            output, seconds, peak_mib = measure(stage.func, *args)
+
+            if stage.outputs:
+                values.update(zip(stage.outputs, output))
+                output = output[0]
+            else:
+                values[stage.name] = output
+
+            results.append(
+                {
+                    "benchmark": "stages",
+                    "implementation": stage.name,
+                    "factor": factor,
+                    "rows": len(args[0]),
+                    "rows_out": len(output),
+                    "seconds": round(seconds, 3),
+                    "peak_mib": round(peak_mib, 1),
+                }
+            )
+            print(results[-1])
+
+        del values
+
+    return pd.DataFrame(results)
+
+
+def save_results(results: pd.DataFrame, out_path: Union[str, Path]) -> Path:
+    """Save benchmark results for comparison across commits: the results
+    are written to <commit>.csv and appended to history.csv, both with
+    the commit hash and a timestamp.
+
+    Args:
+        results (DataFrame): benchmark results
+        out_path (str or Path): output directory
+
+    Returns:
+        path (Path): path of the results file of the current commit
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+
+    results = results.assign(
+        commit=commit, timestamp=pd.Timestamp.now().isoformat(timespec="seconds")
+    )
+
+    os.makedirs(out_path, exist_ok=True)
+    path = Path(out_path) / f"{commit}.csv"
+    results.to_csv(path, index=False)
+
+    history_path = Path(out_path) / "history.csv"
+    if history_path.exists():
+        results = pd.concat([pd.read_csv(history_path), results], ignore_index=True)
+    results.to_csv(history_path, index=False)
+
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from clean_album_data import clean_album_data
+    from clean_setlists_data import clean_setlists_data
+    from join_setlists_albums import build_song_dimension, join_setlists_albums
+    from harvest import raw_data_path
+    from run_data_pipeline import load_raw_data
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--factors",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100],
+        help="scaling factors of the raw setlists data",
+    )
+    args = parser.parse_args()
+    factors = tuple(args.factors)
+
+    in_path = Path(Path.cwd() / "data_prep" / "data")
+    missing_tour_data = pd.read_csv(Path(in_path / "missing_tour_data.csv"))
+    setlists_path = Path(in_path / "json_raw" / "setlist_fm_setlists.json")
+
+    # The setlists snapshot, or synthetic setlists if it is not available
+    if raw_data_path(setlists_path).exists():
+        setlists = load_raw_data(setlists_path)
+        albums = pd.read_csv(Path(in_path / "csv" / "albums_clean.csv"))
+    else:
+        artist_data = generate_artist_data()
+        setlists = artist_data["setlists"]
+        albums = clean_album_data(artist_data["songs"])
+
+    concerts = join_setlists_albums(
+        clean_setlists_data(setlists, missing_tour_data),
+        build_song_dimension(albums)[0],
+    )
+
+    results = pd.concat(
+        [
+            benchmark_stages(missing_tour_data, factors),
+            benchmark_flatten(setlists, factors),
+            benchmark_concatenate_setlists(concerts, factors),
+            benchmark_app_formats(
+                pd.read_csv(Path(in_path / "csv" / "app_setlist_data.csv")),
+                pd.read_csv(Path(in_path / "csv" / "app_albums_songs.csv")),
+            ),
+        ],
+        ignore_index=True,
+    )
+    print(results.to_string(index=False))
+
+    results_path = save_results(results, Path(in_path / "benchmarks"))
+    print(f"Results saved to {results_path}.")
@@ -1,10 +1,82 @@
-from typing import List, Dict
+import re
+from typing import Dict, List, Optional
 
 import pandas as pd
 
+from musicbrainz import is_studio_album
+
+# Studio albums of releases without release group information (e.g.,
+# data queried with get_songs())
+STUDIO_ALBUMS = [
+    "Iron Maiden",
+    "Killers",
+    "The Number Of The Beast",
+    "Piece of Mind",
+    "Powerslave",
+    "Somewhere in Time",
+    "Seventh Son of a Seventh Son",
+    "No Prayer for the Dying",
+    "Fear of the Dark",
+    "The X Factor",
+    "Virtual XI",
+    "Brave New World",
+    "Dance of Death",
+    "A Matter of Life and Death",
+    "The Final Frontier",
+    "The Book of Souls",
+    "Senjutsu",
+]
+
+# Tracks to delete (bonus material, alternative versions, etc.)
+JUNK_TRACK_TERMS = [
+    "making of",
+    "video",
+    "studio performance",
+    "photo",
+    "5.1",
+    "remaster",
+    "live",
+    "'88",
+]
+
+# Last part is for Japanese
+JUNK_TRACK_PATTERN = re.compile(
+    "|".join(JUNK_TRACK_TERMS) + r"|[\u3040-\u30FF\u4E00-\u9FFF]", re.IGNORECASE
+)
+
+
+def studio_album_name(release: Dict) -> Optional[str]:
+    """Return the album name of a studio album release, or None if the
+    release is not a studio album. Studio albums are identified from the
+    release group metadata (see musicbrainz.is_studio_album()) and named
+    after the release group, so all releases of an album share the same
+    name. Releases without release group information are checked against
+    the STUDIO_ALBUMS titles.
+
+    Args:
+        release (dict): release as returned by the Musicbrainz API
+
+    Returns:
+        album_name (str or None): name of the studio album
+    """
+    release_group = release.get("release-group")
+
+    if release_group is None:
+        title = release.get("title")
+        return title if title in STUDIO_ALBUMS else None
+
+    if not is_studio_album(release_group):
+        return None
+
+    return release_group.get("title") or release.get("title")
+
 
 def clean_album_data(releases: List[Dict]) -> pd.DataFrame:
-    """Normalize the musicbrainz albums/songs data and ....
+    """Normalize the musicbrainz albums/songs data: only the tracks of
+    studio albums are kept, without duplicates and junk tracks (making
+    of, videos, live versions, Japanese bonus tracks, etc.). The filters
+    are applied while the releases are parsed, so the tracks of other
+    releases are never materialized.
 
     Args:
         releases (list): list of all releases fetched from the API
@@ -19,76 +91,36 @@ def clean_album_data(releases: List[Dict]) -> pd.DataFrame:
     ]
 
     columns = {col_name: [] for col_name in column_names}
+    album_songs = set()
 
     for release in releases:
+        album_name = studio_album_name(release)
+        if album_name is None:
+            continue
+
         # Media contains the track information
         for media in release.get("media"):
             # tracks is a list of dicts containing song information
             for track in media.get("tracks"):
-                # Album name is in the top-level dict
-                columns["album_name"].append(release.get("title"))
-                columns["song_position"].append(track.get("position"))
-                columns["song_name"].append(track.get("title"))
-
-    albums = pd.DataFrame(
-        list(
-            zip(
-                columns["album_name"],
-                columns["song_position"],
-                columns["song_name"],
-            )
-        ),
-        columns=["album_name", "song_position", "song_name"],
-    )
+                song_name = track.get("title")
 
-    # Filter on studio albums only
-    studio_albums = [
-        "Iron Maiden",
-        "Killers",
-        "The Number Of The Beast",
-        "Piece of Mind",
-        "Powerslave",
-        "Somewhere in Time",
-        "Seventh Son of a Seventh Son",
-        "No Prayer for the Dying",
-        "Fear of the Dark",
-        "The X Factor",
-        "Virtual XI",
-        "Brave New World",
-        "Dance of Death",
-        "A Matter of Life and Death",
-        "The Final Frontier",
-        "The Book of Souls",
-        "Senjutsu",
-    ]
+                # Skip duplicate songs and junk tracks
+                if (album_name, song_name) in album_songs:
+                    continue
+                album_songs.add((album_name, song_name))
+
+                if song_name is not None and JUNK_TRACK_PATTERN.search(song_name):
+                    continue
+
+                columns["album_name"].append(album_name)
+                columns["song_position"].append(track.get("position"))
+                columns["song_name"].append(song_name)
 
-    # Filter studio albums only
-    albums = albums[albums["album_name"].isin(studio_albums)].reset_index(drop=True)
-    # Drop duplicate song names
-    albums = albums.drop_duplicates(subset=["album_name", "song_name"])
+    albums = pd.DataFrame(columns, columns=column_names)
     albums = albums.sort_values(by=["album_name", "song_position"]).reset_index(
         drop=True
     )
 
-    # Delete some rows
-    to_delete = [
-        "making of",
-        "video",
-        "studio performance",
-        "photo",
-        "5.1",
-        "remaster",
-        "live",
-        "'88",
-    ]
-
-    # Last part is for Japanese
-    delete_pattern = "|".join(to_delete) + r"|[\u3040-\u30FF\u4E00-\u9FFF]"
-
-    albums = albums[
-        ~albums["song_name"].str.contains(delete_pattern, case=False, na=False)
-    ]
-
     # Replace song names in the album df with the way they are written in
     # the setlists df
     song_name_harmonization = {
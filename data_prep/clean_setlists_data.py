@@ -1,74 +1,89 @@
-from typing import List, Dict
+import os
+from pathlib import Path
+from typing import List, Dict, Union
 
 import numpy as np
 import pandas as pd
 
+from flatten_setlists import flatten_setlists
+from harvest import iter_chunks, iter_json_records, raw_data_path
+
+# Compact dtypes of the song-level setlist columns: the concert and
+# location columns repeat for every song of a concert and are stored as
+# categoricals (integer codes plus one copy of each distinct value)
+SETLIST_DTYPES = {
+    "id": "category",
+    "venue": "category",
+    "city": "category",
+    "country": "category",
+    "tour": "category",
+    "song_count": "Int16",
+    "encore": "Int8",
+    "from_tape": "boolean",
+    "cover": "category",
+}
+
+
+def compact_dtypes(setlists: pd.DataFrame, verbose: bool = True) -> pd.DataFrame:
+    """Convert the song-level setlists data to compact dtypes: see
+    SETLIST_DTYPES, dates (dd-mm-yyyy strings) are parsed to datetime64.
+    The memory saving is reported.
+
+    Args:
+        setlists (DataFrame): setlists data with plain string, float and
+            object columns
+        verbose (bool): if False, the memory saving is not reported
+
+    Returns:
+        setlists (DataFrame): the setlists data with compact dtypes
+    """
+    if verbose:
+        memory_before = setlists.memory_usage(deep=True).sum()
+
+    setlists = setlists.astype(
+        {
+            column: dtype
+            for column, dtype in SETLIST_DTYPES.items()
+            if column in setlists.columns
+        }
+    )
+    if "date" in setlists.columns:
+        setlists["date"] = pd.to_datetime(setlists["date"], format="%d-%m-%Y")
+
+    if verbose:
+        memory_after = setlists.memory_usage(deep=True).sum()
+        print(
+            f"Setlists data: {memory_before / 1024**2:.1f} MiB -> "
+            f"{memory_after / 1024**2:.1f} MiB with compact dtypes."
+        )
+
+    return setlists
+
 
 def clean_setlists_data(
-    raw_setlists_data: List[Dict], tour_data_completion_df: pd.DataFrame
+    raw_setlists_data: List[Dict],
+    tour_data_completion_df: pd.DataFrame,
+    verbose: bool = True,
 ) -> pd.DataFrame:
     """Normalize the setlist.fm setlists data and perform some data
-    cleaning operations: normalize the JSON structure, harmonize song
-    names, drop data that is not required.
+    cleaning operations: flatten the JSON structure (see
+    flatten_setlists()), harmonize song names, complete missing tour
+    names. The columns are converted to compact dtypes (see
+    compact_dtypes()).
 
     Args:
         raw_setlists_data (list): the raw setlist.fm setlists data in
             JSON format
         tour_data_completion_df (pd.DataFrame): DataFrame containing
             the tour names for records where they are missing
-    
+        verbose (bool): if False, the memory saving of the compact
+            dtypes is not reported
+
     Returns:
         setlists (pd.DataFrame): DataFrame containing the cleaned and
             harmonized data
     """
-    setlists = pd.json_normalize(raw_setlists_data)
-    setlists = setlists[
-        [
-            "id",
-            "eventDate",
-            "venue.name",
-            "venue.city.name",
-            "venue.city.stateCode",
-            "venue.city.coords.lat",
-            "venue.city.coords.long",
-            "venue.city.country.name",
-            "tour.name",
-            "sets.set",
-        ]
-    ]
-
-    # Step 1: Explode the 'details' column so each row represents an item in the list
-    setlists_exploded = setlists.explode("sets.set", ignore_index=True)
-    # Step 2: Normalize the 'details' column to flatten nested dictionaries
-    setlists_normalized = pd.json_normalize(setlists_exploded["sets.set"])
-    # Step 3: Drop the now-redundant 'details' column from df_exploded
-    setlists_exploded = setlists_exploded.drop(columns=["sets.set"])
-    # Step 4: Combine the exploded DataFrame with the normalized details DataFrame
-    setlists_combined = setlists_exploded.join(setlists_normalized)
-    # Step 5: Further explode the 'song' column to handle the list of song dictionaries
-    setlists_combined = setlists_combined.explode("song", ignore_index=True)
-    # Step 6: Normalize the 'song' column to separate song details into individual columns
-    song_normalized = pd.json_normalize(setlists_combined["song"]).rename(
-        columns={"name": "name_new", "tape": "tape_new"}
-    )
-    # Step 7: Drop the now-redundant 'song' column and join with song details
-    setlists_combined = setlists_combined.drop(columns=["song"]).join(song_normalized)
-
-    setlists = setlists_combined.drop(
-        columns=[
-            "name",
-            "cover.mbid",
-            "cover.sortName",
-            "cover.disambiguation",
-            "cover.url",
-            "info",
-            "with.mbid",
-            "with.name",
-            "with.sortName",
-            "with.disambiguation",
-            "with.url",
-        ],
-    )
+    setlists = flatten_setlists(raw_setlists_data)
 
     # Replace song names
     replacement_mapping_dict = {
@@ -112,10 +127,14 @@ def clean_setlists_data(
     # Add song count numbers
     setlists["song_count"] = setlists.groupby("id").cumcount() + 1
 
-    # Concatenate city and state
+    # Concatenate city and state. Without any US show (e.g., in an update
+    # or a chunk) the state codes are all missing and not typed as strings
+    state_codes = setlists["venue.city.stateCode"].astype(
+        setlists["venue.city.name"].dtype
+    )
     setlists["venue.city.name"] = np.where(
         setlists["venue.city.country.name"] == "United States",
-        setlists["venue.city.name"] + ", " + setlists["venue.city.stateCode"],
+        setlists["venue.city.name"] + ", " + state_codes,
         setlists["venue.city.name"],
     )
 
@@ -131,10 +150,10 @@ def clean_setlists_data(
             "venue.city.coords.long": "longitude",
             "venue.city.country.name": "country",
             "tour.name": "tour",
-            "encore,name_new": "encore",
-            "tape_new": "from_tape",
-            "name_new": "song_title",
-            "cover.name": "cover",
+            "sets.set.encore": "encore",
+            "sets.set.song.tape": "from_tape",
+            "sets.set.song.name": "song_title",
+            "sets.set.song.cover.name": "cover",
         }
     )
 
@@ -155,31 +174,72 @@ def clean_setlists_data(
         "cover",
     ]
 
-    setlists = setlists[new_column_order]
+    setlists = compact_dtypes(setlists[new_column_order], verbose=verbose)
 
     return setlists
 
 
-if __name__ == "__main__":
-    import json
-    import os
-    from pathlib import Path
+def clean_setlists_chunked(
+    raw_setlists_path: Union[str, Path],
+    tour_data_completion_df: pd.DataFrame,
+    out_path: Union[str, Path],
+    chunk_size: int = 1000,
+) -> int:
+    """Streaming version of clean_setlists_data() for raw setlists data
+    that does not fit into memory: the raw JSON (or NDJSON) file is
+    parsed incrementally (see harvest.iter_json_records()), chunks of
+    chunk_size setlists are flattened and cleaned and the result of
+    each chunk is appended to a CSV file. The peak memory is bounded by
+    the chunk size instead of the size of the raw data. Setlists are
+    never split between chunks, so the output is the same as the CSV
+    output of clean_setlists_data().
 
-    in_path = Path(Path.cwd() / "data_prep" / "data")
+    Args:
+        raw_setlists_path (str or Path): path to the raw setlist.fm
+            setlists data (.json or .ndjson)
+        tour_data_completion_df (pd.DataFrame): see
+            clean_setlists_data()
+        out_path (str or Path): path of the CSV output file
+        chunk_size (int): number of setlists per chunk
 
-    # Load raw JSON data
-    in_setlists_file = "setlist_fm_setlists.json"
-    with open(Path(in_path / "json_raw" / in_setlists_file), "r") as setlists_file:
-        setlists = json.load(setlists_file)
+    Returns:
+        rows (int): number of song rows written
+    """
+    os.makedirs(Path(out_path).parent, exist_ok=True)
+    records = iter_json_records(raw_setlists_path)
+    rows = 0
+
+    with open(out_path, "w", encoding="utf-8", newline="") as out_file:
+        for index, chunk in enumerate(iter_chunks(records, chunk_size)):
+            setlists = clean_setlists_data(
+                chunk, tour_data_completion_df, verbose=False
+            )
+            setlists.to_csv(
+                out_file, index=False, header=index == 0, date_format="%d-%m-%Y"
+            )
+            rows += len(setlists)
+
+    print(f"{rows} setlist rows written to {Path(out_path).name}.")
+
+    return rows
+
+
+if __name__ == "__main__":
+    in_path = Path(Path.cwd() / "data_prep" / "data")
 
     # Load the missing tour names
     missing_tour_data_file = "missing_tour_data.csv"
     missing_tour_data = pd.read_csv(Path(in_path / missing_tour_data_file))
 
-    # Run the data cleaning function
-    setlists = clean_setlists_data(setlists, missing_tour_data)
+    # Raw JSON data, or the NDJSON output of a harvest if it is newer
+    in_setlists_file = "setlist_fm_setlists.json"
+    setlists_path = raw_data_path(Path(in_path / "json_raw" / in_setlists_file))
 
-    # Save the clean data to CSV
+    # Stream the raw data through the data cleaning function and save the
+    # clean data to CSV
     out_path = Path(Path.cwd() / "data_prep" / "data" / "csv")
-    os.makedirs(out_path, exist_ok=True)
-    setlists.to_csv(Path(out_path / "setlists_clean.csv"), index=False)
+    clean_setlists_chunked(
+        setlists_path,
+        missing_tour_data,
+        Path(out_path / "setlists_clean.csv"),
+    )
@@ -0,0 +1,285 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE city (
+    city_id INTEGER PRIMARY KEY,
+    name TEXT,
+    country TEXT,
+    latitude REAL,
+    longitude REAL
+);
+
+CREATE TABLE venue (
+    venue_id INTEGER PRIMARY KEY,
+    name TEXT,
+    city_id INTEGER REFERENCES city (city_id)
+);
+
+CREATE TABLE tour (
+    tour_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE
+);
+
+CREATE TABLE album (
+    album_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE
+);
+
+CREATE TABLE song (
+    song_id INTEGER PRIMARY KEY,
+    title TEXT UNIQUE,
+    album_id INTEGER REFERENCES album (album_id)
+);
+
+CREATE TABLE concert (
+    concert_id INTEGER PRIMARY KEY,
+    setlist_fm_id TEXT UNIQUE,
+    date TEXT,
+    venue_id INTEGER REFERENCES venue (venue_id),
+    tour_id INTEGER REFERENCES tour (tour_id)
+);
+
+CREATE TABLE setlist_entry (
+    concert_id INTEGER REFERENCES concert (concert_id),
+    position INTEGER,
+    song_id INTEGER REFERENCES song (song_id),
+    encore INTEGER,
+    from_tape INTEGER,
+    cover TEXT,
+    PRIMARY KEY (concert_id, position)
+);
+"""
+
+# Created after the bulk load, which is faster than updating them per row
+INDEXES = """
+CREATE INDEX idx_concert_date ON concert (date);
+CREATE INDEX idx_concert_tour ON concert (tour_id);
+CREATE INDEX idx_venue_city ON venue (city_id);
+CREATE INDEX idx_city_name ON city (name);
+CREATE INDEX idx_setlist_entry_song ON setlist_entry (song_id);
+"""
+
+
+def _records(df: pd.DataFrame) -> list:
+    """Convert a DataFrame to a list of tuples with None for missing
+    values and Python scalars, as expected by sqlite3.
+    """
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def _statements(script: str) -> list:
+    """Split an SQL script into its statements, so they can be run with
+    execute() inside a transaction (executescript() commits first).
+    """
+    return [statement for statement in script.split(";") if statement.strip()]
+
+
+def _ids(codes) -> pd.Series:
+    """Convert pd.factorize() codes to 1-based ids (missing -> NA)."""
+    return pd.Series(codes + 1, dtype="Int64").mask(codes < 0)
+
+
+def build_concert_db(
+    concerts_df: pd.DataFrame, songs_df: pd.DataFrame, db_path: Union[str, Path]
+) -> sqlite3.Connection:
+    """Create an SQLite db with normalized concert, venue, city, tour,
+    album, song and setlist entry tables from the song-level concerts
+    data. Every entity gets an integer key; date, tour, city and song
+    lookups are indexed. Album songs keep the song_id of the song
+    dimension, as in the concerts data and the song index; other titles
+    (covers, intros, ...) are numbered after the last album song. An
+    existing db at db_path is replaced; all tables are loaded in a
+    single transaction.
+
+    Args:
+        concerts_df (DataFrame): output of join_setlists_albums()
+        songs_df (DataFrame): the song dimension, see
+            join_setlists_albums.build_song_dimension()
+        db_path (str or Path): path of the SQLite db file
+
+    Returns:
+        connection (sqlite3.Connection): connection to the new db
+    """
+    concerts = concerts_df.drop_duplicates(subset=["id", "song_count"]).reset_index(
+        drop=True
+    )
+
+    # Dimension tables: integer keys from the order of first appearance
+    location_columns = ["city", "country", "latitude", "longitude"]
+    city_codes, cities = pd.factorize(
+        pd.MultiIndex.from_frame(concerts[location_columns])
+    )
+    concerts["city_id"] = _ids(city_codes)
+    cities = cities.to_frame(index=False)
+    cities.insert(0, "city_id", range(1, len(cities) + 1))
+
+    venue_codes, venues = pd.factorize(
+        pd.MultiIndex.from_arrays([concerts["venue"], concerts["city_id"]])
+    )
+    concerts["venue_id"] = _ids(venue_codes)
+    venues = venues.to_frame(index=False, name=["name", "city_id"])
+    venues.insert(0, "venue_id", range(1, len(venues) + 1))
+
+    tour_codes, tours = pd.factorize(concerts["tour"])
+    concerts["tour_id"] = _ids(tour_codes)
+
+    # Songs: the album songs of the song dimension, then the other titles
+    album_codes, albums = pd.factorize(songs_df["album_name"])
+    other_titles = concerts["song_id"].isna() & concerts["song_title"].notna()
+    title_codes, titles = pd.factorize(concerts.loc[other_titles, "song_title"])
+    first_title_id = int(songs_df["song_id"].max()) + 1 if len(songs_df) else 0
+
+    concerts["song_id"] = concerts["song_id"].astype("Int64")
+    concerts.loc[other_titles, "song_id"] = first_title_id + title_codes
+    songs = pd.DataFrame(
+        {
+            "song_id": np.concatenate(
+                [
+                    songs_df["song_id"].to_numpy(dtype=np.int64),
+                    first_title_id + np.arange(len(titles)),
+                ]
+            ),
+            "title": np.concatenate(
+                [
+                    songs_df["song_name"].to_numpy(dtype=object),
+                    titles.to_numpy(dtype=object),
+                ]
+            ),
+            "album_id": pd.concat(
+                [_ids(album_codes), pd.Series(pd.NA, index=range(len(titles)))],
+                ignore_index=True,
+            ),
+        }
+    )
+
+    concert_codes, _ = pd.factorize(concerts["id"])
+    concerts["concert_id"] = _ids(concert_codes)
+    concert_rows = concerts.drop_duplicates(subset="concert_id")
+    concert_dates = pd.to_datetime(
+        concert_rows["date"], format="%d-%m-%Y", errors="coerce"
+    ).dt.strftime("%Y-%m-%d")
+
+    setlist_entries = concerts.dropna(subset="song_id")
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    # Transactions are managed explicitly: sqlite3 would otherwise commit
+    # before each CREATE statement
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    connection.execute("PRAGMA foreign_keys = ON")
+
+    # Single transaction (including the DDL): committed on success,
+    # rolled back on error
+    with connection:
+        connection.execute("BEGIN")
+        for statement in _statements(SCHEMA):
+            connection.execute(statement)
+        connection.executemany(
+            "INSERT INTO city VALUES (?, ?, ?, ?, ?)", _records(cities)
+        )
+        connection.executemany("INSERT INTO venue VALUES (?, ?, ?)", _records(venues))
+        connection.executemany(
+            "INSERT INTO tour VALUES (?, ?)", enumerate(tours, start=1)
+        )
+        connection.executemany(
+            "INSERT INTO album VALUES (?, ?)", enumerate(albums, start=1)
+        )
+        connection.executemany("INSERT INTO song VALUES (?, ?, ?)", _records(songs))
+        connection.executemany(
+            "INSERT INTO concert VALUES (?, ?, ?, ?, ?)",
+            _records(
+                pd.DataFrame(
+                    {
+                        "concert_id": concert_rows["concert_id"],
+                        "setlist_fm_id": concert_rows["id"],
+                        "date": concert_dates,
+                        "venue_id": concert_rows["venue_id"],
+                        "tour_id": concert_rows["tour_id"],
+                    }
+                )
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO setlist_entry VALUES (?, ?, ?, ?, ?, ?)",
+            _records(
+                pd.DataFrame(
+                    {
+                        "concert_id": setlist_entries["concert_id"],
+                        "position": setlist_entries["song_count"],
+                        "song_id": setlist_entries["song_id"],
+                        "encore": setlist_entries["encore"].astype("Int64"),
+                        "from_tape": setlist_entries["from_tape"]
+                        .eq(True)
+                        .fillna(False)
+                        .astype(int),
+                        "cover": setlist_entries["cover"],
+                    }
+                )
+            ),
+        )
+        for statement in _statements(INDEXES):
+            connection.execute(statement)
+
+    connection.isolation_level = ""
+    return connection
+
+
+def get_tour_concerts(connection: sqlite3.Connection, tour: str) -> pd.DataFrame:
+    """Query all concerts of a tour.
+
+    Args:
+        connection (sqlite3.Connection): connection to the concert db
+        tour (str): tour name
+
+    Returns:
+        concerts (DataFrame): date, venue, city and country of each
+            concert of the tour, sorted by date
+    """
+    query = """
+        SELECT concert.setlist_fm_id AS id, concert.date, venue.name AS venue,
+            city.name AS city, city.country
+        FROM concert
+        JOIN tour USING (tour_id)
+        JOIN venue USING (venue_id)
+        JOIN city USING (city_id)
+        WHERE tour.name = ?
+        ORDER BY concert.date
+    """
+    return pd.read_sql_query(query, connection, params=(tour,))
+
+
+def get_song_performances(
+    connection: sqlite3.Connection, song_title: str
+) -> pd.DataFrame:
+    """Query every performance of a song.
+
+    Args:
+        connection (sqlite3.Connection): connection to the concert db
+        song_title (str): harmonized song title
+
+    Returns:
+        performances (DataFrame): date, setlist position, venue, city,
+            country and tour of each performance, sorted by date
+    """
+    query = """
+        SELECT concert.setlist_fm_id AS id, concert.date,
+            setlist_entry.position, venue.name AS venue, city.name AS city,
+            city.country, tour.name AS tour
+        FROM song
+        JOIN setlist_entry USING (song_id)
+        JOIN concert USING (concert_id)
+        JOIN venue USING (venue_id)
+        JOIN city USING (city_id)
+        LEFT JOIN tour USING (tour_id)
+        WHERE song.title = ?
+        ORDER BY concert.date
+    """
+    return pd.read_sql_query(query, connection, params=(song_title,))
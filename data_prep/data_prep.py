@@ -1,14 +1,77 @@
+from typing import Dict, Iterable, List
+
 import numpy as np
 import pandas as pd
 
 
+def plain_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the compact dtypes of the cleaned concert data (see
+    clean_setlists_data.compact_dtypes()) back to the formats of the app
+    tables: categoricals become strings and dates dd-mm-yyyy strings.
+
+    Args:
+        df (DataFrame): concert data with compact dtypes
+
+    Returns:
+        df (DataFrame): the data with plain string columns
+    """
+    df = df.copy()
+
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            # Format each distinct date once
+            dates = pd.Categorical(df[column])
+            df[column] = dates.rename_categories(dates.categories.strftime("%d-%m-%Y"))
+
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            values = df[column].array
+            df[column] = values.categories.array.take(values.codes, allow_fill=True)
+
+    return df
+
+
+def concatenate_setlists(concerts: pd.DataFrame) -> pd.DataFrame:
+    """Concatenates the songs of each concert into a single HTML string,
+    with a line break after each song and a header before the first
+    song of each encore. Requires a DataFrame with the columns id,
+    song_title (including the setlist position) and encore.
+
+    Args:
+        concerts (DataFrame): one row per song, in setlist order
+
+    Returns:
+        single_line_setlists (DataFrame): one row per concert with the
+            columns id and song_title (the concatenated setlist)
+    """
+    # Each song is followed by a line break. The first song of each
+    # encore is preceded by the encore header, i.e., the first row of
+    # each (id, encore) combination
+    setlist_lines = concerts["song_title"].fillna("") + "<br>"
+    encore_start = concerts["encore"].notna() & ~concerts.duplicated(
+        subset=["id", "encore"]
+    )
+    encore_headers = (
+        "<b>Encore " + concerts["encore"].astype("Int64").astype(str) + ":</b><br>"
+    )
+    setlist_lines = setlist_lines.mask(encore_start, encore_headers + setlist_lines)
+
+    single_line_setlists = (
+        setlist_lines.groupby(concerts["id"], sort=False)
+        .agg("".join)
+        .rename("song_title")
+        .reset_index()
+    )
+
+    return single_line_setlists
+
+
 def prepare_setlists(concerts_df: pd.DataFrame) -> pd.DataFrame:
     """Prepares the concerts data (i.e., the joined setlist.fm setlists
     and musicbrainz albums data) to provide concatenated setlist
     information for each concert to be used in the Shiny app. Requires
     a DataFrame with the following columns:
     id, date, venue, city, country, latitude, longitude, tour,
-    song_count, song_title, encore, from_tape, cover, album_name
+    song_count, song_title, encore, from_tape, cover, song_id, album_name
 
     Args:
         concerts_df (DataFrame): the cleaned dataframe containing all
@@ -20,20 +83,23 @@ def prepare_setlists(concerts_df: pd.DataFrame) -> pd.DataFrame:
             song, tape, and cover information, and the concatenation of
             all songs into a single string to be used in the Shiny app
     """
-    # Create a copy of the original DataFrame
+    # Create a copy of the original DataFrame. The cover names are
+    # concatenated with the song titles and need the same string dtype,
+    # also if there are no covers (e.g., in a small update)
     concerts = concerts_df.copy(deep=True)
-
-    # Add missing venue information (NA = unknown venue)
-    concerts["venue"] = concerts["venue"].fillna("Unknown Venue")
+    concerts["cover"] = plain_dtypes(concerts[["cover"]])["cover"].astype(
+        concerts["song_title"].dtype
+    )
 
     # Concatenate song title and playback (tape) & cover information
     # Conditions:
     #   - from_tape == True AND cover column contains a value
     #   - from_tape == True
     #   - ONLY cover column contains a value
+    from_tape = concerts["from_tape"].eq(True).fillna(False).to_numpy(dtype=bool)
     condlist = [
-        concerts["from_tape"].eq(True) & concerts["cover"].notna(),
-        concerts["from_tape"].eq(True),
+        from_tape & concerts["cover"].notna(),
+        from_tape,
         concerts["cover"].notna(),
     ]
 
@@ -61,37 +127,8 @@ def prepare_setlists(concerts_df: pd.DataFrame) -> pd.DataFrame:
         concerts["song_count"].astype(str) + ". " + concerts["song_title"].astype(str)
     )
 
-    single_line_setlists = []
-
     # Create a single string for each setlist - determined by the id
-    for id, setlist in concerts.groupby("id"):
-        concatenated_setlist = []
-
-        for index, row in setlist.iterrows():
-            # Convert NAs (= missing song titles) to empty strings
-            song_title = row["song_title"] if pd.notna(row["song_title"]) else ""
-            concatenated_setlist.append(song_title)
-
-            # Add encore information
-            if (pd.notna(row["encore"])) and (
-                f"Encore {int(row["encore"])}:" not in concatenated_setlist
-            ):
-                # pop is required to ensure correct order of encore
-                # list elements
-                first_encore_song = concatenated_setlist.pop()
-                concatenated_setlist.append("<b>")
-                concatenated_setlist.append(f"Encore {int(row["encore"])}:")
-                concatenated_setlist.append("</b>")
-                concatenated_setlist.append("<br>")
-                concatenated_setlist.append(first_encore_song)
-
-            concatenated_setlist.append("<br>")
-
-        # Create single setlist string & create DataFrame from setlists
-        concatenated_setlist_str = "".join(concatenated_setlist)
-        single_line_setlists.append({"id": id, "song_title": concatenated_setlist_str})
-
-    single_line_setlists_df = pd.DataFrame(single_line_setlists)
+    single_line_setlists_df = concatenate_setlists(concerts)
 
     # Delete duplicate rows by ID and insert single string setlists
     concerts = concerts.drop_duplicates(subset="id", keep="first").drop(
@@ -100,8 +137,13 @@ def prepare_setlists(concerts_df: pd.DataFrame) -> pd.DataFrame:
     concerts = concerts.merge(single_line_setlists_df, on="id", how="left")
 
     concerts = concerts.drop(
-        columns=["song_count", "encore", "from_tape", "cover", "album_name"]
+        columns=["song_count", "encore", "from_tape", "cover", "album_name", "song_id"]
     )
+    concerts = plain_dtypes(concerts)
+
+    # Add missing venue information (NA = unknown venue)
+    concerts["venue"] = concerts["venue"].fillna("Unknown Venue")
+
     concerts = concerts.rename(columns={"song_title": "setlist"})
 
     return concerts
@@ -119,9 +161,7 @@ def prepare_albums_songs_played(concerts_df: pd.DataFrame) -> pd.DataFrame:
         albums_total (DataFrame): a DataFrame containing tour and album
             data for all concerts
     """
-    albums_songs_played = concerts_df.copy(deep=True)
-
-    albums_songs_played = albums_songs_played.drop(
+    albums_songs_played = concerts_df.drop(
         columns=[
             "venue",
             "city",
@@ -132,13 +172,422 @@ def prepare_albums_songs_played(concerts_df: pd.DataFrame) -> pd.DataFrame:
             "encore",
             "from_tape",
             "cover",
+            "song_id",
         ]
     )
 
     # Drop all rows that don't have an album (covers, playbacks, etc.)
     albums_songs_played = albums_songs_played.dropna(subset="album_name")
 
-    return albums_songs_played
+    return plain_dtypes(albums_songs_played)
+
+
+def count_plays(albums_songs_played: pd.DataFrame) -> pd.DataFrame:
+    """Counts the plays of each album and song per tour and for all
+    tours combined ("All Tours"). The counts are kept with the app data,
+    so incremental updates only have to count the plays of the changed
+    concerts (see update_app_tables()).
+
+    Args:
+        albums_songs_played (DataFrame): album songs played with the
+            columns tour, album_name and song_title
+
+    Returns:
+        play_counts (DataFrame): one row per tour, category ("albums"
+            or "songs") and album or song name with the number of plays
+            (n), sorted by tour, category and name
+    """
+    albums_songs_all_tours = pd.concat(
+        [albums_songs_played.assign(tour="All Tours"), albums_songs_played],
+        ignore_index=True,
+    )
+    play_counts = []
+
+    for category, column in [("albums", "album_name"), ("songs", "song_title")]:
+        plays = (
+            albums_songs_all_tours.groupby(["tour", column])
+            .size()
+            .rename("n")
+            .reset_index()
+            .rename(columns={column: "name"})
+        )
+        plays.insert(1, "category", category)
+        play_counts.append(plays)
+
+    return (
+        pd.concat(play_counts, ignore_index=True)
+        .sort_values(by=["tour", "category", "name"])
+        .reset_index(drop=True)
+    )
+
+
+def rank_plays(play_counts: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
+    """Ranks the play counts of each tour and category and keeps the
+    top_n ranks. As in dplyr::top_n(), all entries tied with the n-th
+    entry are kept.
+
+    Args:
+        play_counts (DataFrame): output of count_plays()
+        top_n (int): number of top ranks to keep per tour
+
+    Returns:
+        top_albums_songs (DataFrame): the play counts with their rank,
+            sorted by tour, category, rank and name
+    """
+    plays = play_counts.assign(
+        rank=play_counts.groupby(["tour", "category"])["n"]
+        .rank(method="min", ascending=False)
+        .astype(int)
+    )
+
+    return (
+        plays[plays["rank"] <= top_n]
+        .sort_values(by=["tour", "category", "rank", "name"])
+        .reset_index(drop=True)
+    )
+
+
+def prepare_top_albums_songs(
+    play_counts: pd.DataFrame, top_n: int = 10
+) -> pd.DataFrame:
+    """Creates a lookup table of the most played albums and songs for
+    each tour and for all tours combined ("All Tours"), so the app can
+    select the statistics of a tour without counting the plays itself
+    (see rank_plays()).
+
+    Args:
+        play_counts (DataFrame): output of count_plays()
+        top_n (int): number of top ranks to keep per tour
+
+    Returns:
+        top_albums_songs (DataFrame): one row per tour, category
+            ("albums" or "songs") and album or song name with the number
+            of plays (n) and the rank, sorted by tour, category and rank
+    """
+    return rank_plays(play_counts, top_n)
+
+
+def prepare_song_titles(concerts_df: pd.DataFrame) -> pd.DataFrame:
+    """Lists the distinct song titles of the setlists, including covers
+    and other songs that are not on an album. Incremental updates use
+    them as the known spelling of the titles (see
+    harmonize_songs.harmonize_song_titles()).
+
+    Args:
+        concerts_df (DataFrame): concerts data with a song_title column
+
+    Returns:
+        song_titles (DataFrame): the sorted distinct song titles
+    """
+    return (
+        plain_dtypes(concerts_df[["song_title"]])
+        .dropna()
+        .drop_duplicates()
+        .sort_values(by="song_title")
+        .reset_index(drop=True)
+    )
+
+
+def prepare_map_popups(app_setlists: pd.DataFrame) -> pd.DataFrame:
+    """Creates the map marker data for the Shiny app: one row per tour
+    and city (including "All Tours") with the number of concerts and
+    the HTML popup text, so the app only has to select the rows of the
+    selected tour. The popup text is identical to the text built by the
+    app: the "All Tours" popups list the date and tour of each concert,
+    the tour popups list date, venue and setlist of each concert.
+
+    Args:
+        app_setlists (DataFrame): output of prepare_setlists()
+
+    Returns:
+        map_popups (DataFrame): one row per tour and city with the
+            columns tour, city, country, latitude, longitude, concerts
+            and popup_text
+    """
+    location_columns = ["city", "country", "latitude", "longitude"]
+
+    # R's paste0() renders missing values as "NA"
+    def as_text(column: str) -> pd.Series:
+        return (
+            app_setlists[column]
+            .astype(object)
+            .where(app_setlists[column].notna(), "NA")
+            .astype(str)
+        )
+
+    concerts = app_setlists[["tour"] + location_columns].assign(
+        concert_all_tours=as_text("date") + ": " + as_text("tour"),
+        concert_tour=(
+            "<center>"
+            + as_text("date")
+            + "<br>"
+            + as_text("venue")
+            + "</center>"
+            + "<br><b>Setlist:</b><br>"
+            + as_text("setlist").str.replace("Encore 1", "Encore", n=1, regex=False)
+        ),
+    )
+
+    all_tours = (
+        concerts.groupby(location_columns, sort=False, dropna=False)
+        .agg(
+            concerts=("concert_all_tours", "count"),
+            concert_list=("concert_all_tours", "<br>".join),
+        )
+        .reset_index()
+        .assign(tour="All Tours")
+    )
+    all_tours["popup_text"] = (
+        "<center><font size = 2>All concerts played in</font><br>"
+        + "<font size = 3><b>"
+        + all_tours["city"].fillna("NA")
+        + ", "
+        + all_tours["country"].fillna("NA")
+        + "</b></font></center>"
+        + "<div class='custom-popup'><br><font size = 2>"
+        + all_tours["concert_list"]
+        + "</font>"
+    )
+
+    tours = (
+        concerts.groupby(["tour"] + location_columns, sort=False, dropna=False)
+        .agg(
+            concerts=("concert_tour", "count"),
+            concert_details=("concert_tour", "<br><br>".join),
+        )
+        .reset_index()
+    )
+    tours["popup_text"] = (
+        "<center><font size = 3><b>"
+        + tours["city"].fillna("NA")
+        + ", "
+        + tours["country"].fillna("NA")
+        + "</b></font><br></center>"
+        + "<div class='custom-popup'><font size = 2>"
+        + tours["concert_details"]
+        + "</font>"
+    )
+
+    output_columns = ["tour"] + location_columns + ["concerts", "popup_text"]
+    map_popups = pd.concat(
+        [all_tours[output_columns], tours[output_columns]], ignore_index=True
+    )
+
+    return map_popups
+
+
+def insert_map_popups(
+    map_popups: pd.DataFrame,
+    new_popups: pd.DataFrame,
+    app_setlists: pd.DataFrame,
+    columns: List[str],
+    rows: np.ndarray,
+) -> pd.DataFrame:
+    """Inserts recomputed map popups into the kept popups, in the order
+    of prepare_map_popups(): the order in which their key columns first
+    appear in the setlists. The kept popups are still in that order,
+    since none of their concerts changed, so only the setlists up to the
+    first concert of the last new popup are searched; the kept popups
+    after it are appended as they are.
+
+    Args:
+        map_popups (DataFrame): the kept popups, in order
+        new_popups (DataFrame): the recomputed popups
+        app_setlists (DataFrame): output of prepare_setlists()
+        columns (list): key columns of the popups
+        rows (np.ndarray): positions of the setlists from which the new
+            popups were prepared
+
+    Returns:
+        map_popups (DataFrame): the ordered popups
+    """
+    first_rows = app_setlists[columns].iloc[rows].reset_index(drop=True)
+    first_rows = first_rows.drop_duplicates()
+    end = rows[first_rows.index.max()] + 1 if len(first_rows) else 0
+    head_keys = app_setlists[columns].iloc[:end].drop_duplicates()
+
+    # Merging preserves the order of the left keys
+    head = head_keys.merge(
+        pd.concat([new_popups, map_popups], ignore_index=True), on=columns
+    )[map_popups.columns]
+    tail = map_popups[
+        ~pd.MultiIndex.from_frame(map_popups[columns]).isin(
+            pd.MultiIndex.from_frame(head_keys)
+        )
+    ]
+
+    return pd.concat([head, tail], ignore_index=True)
+
+
+def upsert_rows(
+    existing: pd.DataFrame, updates: pd.DataFrame, ids: Iterable, key: str = "id"
+) -> pd.DataFrame:
+    """Replaces the rows of the given ids in an app table with the
+    updated rows. The updated rows of an id take the position of its
+    first existing row; rows of new ids are inserted at the top (the
+    newest concerts come first, as in the setlist.fm data).
+
+    Args:
+        existing (DataFrame): the existing app table
+        updates (DataFrame): the new rows of the updated ids
+        ids (iterable): all updated ids; existing rows of these ids are
+            removed even if there are no updated rows for them
+        key (str): name of the id column
+
+    Returns:
+        table (DataFrame): the updated app table
+    """
+    replaced = existing[key].isin(ids).to_numpy()
+    replaced_positions = np.flatnonzero(replaced)
+
+    # Position of the first replaced row of each id (-1 = new id)
+    first_positions = (
+        pd.Series(replaced_positions, index=existing[key].to_numpy()[replaced])
+        .groupby(level=0, sort=False)
+        .min()
+    )
+    update_positions = updates[key].map(first_positions).fillna(-1).to_numpy()
+
+    order = np.argsort(
+        np.concatenate([np.flatnonzero(~replaced), update_positions]), kind="stable"
+    )
+    table = pd.concat([existing[~replaced], updates], ignore_index=True)
+
+    return table.take(order).reset_index(drop=True)
+
+
+def update_app_tables(
+    app_tables: Dict[str, pd.DataFrame], delta_concerts: pd.DataFrame, top_n: int = 10
+) -> Dict[str, pd.DataFrame]:
+    """Updates the app tables with new or changed concerts instead of
+    preparing them from the whole concert history: the setlist strings
+    and album song rows are only prepared for the changed concerts and
+    upserted (see upsert_rows()). The plays of the changed concerts,
+    before and after the change, are subtracted from and added to the
+    play counts, and the top albums/songs are ranked again for their
+    tours and "All Tours". The map popups are recomputed for the tours
+    (and map locations) of the changed concerts and inserted in order
+    (see insert_map_popups()); the rows of all other tours are kept.
+
+    Args:
+        app_tables (dict): the existing app DataFrames keyed by file
+            name, including the play_counts and song_titles tables (see
+            run_data_pipeline.transform_data())
+        delta_concerts (DataFrame): song-level concerts data (output of
+            join_setlists_albums()) of the new and changed concerts
+        top_n (int): see prepare_top_albums_songs()
+
+    Returns:
+        app_tables (dict): the updated app DataFrames
+    """
+    location_columns = ["city", "country", "latitude", "longitude"]
+    setlists = app_tables["app_setlist_data"]
+    albums_songs = app_tables["app_albums_songs"]
+    top_albums_songs = app_tables["app_top_albums_songs"]
+    map_popups = app_tables["app_map_popups"]
+    play_counts = app_tables["play_counts"]
+
+    delta_setlists = prepare_setlists(delta_concerts)
+    delta_albums_songs = prepare_albums_songs_played(delta_concerts)
+    ids = delta_setlists["id"]
+
+    # Tours and locations of the changed concerts, before and after
+    changed = pd.concat([setlists[setlists["id"].isin(ids)], delta_setlists])
+    tours = changed["tour"].unique()
+    locations = pd.MultiIndex.from_frame(changed[location_columns].drop_duplicates())
+
+    # Play counts: minus the plays before and plus the plays after the
+    # change
+    key_columns = ["tour", "category", "name"]
+    play_counts = (
+        play_counts.set_index(key_columns)["n"]
+        .add(
+            count_plays(delta_albums_songs).set_index(key_columns)["n"],
+            fill_value=0,
+        )
+        .sub(
+            count_plays(albums_songs[albums_songs["id"].isin(ids)]).set_index(
+                key_columns
+            )["n"],
+            fill_value=0,
+        )
+        .astype(int)
+    )
+    play_counts = (
+        play_counts[play_counts > 0]
+        .reset_index()
+        .sort_values(by=key_columns)
+        .reset_index(drop=True)
+    )
+
+    setlists = upsert_rows(setlists, delta_setlists, ids)
+    albums_songs = upsert_rows(albums_songs, delta_albums_songs, ids)
+
+    # Top albums/songs: only the affected tours and "All Tours" are
+    # ranked again
+    ranked_tours = play_counts["tour"].isin([*tours, "All Tours"])
+    top_albums_songs = (
+        pd.concat(
+            [
+                top_albums_songs[~top_albums_songs["tour"].isin([*tours, "All Tours"])],
+                rank_plays(play_counts[ranked_tours], top_n),
+            ],
+            ignore_index=True,
+        )
+        .sort_values(by=["tour", "category", "rank", "name"])
+        .reset_index(drop=True)
+    )
+
+    # Map popups: the affected tours and the "All Tours" popups of the
+    # affected locations
+    all_tours = map_popups["tour"] == "All Tours"
+    tour_rows = np.flatnonzero(setlists["tour"].isin(tours))
+    location_rows = np.flatnonzero(
+        pd.MultiIndex.from_frame(setlists[location_columns]).isin(locations)
+    )
+    tour_popups = prepare_map_popups(setlists.take(tour_rows))
+    location_popups = prepare_map_popups(setlists.take(location_rows))
+    map_popups = pd.concat(
+        [
+            insert_map_popups(
+                map_popups[
+                    all_tours
+                    & ~pd.MultiIndex.from_frame(map_popups[location_columns]).isin(
+                        locations
+                    )
+                ],
+                location_popups[location_popups["tour"] == "All Tours"],
+                setlists,
+                location_columns,
+                location_rows,
+            ),
+            insert_map_popups(
+                map_popups[~all_tours & ~map_popups["tour"].isin(tours)],
+                tour_popups[tour_popups["tour"] != "All Tours"],
+                setlists,
+                ["tour"] + location_columns,
+                tour_rows,
+            ),
+        ],
+        ignore_index=True,
+    )
+
+    # New spellings of the changed concerts are known from now on
+    song_titles = prepare_song_titles(
+        pd.concat(
+            [app_tables["song_titles"], plain_dtypes(delta_concerts[["song_title"]])]
+        )
+    )
+
+    return {
+        **app_tables,
+        "app_setlist_data": setlists,
+        "app_albums_songs": albums_songs,
+        "app_top_albums_songs": top_albums_songs,
+        "app_map_popups": map_popups,
+        "play_counts": play_counts,
+        "song_titles": song_titles,
+    }
 
 
 if __name__ == "__main__":
@@ -151,7 +600,15 @@ if __name__ == "__main__":
     setlists = prepare_setlists(concerts)
     setlists.to_csv(Path(path / "app_setlist_data.csv"), index=False, encoding="utf-8")
 
+    map_popups = prepare_map_popups(setlists)
+    map_popups.to_csv(Path(path / "app_map_popups.csv"), index=False, encoding="utf-8")
+
     albums_songs_total = prepare_albums_songs_played(concerts)
     albums_songs_total.to_csv(
         Path(path / "app_albums_songs.csv"), index=False, encoding="utf-8"
     )
+
+    top_albums_songs = prepare_top_albums_songs(count_plays(albums_songs_total))
+    top_albums_songs.to_csv(
+        Path(path / "app_top_albums_songs.csv"), index=False, encoding="utf-8"
+    )
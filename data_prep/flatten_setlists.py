@@ -0,0 +1,111 @@
+from array import array
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# Setlist-level output columns and their paths in the raw setlist dicts
+SETLIST_COLUMNS = {
+    "id": ("id",),
+    "eventDate": ("eventDate",),
+    "venue.name": ("venue", "name"),
+    "venue.city.name": ("venue", "city", "name"),
+    "venue.city.stateCode": ("venue", "city", "stateCode"),
+    "venue.city.country.name": ("venue", "city", "country", "name"),
+    "tour.name": ("tour", "name"),
+}
+
+
+def _get_path(record: Dict, path: tuple):
+    """Return the value at a path of keys in nested dicts, or None if
+    any key along the path is missing.
+    """
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+
+    return record
+
+
+def flatten_setlists(raw_setlists_data: Iterable[Dict]) -> pd.DataFrame:
+    """Flatten the raw setlist.fm setlists into one row per song in a
+    single pass over the data. Only the columns required downstream are
+    extracted: the setlist-level columns are stored once per setlist
+    and repeated for each of its songs, the song-level columns are
+    filled into typed buffers. Setlists without sets and sets without
+    songs are kept as a single row with missing song information.
+
+    Args:
+        raw_setlists_data (iterable): the raw setlist.fm setlists data
+            in JSON format
+
+    Returns:
+        setlists (pd.DataFrame): one row per song with the columns id,
+            eventDate, venue.name, venue.city.name, venue.city.stateCode,
+            venue.city.coords.lat, venue.city.coords.long,
+            venue.city.country.name, tour.name, sets.set.encore,
+            sets.set.song.name, sets.set.song.tape and
+            sets.set.song.cover.name
+    """
+    setlist_values = {column: [] for column in SETLIST_COLUMNS}
+    latitudes = array("d")
+    longitudes = array("d")
+    songs_per_setlist = array("q")
+
+    encores = array("d")
+    song_names = []
+    tapes = []
+    covers = []
+
+    for setlist in raw_setlists_data:
+        for column, path in SETLIST_COLUMNS.items():
+            setlist_values[column].append(_get_path(setlist, path))
+
+        latitude = _get_path(setlist, ("venue", "city", "coords", "lat"))
+        longitude = _get_path(setlist, ("venue", "city", "coords", "long"))
+        latitudes.append(np.nan if latitude is None else latitude)
+        longitudes.append(np.nan if longitude is None else longitude)
+
+        song_count = 0
+
+        # Missing sets or songs still produce one (empty) row
+        for song_set in _get_path(setlist, ("sets", "set")) or [{}]:
+            encore = song_set.get("encore")
+            encore = np.nan if encore is None else encore
+
+            for song in song_set.get("song") or [{}]:
+                encores.append(encore)
+                song_names.append(song.get("name"))
+                tapes.append(song.get("tape", np.nan))
+                covers.append(_get_path(song, ("cover", "name")))
+                song_count += 1
+
+        songs_per_setlist.append(song_count)
+
+    repeats = np.array(songs_per_setlist, dtype=np.int64)
+
+    def repeat(values) -> pd.Series:
+        return pd.Series(values).repeat(repeats).reset_index(drop=True)
+
+    setlists = pd.DataFrame(
+        {
+            "id": repeat(setlist_values["id"]),
+            "eventDate": repeat(setlist_values["eventDate"]),
+            "venue.name": repeat(setlist_values["venue.name"]),
+            "venue.city.name": repeat(setlist_values["venue.city.name"]),
+            "venue.city.stateCode": repeat(setlist_values["venue.city.stateCode"]),
+            "venue.city.coords.lat": repeat(np.array(latitudes)),
+            "venue.city.coords.long": repeat(np.array(longitudes)),
+            "venue.city.country.name": repeat(
+                setlist_values["venue.city.country.name"]
+            ),
+            "tour.name": repeat(setlist_values["tour.name"]),
+            "sets.set.encore": np.array(encores),
+            "sets.set.song.name": pd.Series(song_names),
+            "sets.set.song.tape": pd.Series(tapes, dtype=object),
+            "sets.set.song.cover.name": pd.Series(covers),
+        }
+    )
+
+    return setlists
@@ -0,0 +1,228 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Unicode quotes are folded to ASCII, ellipses by NFKC normalization
+QUOTES = str.maketrans({"‘": "'", "’": "'", "‚": "'", "“": '"', "”": '"', "„": '"'})
+
+# "Intro - ...", "Intro: ...", "Outro – ..." prefixes of setlist titles
+PREFIX_PATTERN = re.compile(r"^(?:intro|outro)\s*[-:–—]\s*", re.IGNORECASE)
+
+
+def fold_title(title: str) -> str:
+    """Fold a song title to its matching key: Unicode quotes and ellipses
+    are normalized, "Intro -" style prefixes removed, the title is
+    case-folded and punctuation is dropped.
+
+    Args:
+        title (str): song title
+
+    Returns:
+        key (str): the folded title, e.g., "Churchill’s Speech" and
+            "Intro - Churchill's Speech" both fold to "churchills speech"
+    """
+    title = unicodedata.normalize("NFKC", title).translate(QUOTES)
+    title = PREFIX_PATTERN.sub("", title.strip()).casefold()
+    title = re.sub(r"['\"]", "", title)
+    title = re.sub(r"[^\w\s]", " ", title)
+
+    return " ".join(title.split())
+
+
+def trigrams(key: str) -> Set[str]:
+    """Character trigrams of a folded title, padded with spaces so that
+    short words and word boundaries are represented as well.
+    """
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from character trigrams to catalogue titles. A
+    query only scores the titles that share at least one trigram with
+    it, instead of comparing it with the whole catalogue.
+
+    Args:
+        keys (iterable): folded catalogue titles
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys: List[str] = list(keys)
+        postings = defaultdict(list)
+        sizes = []
+
+        for i, key in enumerate(self.keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+
+        self._sizes = np.array(sizes, dtype=np.int64)
+        self._postings = {
+            gram: np.array(ids, dtype=np.int64) for gram, ids in postings.items()
+        }
+
+    def best_match(self, key: str) -> Tuple[Optional[str], float]:
+        """Find the catalogue title most similar to a folded title.
+
+        Args:
+            key (str): folded title
+
+        Returns:
+            match (str or None): best matching catalogue title
+            similarity (float): Dice coefficient of the trigram sets
+                (0 to 1)
+        """
+        grams = trigrams(key)
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+
+        if not postings:
+            return None, 0.0
+
+        # Number of shared trigrams per catalogue title
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        similarities = 2 * shared / (len(grams) + self._sizes)
+        best = int(np.argmax(similarities))
+
+        return self.keys[best], float(similarities[best])
+
+
+def harmonize_song_titles(
+    setlists_df: pd.DataFrame,
+    albums_df: pd.DataFrame,
+    min_similarity: float = 0.75,
+    known_titles: Optional[Iterable[str]] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Harmonize the song titles of the setlists and album songs.
+
+    Setlist titles are folded (see fold_title()) and matched with the
+    folded album song names; titles without an exact folded match are
+    matched through a trigram index of the album catalogue if their
+    similarity is at least min_similarity. All titles matched to the
+    same album song, as well as unmatched setlist titles with the same
+    folded key, are replaced with the most played setlist spelling. The
+    album song names are renamed to that spelling as well. Known titles
+    (e.g., the titles of earlier runs) take precedence, so an update
+    with a few new setlists keeps their spelling. Covers and songs
+    played from tape are only matched by their folded title: a cover
+    such as "I Got the Fire" would otherwise be matched to a similar
+    album song ("I’ve Got the Fire").
+
+    Args:
+        setlists_df (DataFrame): cleaned setlists data (song_title,
+            cover and from_tape)
+        albums_df (DataFrame): cleaned album songs data (song_name)
+        min_similarity (float): minimum trigram similarity of a fuzzy
+            match
+        known_titles (optional, iterable): titles that are used as the
+            canonical spelling of their folded key
+
+    Returns:
+        setlists (DataFrame): setlists data with harmonized song titles
+        albums (DataFrame): album songs data with harmonized song names
+        mapping (DataFrame): one row per replaced title for review with
+            the columns source ("setlists" or "albums"), title,
+            harmonized_title, method ("folded" or "fuzzy"), similarity
+            and plays
+    """
+    # Distinct setlist titles, most played first
+    plays = setlists_df["song_title"].value_counts()
+
+    # Titles played as a cover or from tape are not fuzzy matched
+    not_fuzzy = set(
+        setlists_df.loc[
+            setlists_df["cover"].notna()
+            | setlists_df["from_tape"].eq(True).fillna(False).to_numpy(dtype=bool),
+            "song_title",
+        ]
+    )
+
+    album_keys = defaultdict(list)
+    for song_name in albums_df["song_name"].dropna().unique():
+        album_keys[fold_title(song_name)].append(song_name)
+
+    index = TrigramIndex(album_keys)
+
+    # Match each setlist title to a group: ("album", key) or ("setlist", key)
+    matches = {}
+    for title in plays.index:
+        key = fold_title(title)
+
+        if key in album_keys:
+            matches[title] = (("album", key), "folded", 1.0)
+            continue
+
+        if title in not_fuzzy:
+            matches[title] = (("setlist", key), "folded", 1.0)
+            continue
+
+        match, similarity = index.best_match(key)
+        if match is not None and similarity >= min_similarity:
+            matches[title] = (("album", match), "fuzzy", round(similarity, 3))
+        else:
+            matches[title] = (("setlist", key), "folded", 1.0)
+
+    # A known title or else the most played setlist title of a group is
+    # its canonical spelling. Fuzzy matches never are: without a folded
+    # match the album spelling is used
+    canonical = {}
+    for title in known_titles if known_titles is not None else []:
+        key = fold_title(title)
+        canonical.setdefault(("album" if key in album_keys else "setlist", key), title)
+    for title, (group, method, _) in matches.items():
+        if method == "folded":
+            canonical.setdefault(group, title)
+    for group, _, _ in matches.values():
+        if group not in canonical:
+            canonical[group] = album_keys[group[1]][0]
+
+    mapping = []
+    for title, (group, method, similarity) in matches.items():
+        if canonical[group] != title:
+            mapping.append(
+                ("setlists", title, canonical[group], method, similarity, plays[title])
+            )
+
+    for (source, key), harmonized_title in canonical.items():
+        if source == "album":
+            for song_name in album_keys[key]:
+                if song_name != harmonized_title:
+                    mapping.append(
+                        ("albums", song_name, harmonized_title, "folded", 1.0, 0)
+                    )
+
+    mapping = pd.DataFrame(
+        mapping,
+        columns=[
+            "source",
+            "title",
+            "harmonized_title",
+            "method",
+            "similarity",
+            "plays",
+        ],
+    )
+
+    setlists = setlists_df.copy()
+    albums = albums_df.copy()
+
+    for source, df, column in [
+        ("setlists", setlists, "song_title"),
+        ("albums", albums, "song_name"),
+    ]:
+        replacements = mapping[mapping["source"] == source]
+        df[column] = df[column].replace(
+            dict(zip(replacements["title"], replacements["harmonized_title"]))
+        )
+
+    if len(mapping) > 0:
+        print(
+            f"{len(mapping)} song titles harmonized "
+            f"({(mapping['method'] == 'fuzzy').sum()} fuzzy matches)."
+        )
+
+    return setlists, albums, mapping
@@ -0,0 +1,228 @@
+import itertools
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Union
+
+
+def iter_ndjson(path: Union[str, Path]) -> Iterator[dict]:
+    """Read an NDJSON file one record at a time.
+
+    Args:
+        path (str or Path): path to the NDJSON file
+
+    Yields:
+        record (dict): the decoded JSON record of each non-empty line
+    """
+    with open(path, "r", encoding="utf-8") as ndjson_file:
+        for line in ndjson_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(path: Union[str, Path], buffer_size: int = 1 << 20) -> Iterator:
+    """Read the elements of a JSON file containing a top-level array one
+    at a time. The file is read in blocks of buffer_size characters and
+    each element is decoded with json.JSONDecoder.raw_decode() as soon
+    as it is complete, so the whole file is never held in memory.
+
+    Args:
+        path (str or Path): path to the JSON file
+        buffer_size (int): number of characters read at a time
+
+    Yields:
+        element: the decoded JSON value of each array element
+    """
+    decoder = json.JSONDecoder()
+    whitespace = json.decoder.WHITESPACE
+
+    with open(path, "r", encoding="utf-8") as json_file:
+        buffer = ""
+        position = 0
+        eof = False
+        in_array = False
+
+        while True:
+            position = whitespace.match(buffer, position).end()
+
+            # Refill the buffer if the next token may be incomplete
+            if position == len(buffer) and not eof:
+                block = json_file.read(buffer_size)
+                buffer, position, eof = buffer[position:] + block, 0, not block
+                continue
+
+            if not in_array:
+                if not buffer.startswith("[", position):
+                    raise ValueError(f"{path} does not contain a JSON array.")
+                in_array = True
+                position += 1
+                continue
+
+            # Empty array
+            if buffer.startswith("]", position):
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                delimiter = whitespace.match(buffer, end).end()
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                delimiter = len(buffer)
+
+            # The element is complete once the following "," or "]" is
+            # in the buffer (a number or string may be cut off at the
+            # end of the buffer), otherwise read more and decode it again
+            complete = buffer.startswith((",", "]"), delimiter)
+
+            if not complete and not eof:
+                block = json_file.read(buffer_size)
+                buffer, position, eof = buffer[position:] + block, 0, not block
+                continue
+
+            if not complete:
+                raise ValueError(f"{path} is not a valid JSON array.")
+
+            yield element
+
+            if buffer.startswith("]", delimiter):
+                return
+            position = delimiter + 1
+
+            # Drop the decoded part of the buffer
+            if position > buffer_size:
+                buffer = buffer[position:]
+                position = 0
+
+
+def iter_json_records(path: Union[str, Path]) -> Iterator[dict]:
+    """Stream the records of raw API data: NDJSON files (.ndjson) line
+    by line, JSON files element by element (see iter_json_array()).
+
+    Args:
+        path (str or Path): path to the JSON or NDJSON file
+
+    Yields:
+        record (dict): the decoded records
+    """
+    if Path(path).suffix == ".ndjson":
+        return iter_ndjson(path)
+    return iter_json_array(path)
+
+
+def raw_data_path(json_path: Union[str, Path]) -> Path:
+    """Path of the most recent raw API data: the JSON file (e.g., the
+    setlist store kept up to date by setlist_fm.sync_setlists()) or the
+    NDJSON output of a harvest with the same file name, whichever was
+    written last.
+
+    Args:
+        json_path (str or Path): path to the JSON file
+
+    Returns:
+        path (Path): path to the JSON or NDJSON file (json_path if
+            neither exists)
+    """
+    json_path = Path(json_path)
+    ndjson_path = json_path.with_suffix(".ndjson")
+
+    if not ndjson_path.exists():
+        return json_path
+    if not json_path.exists():
+        return ndjson_path
+
+    if ndjson_path.stat().st_mtime > json_path.stat().st_mtime:
+        return ndjson_path
+    return json_path
+
+
+def iter_chunks(records: Iterable, chunk_size: int) -> Iterator[List]:
+    """Group records into lists of (at most) chunk_size records.
+
+    Args:
+        records (iterable): the records
+        chunk_size (int): number of records per chunk
+
+    Yields:
+        chunk (list): the next chunk of records
+    """
+    records = iter(records)
+
+    while chunk := list(itertools.islice(records, chunk_size)):
+        yield chunk
+
+
+class NdjsonHarvest:
+    """Append-only NDJSON output of an API harvest with a checkpoint
+    file next to it. The checkpoint records the state of the harvest
+    (e.g., the last completed page) together with the size of the
+    NDJSON file at that point, so records written after the last
+    checkpoint (e.g., before a crash) are discarded on resume.
+
+    Args:
+        out_path (str or Path): path to the NDJSON output file
+        resume (bool): if True, continue from the existing checkpoint.
+            If False (or if there is no checkpoint or the output file
+            is missing or shorter than at the checkpoint), the output
+            file is started from scratch.
+    """
+
+    def __init__(self, out_path: Union[str, Path], resume: bool = False) -> None:
+        self.out_path = Path(out_path)
+        self.checkpoint_path = Path(f"{out_path}.checkpoint.json")
+        self.state = {}
+
+        os.makedirs(self.out_path.parent, exist_ok=True)
+
+        if resume and self.checkpoint_path.exists():
+            with open(self.checkpoint_path, "r") as checkpoint_file:
+                state = json.load(checkpoint_file)
+
+            # Resume only if the output still contains the checkpointed
+            # records (the checkpoint would otherwise pad it with nulls)
+            if (
+                self.out_path.exists()
+                and self.out_path.stat().st_size >= state["bytes"]
+            ):
+                self.state = state
+            else:
+                print(
+                    f"Output of harvest {self.out_path.name} is missing or "
+                    "incomplete, starting from scratch."
+                )
+
+        if self.state:
+            # Drop partial output written after the last checkpoint
+            with open(self.out_path, "a+b") as ndjson_file:
+                ndjson_file.truncate(self.state["bytes"])
+
+            print(
+                f"Resuming harvest {self.out_path.name} from checkpoint {self.state}."
+            )
+        else:
+            open(self.out_path, "wb").close()
+            self.checkpoint_path.unlink(missing_ok=True)
+
+    def commit(self, records: Iterable[dict], **state) -> None:
+        """Append records to the NDJSON file and write a checkpoint.
+
+        Args:
+            records (iterable): JSON-serializable records to append
+            **state: harvest state to record in the checkpoint, e.g.,
+                the last completed page or offset
+        """
+        with open(self.out_path, "a", encoding="utf-8") as ndjson_file:
+            for record in records:
+                ndjson_file.write(json.dumps(record) + "\n")
+
+            ndjson_file.flush()
+            os.fsync(ndjson_file.fileno())
+            size = ndjson_file.tell()
+
+        self.state = {**state, "bytes": size}
+        tmp_path = Path(f"{self.checkpoint_path}.tmp")
+
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from http_client import HttpClient, default_client
+from rate_limit import TokenBucket
+
+
+class ResponseCache:
+    """On-disk cache for JSON API responses, keyed by the request URL.
+    Fresh entries (younger than the TTL of their endpoint) are served
+    without a request. Stale entries are revalidated with a conditional
+    request (If-None-Match / If-Modified-Since) and only downloaded
+    again if the API reports a change. The least recently used entries
+    are evicted once the cache exceeds its size budget.
+
+    Args:
+        cache_dir (str or Path): directory in which the responses are
+            stored
+        ttls (optional, dict): mapping of URL prefixes to TTLs in
+            seconds. The longest matching prefix determines the TTL of
+            a request.
+        default_ttl (float): TTL in seconds for URLs without a matching
+            prefix in ttls
+        max_bytes (int): size budget of the cache directory in bytes
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 24 * 60 * 60,
+        max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Sizes of all entries on disk, used for the size-based eviction
+        self._sizes = {
+            path.name: path.stat().st_size for path in self.cache_dir.glob("*.json")
+        }
+
+    def _path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def ttl_for(self, url: str) -> float:
+        """Return the TTL in seconds for a request URL.
+
+        Args:
+            url (str): request URL
+
+        Returns:
+            ttl (float): TTL of the longest matching URL prefix
+        """
+        matching_prefixes = [prefix for prefix in self.ttls if url.startswith(prefix)]
+
+        if not matching_prefixes:
+            return self.default_ttl
+
+        return self.ttls[max(matching_prefixes, key=len)]
+
+    def _load(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # Guard against hash collisions
+        if entry.get("url") != url:
+            return None
+
+        return entry
+
+    def _store(self, url: str, entry: dict) -> None:
+        path = self._path(url)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as entry_file:
+            json.dump(entry, entry_file)
+
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._sizes[path.name] = path.stat().st_size
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache is
+        within its size budget. Must be called with the lock held.
+        """
+        if sum(self._sizes.values()) <= self.max_bytes:
+            return
+
+        def last_used(name: str) -> float:
+            try:
+                return (self.cache_dir / name).stat().st_mtime
+            except FileNotFoundError:
+                return 0.0
+
+        total_bytes = sum(self._sizes.values())
+
+        for name in sorted(self._sizes, key=last_used):
+            if total_bytes <= self.max_bytes:
+                break
+
+            total_bytes -= self._sizes.pop(name)
+            Path(self.cache_dir / name).unlink(missing_ok=True)
+
+    def get_json(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        client: Optional[HttpClient] = None,
+    ) -> dict:
+        """Return the decoded JSON response for a request URL, either
+        from the cache or from the API.
+
+        Args:
+            url (str): request URL
+            headers (optional, dict): request headers
+            rate_limiter (optional, TokenBucket): rate limiter which is
+                only used if a request has to be sent to the API
+            client (optional, HttpClient): HTTP client for the requests.
+                If unspecified, the shared default client is used.
+
+        Returns:
+            response (dict): the decoded JSON response
+        """
+        entry = self._load(url)
+
+        if entry and time.time() - entry["stored_at"] < self.ttl_for(url):
+            # Mark the entry as recently used for the eviction
+            try:
+                os.utime(self._path(url))
+            except FileNotFoundError:
+                pass
+            return json.loads(entry["body"])
+
+        request_headers = dict(headers or {})
+
+        if entry and entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        client = client or default_client
+        response = client.get(url, request_headers, rate_limiter)
+
+        if entry and response.status_code == 304:
+            entry["stored_at"] = time.time()
+            self._store(url, entry)
+            return json.loads(entry["body"])
+
+        if response.status_code == 200:
+            self._store(
+                url,
+                {
+                    "url": url,
+                    "stored_at": time.time(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "body": response.text,
+                },
+            )
+
+        return response.json()
+
+
+def get_json(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    cache: Optional[ResponseCache] = None,
+    rate_limiter: Optional[TokenBucket] = None,
+    client: Optional[HttpClient] = None,
+) -> dict:
+    """Send a GET request and return the decoded JSON response. If a
+    cache is given, the response is served from the cache if possible.
+
+    Args:
+        url (str): request URL
+        headers (optional, dict): request headers
+        cache (optional, ResponseCache): response cache
+        rate_limiter (optional, TokenBucket): rate limiter which is only
+            used if a request has to be sent to the API
+        client (optional, HttpClient): HTTP client for the requests. If
+            unspecified, the shared default client is used.
+
+    Returns:
+        response (dict): the decoded JSON response
+    """
+    if cache is not None:
+        return cache.get_json(url, headers, rate_limiter, client)
+
+    client = client or default_client
+    return client.get(url, headers, rate_limiter).json()
@@ -0,0 +1,217 @@
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import TokenBucket
+
+# Responses with these status codes are retried
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class RequestMetrics:
+    """Metrics of a single request, including all of its retries."""
+
+    url: str
+    status_code: Optional[int]
+    latency: float
+    retries: int
+    bytes: int = 0
+
+
+@dataclass
+class RequestTotals:
+    """Totals of the metrics of all requests sent by a client."""
+
+    requests: int = 0
+    retries: int = 0
+    bytes: int = 0
+    latency: float = 0.0
+    max_latency: float = 0.0
+
+
+class HttpClient:
+    """HTTP client with a pooled keep-alive session. Failed requests
+    (connection errors, timeouts, 429 and 5xx responses) are retried
+    with exponential backoff and full jitter; a Retry-After header sent
+    by the API takes precedence over the computed backoff. Latency and
+    retry count and response size of the most recent requests are kept
+    in metrics, the totals of all requests in totals, so a long-running
+    process does not keep the metrics of every request.
+
+    Args:
+        max_retries (int): maximum number of retries per request
+        backoff_factor (float): base of the exponential backoff in
+            seconds
+        max_backoff (float): upper bound of the backoff in seconds
+        pool_maxsize (int): maximum number of pooled connections per
+            host
+        timeout (float): timeout per attempt in seconds
+        max_metrics (int): number of recent requests kept in metrics
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_factor: float = 1.0,
+        max_backoff: float = 60.0,
+        pool_maxsize: int = 10,
+        timeout: float = 30.0,
+        max_metrics: int = 10000,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.metrics: Deque[RequestMetrics] = deque(maxlen=max_metrics)
+        self.totals = RequestTotals()
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, retries: int, response: Optional[requests.Response]) -> float:
+        """Return the number of seconds to wait before the next attempt.
+
+        Args:
+            retries (int): number of retries so far
+            response (optional, Response): the failed response, if any
+
+        Returns:
+            backoff (float): the waiting time in seconds
+        """
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+
+            try:
+                retry_at = parsedate_to_datetime(retry_after).timestamp()
+                return min(self.max_backoff, max(0.0, retry_at - time.time()))
+            except (TypeError, ValueError):
+                pass
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * 2**retries)
+        )
+
+    def _record(
+        self,
+        url: str,
+        status_code: Optional[int],
+        start: float,
+        retries: int,
+        size: int = 0,
+    ) -> None:
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            self.metrics.append(
+                RequestMetrics(url, status_code, latency, retries, size)
+            )
+            self.totals.requests += 1
+            self.totals.retries += retries
+            self.totals.bytes += size
+            self.totals.latency += latency
+            self.totals.max_latency = max(self.totals.max_latency, latency)
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> requests.Response:
+        """Send a GET request, retrying transient errors.
+
+        Args:
+            url (str): request URL
+            headers (optional, dict): request headers
+            rate_limiter (optional, TokenBucket): rate limiter which is
+                applied to every attempt
+
+        Returns:
+            response (Response): the successful (or not modified)
+                response
+
+        Raises:
+            requests.HTTPError: if the API returns an error status after
+                all retries
+            requests.RequestException: if the connection fails after all
+                retries
+        """
+        start = time.perf_counter()
+        retries = 0
+
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if retries >= self.max_retries:
+                    self._record(url, None, start, retries)
+                    raise
+                response = None
+            else:
+                if (response.status_code not in RETRY_STATUS_CODES) or (
+                    retries >= self.max_retries
+                ):
+                    self._record(
+                        url,
+                        response.status_code,
+                        start,
+                        retries,
+                        len(response.content),
+                    )
+                    response.raise_for_status()
+                    return response
+
+            time.sleep(self._backoff(retries, response))
+            retries += 1
+
+    def snapshot(self) -> Tuple[RequestTotals, List[RequestMetrics]]:
+        """Copy the request totals and the metrics of the recent requests.
+
+        Returns:
+            totals (RequestTotals): totals of all requests
+            metrics (list of RequestMetrics): metrics of the recent requests
+        """
+        with self._lock:
+            return RequestTotals(**vars(self.totals)), list(self.metrics)
+
+    def summary(self) -> str:
+        """Summarize the request metrics of all requests.
+
+        Returns:
+            summary (str): number of requests, retries and latencies
+        """
+        totals, _ = self.snapshot()
+
+        if not totals.requests:
+            return "No requests sent."
+
+        return (
+            f"{totals.requests} requests, {totals.retries} retries, "
+            f"{totals.bytes / 1024**2:.1f} MiB, "
+            f"mean latency {totals.latency / totals.requests:.3f} s, "
+            f"max latency {totals.max_latency:.3f} s."
+        )
+
+
+# Client shared by the setlist.fm and Musicbrainz API modules
+default_client = HttpClient()
@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+from http_client import HttpClient
+
+
+@dataclass
+class StageMetrics:
+    """Metrics of a single pipeline stage run."""
+
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_mib: Optional[float]
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    cached: bool = False
+
+
+def count_rows(value: Any) -> Optional[int]:
+    """Number of rows of a stage input or output: the length of a
+    DataFrame or list, or of the first element of a tuple of outputs.
+    None for other values.
+    """
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, (pd.DataFrame, list)):
+        return len(value)
+    return None
+
+
+class Instrumentation:
+    """Records wall time, CPU time, peak memory (tracemalloc) and rows
+    in/out of pipeline stages and creates a run report together with
+    the request metrics of the HTTP client. A disabled instance only
+    calls the stage functions, so instrumentation can stay in place at
+    close to no cost.
+
+    Args:
+        enabled (bool): if False, nothing is recorded
+        trace_memory (bool): if True, the peak memory of each stage is
+            traced with tracemalloc (which slows the stages down
+            considerably, so it is off by default)
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False) -> None:
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages: List[StageMetrics] = []
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def run(
+        self, name: str, func: Callable, *args, cached: bool = False, **kwargs
+    ) -> Any:
+        """Run a stage function and record its metrics.
+
+        Args:
+            name (str): stage name
+            func (callable): stage function
+            *args, **kwargs: arguments passed on to the function; the
+                rows of the first argument are recorded as rows in
+            cached (bool): marks stage outputs served from a cache
+
+        Returns:
+            result: the return value of the function
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        started_tracing = False
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            wall_seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - start_cpu
+            peak_mib = None
+
+            if self.trace_memory:
+                peak_mib = tracemalloc.get_traced_memory()[1] / 1024**2
+                if started_tracing:
+                    tracemalloc.stop()
+
+        metrics = StageMetrics(
+            name,
+            round(wall_seconds, 4),
+            round(cpu_seconds, 4),
+            None if peak_mib is None else round(peak_mib, 2),
+            count_rows(args[0]) if args and not cached else None,
+            count_rows(result),
+            cached,
+        )
+        with self._lock:
+            self.stages.append(metrics)
+
+        return result
+
+    def report(self, http_client: Optional[HttpClient] = None) -> Dict:
+        """Create the run report.
+
+        Args:
+            http_client (optional, HttpClient): client whose request
+                metrics are included in the report
+
+        Returns:
+            report (dict): JSON-serializable run report with the stage
+                metrics and the request metrics (totals and per request)
+        """
+        with self._lock:
+            stages = [asdict(stage) for stage in self.stages]
+
+        report = {
+            "started_at": time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)
+            ),
+            "wall_seconds": round(time.time() - self.started_at, 3),
+            "stages": stages,
+        }
+
+        if http_client is not None:
+            totals, metrics = http_client.snapshot()
+            totals = asdict(totals)
+            requests = [asdict(metric) for metric in metrics]
+            latencies = sorted(request["latency"] for request in requests)
+
+            # The totals cover all requests, the p95 latency and the per
+            # request metrics only the recent requests kept by the client
+            report["http"] = {
+                "requests": totals["requests"],
+                "retries": totals["retries"],
+                "bytes": totals["bytes"],
+                "latency_mean": (
+                    round(totals["latency"] / totals["requests"], 4)
+                    if totals["requests"]
+                    else None
+                ),
+                "latency_p95": (
+                    round(latencies[int(0.95 * (len(latencies) - 1))], 4)
+                    if latencies
+                    else None
+                ),
+                "latency_max": (
+                    round(totals["max_latency"], 4) if totals["requests"] else None
+                ),
+                "per_request": requests,
+            }
+
+        return report
+
+    def write_report(
+        self, path: Union[str, Path], http_client: Optional[HttpClient] = None
+    ) -> Dict:
+        """Write the run report as JSON.
+
+        Args:
+            path (str or Path): path of the JSON file
+            http_client (optional, HttpClient): see report()
+
+        Returns:
+            report (dict): the run report
+        """
+        report = self.report(http_client)
+        os.makedirs(Path(path).parent, exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+        return report
+
+    def summary(self, http_client: Optional[HttpClient] = None) -> str:
+        """Human-readable summary of the run report.
+
+        Args:
+            http_client (optional, HttpClient): see report()
+
+        Returns:
+            summary (str): one line per stage and the HTTP totals
+        """
+        report = self.report(http_client)
+        lines = [
+            f"{'stage':<32}{'wall s':>9}{'cpu s':>9}{'peak MiB':>10}"
+            f"{'rows in':>10}{'rows out':>10}"
+        ]
+
+        for stage in report["stages"]:
+            name = stage["name"] + (" (cached)" if stage["cached"] else "")
+            lines.append(
+                f"{name:<32}{stage['wall_seconds']:>9.3f}{stage['cpu_seconds']:>9.3f}"
+                f"{_format(stage['peak_mib']):>10}{_format(stage['rows_in']):>10}"
+                f"{_format(stage['rows_out']):>10}"
+            )
+
+        if "http" in report:
+            http = report["http"]
+            lines.append(
+                f"{http['requests']} requests, {http['retries']} retries, "
+                f"{http['bytes'] / 1024**2:.1f} MiB, "
+                f"mean latency {_format(http['latency_mean'])} s, "
+                f"p95 latency {_format(http['latency_p95'])} s."
+            )
+
+        lines.append(f"Total wall time {report['wall_seconds']:.1f} s.")
+        return "\n".join(lines)
+
+
+def _format(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:g}"
+
+
+# Disabled instance, used when no instrumentation is passed
+disabled = Instrumentation(enabled=False)
@@ -1,27 +1,109 @@
+from typing import Tuple
+
+import numpy as np
 import pandas as pd
 
 
+def build_song_dimension(albums_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Builds the song dimension from the album songs: one row per
+    harmonized song name with an integer song_id and a single album
+    attribution. Songs that appear on several albums are attributed to
+    the first album they appear with in albums_df; these ambiguous
+    matches are returned for review.
+
+    Args:
+        albums_df (DataFrame): cleaned version of the musicbrainz
+            albums data
+
+    Returns:
+        songs (DataFrame): the columns song_id (0, 1, ...), song_name
+            and album_name
+        ambiguous_songs (DataFrame): one row per album of the songs that
+            appear on several albums with the columns song_id,
+            song_name, album_name and attributed_album
+    """
+    album_songs = (
+        albums_df[["song_name", "album_name"]]
+        .dropna(subset="song_name")
+        .drop_duplicates()
+    )
+
+    songs = album_songs.drop_duplicates(subset="song_name").reset_index(drop=True)
+    songs.insert(0, "song_id", songs.index)
+
+    ambiguous_songs = album_songs[
+        album_songs.duplicated(subset="song_name", keep=False)
+    ].merge(
+        songs.rename(columns={"album_name": "attributed_album"}),
+        on="song_name",
+    )[
+        ["song_id", "song_name", "album_name", "attributed_album"]
+    ]
+
+    if len(ambiguous_songs) > 0:
+        print(
+            f"{ambiguous_songs['song_id'].nunique()} songs appear on several "
+            "albums and are attributed to the first one."
+        )
+
+    return songs, ambiguous_songs
+
+
+def encode_songs(titles: pd.Series, songs: pd.DataFrame) -> np.ndarray:
+    """Encodes song titles with the song_id of the song dimension. The
+    titles are factorized first, so each distinct title is looked up in
+    the dimension only once.
+
+    Args:
+        titles (Series): song titles
+        songs (DataFrame): output of build_song_dimension()
+
+    Returns:
+        song_ids (np.ndarray): song_id of each title, -1 for titles that
+            are not in the song dimension
+    """
+    codes, distinct_titles = pd.factorize(titles)
+    positions = pd.Index(songs["song_name"]).get_indexer(distinct_titles)
+    song_ids = np.where(positions >= 0, songs["song_id"].to_numpy()[positions], -1)
+
+    # Code -1 (missing title) takes the appended -1
+    return np.append(song_ids, -1)[codes]
+
+
 def join_setlists_albums(
-    setlists_df: pd.DataFrame, albums_df: pd.DataFrame
+    setlists_df: pd.DataFrame, songs: pd.DataFrame
 ) -> pd.DataFrame:
-    """Performs a join of the setlists and album tables to enrich the
-    setlists data with the corresponding albums to the songs
+    """Performs a join of the setlists and the song dimension to enrich
+    the setlists data with the corresponding albums to the songs. The
+    setlist songs are encoded with the integer song_id of the song
+    dimension (see encode_songs()) and the album is looked up by that
+    id, so each setlist row gets at most one album.
 
     Args:
         setlists_df (DataFrame): cleaned version of the setlist.fm
             setlists data
-        albums_df (DataFrame): cleaned version of the musicbrainz
-            albums data
+        songs (DataFrame): output of build_song_dimension()
 
     Returns:
-        concerts (DataFrame): the setlists data with an additional
-            albums column
+        concerts (DataFrame): the setlists data with additional song_id
+            (missing for songs that are not on an album) and album_name
+            columns
     """
-    concerts = pd.merge(
-        setlists_df, albums_df, left_on="song_title", right_on="song_name", how="left"
+    song_ids = encode_songs(setlists_df["song_title"], songs)
+
+    concerts = setlists_df.copy()
+    concerts["song_id"] = pd.Series(song_ids, index=concerts.index, dtype="Int64").mask(
+        song_ids < 0
     )
 
-    concerts = concerts.drop(columns=["song_position", "song_name"])
+    # Album lookup by song_id on the integer codes of the album names,
+    # stored as a categorical like the other low-cardinality setlist
+    # columns
+    album_codes, album_names = pd.factorize(songs["album_name"], sort=True)
+    concerts["album_name"] = pd.Categorical.from_codes(
+        np.append(album_codes, -1)[song_ids], categories=album_names
+    ).remove_unused_categories()
+
     return concerts
 
 
@@ -38,7 +120,8 @@ if __name__ == "__main__":
     albums = pd.read_csv(Path(in_path / albums_file))
 
     # Run the join function
-    concerts = join_setlists_albums(setlists, albums)
+    songs, _ = build_song_dimension(albums)
+    concerts = join_setlists_albums(setlists, songs)
 
     # Save the clean data to CSV
     out_path = Path(Path.cwd() / "data_prep" / "data" / "csv")
@@ -1,20 +1,30 @@
-import time
-from typing import List
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Union
 
-import requests
+from harvest import NdjsonHarvest
+from http_cache import ResponseCache, get_json
+from rate_limit import TokenBucket
 
+# The Musicbrainz API allows an average of 1 request per second
+MUSICBRAINZ_REQUESTS_PER_SECOND = 1.0
 
-def get_releases(mbid: str) -> List[dict]:
+# Cache TTLs in seconds for the Musicbrainz endpoints used by this module
+CACHE_TTLS = {"https://musicbrainz.org/ws/2/": 7 * 24 * 60 * 60}
+
+
+def get_releases(mbid: str, cache: Optional[ResponseCache] = None) -> List[dict]:
     """Fetch releases for an artist MBID from the Musicbrainz API with
     pagination support. Currently set to only fetch official album
     releases.
 
     Args:
         mbid (str): Musicbrainz ID of any given artist
+        cache (optional, ResponseCache): response cache
 
     Returns:
         releases (list): list of all releases fetched from the API
     """
+    rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
     print(f"Querying releases for artist mbid {mbid}...")
     base_request = f"https://musicbrainz.org/ws/2/release?artist={mbid}&type=album&status=official&fmt=json"
     offset = 0
@@ -24,7 +34,7 @@ def get_releases(mbid: str) -> List[dict]:
 
     while more_results_available:
         request = f"{base_request}&limit={limit}&offset={offset}"
-        response = requests.get(request).json()
+        response = get_json(request, cache=cache, rate_limiter=rate_limiter)
         releases.extend(response["releases"])
 
         release_count = response["release-count"]
@@ -36,12 +46,12 @@ def get_releases(mbid: str) -> List[dict]:
         if offset >= release_count:
             more_results_available = False
 
-        time.sleep(1)
-
     return releases
 
 
-def get_songs(releases: List[dict], test: bool = False) -> List[dict]:
+def get_songs(
+    releases: List[dict], test: bool = False, cache: Optional[ResponseCache] = None
+) -> List[dict]:
     """Fetch songs from the Musicbrainz API. Uses the output of
     get_releases() to extract all release MBIDs and query all songs for
     each release.
@@ -50,18 +60,20 @@ def get_songs(releases: List[dict], test: bool = False) -> List[dict]:
         releases (list): list of releases containing a dictionary which
             must contain at least a key-value pair of {"id": "<mbid>"}
             at the top level
+        cache (optional, ResponseCache): response cache
 
     Returns:
         songs (list): list of all songs for the input releases fetched
             from the API
     """
-    print(f"Querying songs...")
+    rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+    print("Querying songs...")
     songs = []
 
     for index, release in enumerate(releases):
         release_mbid = release["id"]
         request = f"https://musicbrainz.org/ws/2/release/{release_mbid}?inc=recordings&fmt=json"
-        response = requests.get(request).json()
+        response = get_json(request, cache=cache, rate_limiter=rate_limiter)
         songs.extend([response])
 
         if (index == 1) or (index % 20 == 0 and index != 0):
@@ -72,38 +84,357 @@ def get_songs(releases: List[dict], test: bool = False) -> List[dict]:
         if (test == True) and (index == 4):
             break
 
-        time.sleep(1)
+    return songs
+
+
+def harvest_releases(
+    mbid: str,
+    out_path: Union[str, Path],
+    resume: bool = False,
+    cache: Optional[ResponseCache] = None,
+) -> int:
+    """Fetch the official album releases for an artist MBID from the
+    Musicbrainz API and stream them to an NDJSON file, one release per
+    line. A checkpoint with the next offset is written after every
+    request, so an interrupted harvest can be resumed.
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        out_path (str or Path): path to the NDJSON output file
+        resume (bool): if True, continue from the offset recorded in the
+            checkpoint
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        offset (int): number of releases harvested
+    """
+    rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+    print(f"Harvesting releases for artist mbid {mbid}...")
+    base_request = f"https://musicbrainz.org/ws/2/release?artist={mbid}&type=album&status=official&fmt=json"
+    limit = 100
+
+    harvest = NdjsonHarvest(out_path, resume)
+    offset = harvest.state.get("offset", 0)
+    release_count = harvest.state.get("release_count")
+
+    while (release_count is None) or (offset < release_count):
+        request = f"{base_request}&limit={limit}&offset={offset}"
+        response = get_json(request, cache=cache, rate_limiter=rate_limiter)
+        release_count = response["release-count"]
+        offset += len(response["releases"])
+        harvest.commit(response["releases"], offset=offset, release_count=release_count)
+        print(f"Results {offset} of {release_count} total results queried.")
+
+        if not response["releases"]:
+            break
+
+    return offset
+
+
+def harvest_songs(
+    releases: Iterable[dict],
+    out_path: Union[str, Path],
+    resume: bool = False,
+    cache: Optional[ResponseCache] = None,
+) -> int:
+    """Fetch the songs of each release from the Musicbrainz API and
+    stream them to an NDJSON file, one release per line. A checkpoint
+    with the number of completed releases is written after every
+    request, so an interrupted harvest can be resumed.
+
+    Args:
+        releases (iterable): releases containing a dictionary which
+            must contain at least a key-value pair of {"id": "<mbid>"}
+            at the top level, e.g., iter_ndjson() of the output of
+            harvest_releases()
+        out_path (str or Path): path to the NDJSON output file
+        resume (bool): if True, skip the releases completed according
+            to the checkpoint
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        index (int): number of releases harvested
+    """
+    rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+    print("Harvesting songs...")
+
+    harvest = NdjsonHarvest(out_path, resume)
+    completed = harvest.state.get("index", 0)
+    index = 0
+
+    for index, release in enumerate(releases, start=1):
+        if index <= completed:
+            continue
+
+        release_mbid = release["id"]
+        request = f"https://musicbrainz.org/ws/2/release/{release_mbid}?inc=recordings&fmt=json"
+        response = get_json(request, cache=cache, rate_limiter=rate_limiter)
+        harvest.commit([response], index=index)
+
+        if index % 20 == 0:
+            print(f"Release {index} queried.")
+
+    print(f"Release {index} queried.")
+
+    return index
+
+
+def is_studio_album(release_group: dict) -> bool:
+    """Check whether a release group is a studio album, i.e., an album
+    without any secondary types (live, compilation, soundtrack, etc.).
+
+    Args:
+        release_group (dict): release group as returned by the
+            Musicbrainz API
+
+    Returns:
+        bool: True if the release group is a studio album
+    """
+    return (release_group.get("primary-type") == "Album") and (
+        not release_group.get("secondary-types")
+    )
+
+
+def _browse(
+    base_request: str,
+    result_key: str,
+    count_key: str,
+    rate_limiter: TokenBucket,
+    cache: Optional[ResponseCache] = None,
+    limit: int = 100,
+) -> List[dict]:
+    """Page through a Musicbrainz browse endpoint. The offset is moved
+    by the number of results actually returned, because the API returns
+    fewer results than the limit when inc=recordings is requested.
+
+    Args:
+        base_request (str): browse request without limit and offset
+        result_key (str): key of the result list in the response
+        count_key (str): key of the total result count in the response
+        rate_limiter (TokenBucket): rate limiter shared by all requests
+        cache (optional, ResponseCache): response cache
+        limit (int): maximum number of results per request
+
+    Returns:
+        results (list): all results of the browse request
+    """
+    offset = 0
+    results = []
+
+    while True:
+        request = f"{base_request}&limit={limit}&offset={offset}"
+        response = get_json(request, cache=cache, rate_limiter=rate_limiter)
+        page = response[result_key]
+        results.extend(page)
+        offset += len(page)
+
+        if (not page) or (offset >= response[count_key]):
+            return results
+
+
+def get_release_groups(
+    mbid: str,
+    rate_limiter: Optional[TokenBucket] = None,
+    cache: Optional[ResponseCache] = None,
+) -> List[dict]:
+    """Fetch all album release groups for an artist MBID from the
+    Musicbrainz API.
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        rate_limiter (optional, TokenBucket): rate limiter for the API
+            requests. If unspecified, a limiter set to the Musicbrainz
+            API quota is used.
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        release_groups (list): list of all album release groups
+    """
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+
+    print(f"Querying release groups for artist mbid {mbid}...")
+    base_request = (
+        f"https://musicbrainz.org/ws/2/release-group?artist={mbid}&type=album&fmt=json"
+    )
+    return _browse(
+        base_request, "release-groups", "release-group-count", rate_limiter, cache
+    )
+
+
+def get_songs_batched(
+    mbid: str,
+    release_group_filter: Optional[Callable[[dict], bool]] = is_studio_album,
+    rate_limiter: Optional[TokenBucket] = None,
+    cache: Optional[ResponseCache] = None,
+) -> List[dict]:
+    """Fetch the official album releases of an artist including their
+    tracks from the Musicbrainz API. Uses the release browse endpoint
+    with inc=recordings, so the tracks of many releases are fetched per
+    request instead of one request per release as in get_songs(). The
+    output has the same structure as the output of get_songs().
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        release_group_filter (optional, callable): function that takes a
+            release group dict and returns True if its releases should
+            be fetched. If specified, the release groups are queried
+            first and only the tracks of the selected release groups are
+            fetched. If None, all official album releases of the artist
+            are fetched.
+        rate_limiter (optional, TokenBucket): rate limiter for the API
+            requests. If unspecified, a limiter set to the Musicbrainz
+            API quota is used.
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        songs (list): list of all releases including their tracks
+    """
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+
+    release_request = (
+        "https://musicbrainz.org/ws/2/release?{browse}&type=album"
+        "&status=official&inc=recordings+release-groups&fmt=json"
+    )
+
+    if release_group_filter is None:
+        print(f"Querying releases and songs for artist mbid {mbid}...")
+        return _browse(
+            release_request.format(browse=f"artist={mbid}"),
+            "releases",
+            "release-count",
+            rate_limiter,
+            cache,
+        )
+
+    release_groups = [
+        release_group
+        for release_group in get_release_groups(mbid, rate_limiter, cache)
+        if release_group_filter(release_group)
+    ]
+
+    print(f"Querying releases and songs for {len(release_groups)} release groups...")
+    songs = []
+
+    for index, release_group in enumerate(release_groups):
+        songs.extend(
+            _browse(
+                release_request.format(browse=f"release-group={release_group['id']}"),
+                "releases",
+                "release-count",
+                rate_limiter,
+                cache,
+            )
+        )
+
+        if (index + 1) % 5 == 0 or index + 1 == len(release_groups):
+            print(
+                f"Release group {index + 1} of {len(release_groups)} total "
+                f"release groups queried."
+            )
 
     return songs
 
 
+def harvest_songs_batched(
+    mbid: str,
+    out_path: Union[str, Path],
+    resume: bool = False,
+    release_group_filter: Optional[Callable[[dict], bool]] = is_studio_album,
+    cache: Optional[ResponseCache] = None,
+) -> int:
+    """Fetch the official album releases of an artist including their
+    tracks like get_songs_batched() and stream them to an NDJSON file,
+    one release per line. A checkpoint with the number of completed
+    release groups is written after the releases of each release group,
+    so an interrupted harvest can be resumed.
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        out_path (str or Path): path to the NDJSON output file
+        resume (bool): if True, skip the release groups completed
+            according to the checkpoint
+        release_group_filter (optional, callable): function that takes a
+            release group dict and returns True if its releases should
+            be fetched. If None, the releases of all album release
+            groups are fetched.
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        index (int): number of release groups harvested
+    """
+    rate_limiter = TokenBucket(MUSICBRAINZ_REQUESTS_PER_SECOND)
+    release_request = (
+        "https://musicbrainz.org/ws/2/release?release-group={release_group}"
+        "&type=album&status=official&inc=recordings+release-groups&fmt=json"
+    )
+
+    release_groups = [
+        release_group
+        for release_group in get_release_groups(mbid, rate_limiter, cache)
+        if (release_group_filter is None) or release_group_filter(release_group)
+    ]
+    print(f"Harvesting releases and songs for {len(release_groups)} release groups...")
+
+    harvest = NdjsonHarvest(out_path, resume)
+    completed = harvest.state.get("index", 0)
+
+    for index, release_group in enumerate(release_groups, start=1):
+        if index <= completed:
+            continue
+
+        releases = _browse(
+            release_request.format(release_group=release_group["id"]),
+            "releases",
+            "release-count",
+            rate_limiter,
+            cache,
+        )
+        harvest.commit(releases, index=index)
+
+        if index % 5 == 0 or index == len(release_groups):
+            print(
+                f"Release group {index} of {len(release_groups)} total "
+                f"release groups harvested."
+            )
+
+    return len(release_groups)
+
+
 if __name__ == "__main__":
-    import json
-    import os
-    from pathlib import Path
+    import argparse
     import pprint
 
+    from harvest import iter_ndjson
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted harvest from its checkpoint",
+    )
+    args = parser.parse_args()
+
     mbid = "ca891d65-d9b0-4258-89f7-e6ba29d83767"  # MBID for Iron Maiden
 
-    # Test get_releases
-    releases = get_releases(mbid)
-    pprint.pp(releases[0])
-    print(len(releases))
+    # Write the harvest results to NDJSON files
+    out_path = Path.cwd() / "data_prep" / "data" / "json_raw"
+    out_filename_releases = "musicbrainz_releases.ndjson"
+    out_filename_songs = "musicbrainz_songs.ndjson"
+
+    # Test harvest_releases
+    release_count = harvest_releases(
+        mbid, Path(out_path, out_filename_releases), resume=args.resume
+    )
+    pprint.pp(next(iter_ndjson(Path(out_path, out_filename_releases))))
+    print(release_count)
 
     print(f"\n\n{99 * '='}\n\n")  # Delimiter
 
-    # Test get_songs
-    songs = get_songs(releases)
-    pprint.pp(songs[0])
-    print(len(songs))
-
-    # Write test results to JSON file
-    out_path = Path.cwd() / "data_prep" / "data" / "json_raw"
-    os.makedirs(out_path, exist_ok=True)
-    out_filename_releases = "musicbrainz_releases.json"
-    out_filename_songs = "musicbrainz_songs.json"
-
-    with open(Path(out_path, out_filename_releases), "w") as releases_file:
-        json.dump(releases, releases_file, indent=4)
-    with open(Path(out_path, out_filename_songs), "w") as songs_file:
-        json.dump(songs, songs_file, indent=4)
+    # Test harvest_songs_batched
+    release_group_count = harvest_songs_batched(
+        mbid, Path(out_path, out_filename_songs), resume=args.resume
+    )
+    pprint.pp(next(iter_ndjson(Path(out_path, out_filename_songs))))
+    print(release_group_count)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter. Tokens are refilled
+    continuously at a fixed rate up to the bucket capacity; every
+    request consumes one token and blocks until a token is available.
+
+    Args:
+        rate (float): number of tokens added per second (i.e., the
+            sustained number of requests per second)
+        capacity (float): maximum number of tokens in the bucket (i.e.,
+            the maximum burst size)
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until the requested number of tokens is available and
+        consume them.
+
+        Args:
+            tokens (float): number of tokens to consume
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._last_refill
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._last_refill = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait_time = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_time)
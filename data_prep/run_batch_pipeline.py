@@ -0,0 +1,203 @@
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from app_export import write_app_data
+from http_cache import ResponseCache
+import musicbrainz
+from rate_limit import TokenBucket
+from run_data_pipeline import transform_data
+import setlist_fm
+
+
+def _fetch_artist_data(
+    mbid: str,
+    headers: Dict[str, str],
+    setlist_fm_limiter: TokenBucket,
+    musicbrainz_limiter: TokenBucket,
+    cache: Optional[ResponseCache],
+) -> Tuple[List[dict], List[dict], float]:
+    """Fetch the raw setlists and album songs of an artist. All fetches
+    of a batch share the same rate limiters, so the API quotas hold for
+    the batch as a whole.
+
+    Returns:
+        setlists (list): raw setlist.fm setlists data
+        songs (list): raw Musicbrainz releases including their tracks
+        seconds (float): wall time of the fetch
+    """
+    start = time.perf_counter()
+    setlists = setlist_fm.get_setlists(
+        mbid, headers, rate_limiter=setlist_fm_limiter, cache=cache
+    )
+    songs = musicbrainz.get_songs_batched(
+        mbid, rate_limiter=musicbrainz_limiter, cache=cache
+    )
+    return setlists, songs, time.perf_counter() - start
+
+
+def _transform_and_write(
+    setlists: List[dict],
+    songs: List[dict],
+    missing_tour_data: pd.DataFrame,
+    out_dir: Path,
+) -> Dict[str, Union[int, float]]:
+    """Run the transform stages for one artist and write the app CSVs to
+    the artist's output directory (CSV and Parquet). Runs in a worker
+    process.
+
+    Returns:
+        stats (dict): wall time of the transform and number of rows
+    """
+    start = time.perf_counter()
+    app_tables = transform_data(setlists, songs, missing_tour_data)
+    write_app_data(app_tables, out_dir)
+
+    return {
+        "transform_seconds": time.perf_counter() - start,
+        "concerts": len(app_tables["app_setlist_data"]),
+        "album_songs_played": len(app_tables["app_albums_songs"]),
+    }
+
+
+def run_batch_pipeline(
+    mbids: List[str],
+    headers: Dict[str, str],
+    missing_tour_data: pd.DataFrame,
+    out_path: Union[str, Path],
+    fetch_workers: int = 2,
+    transform_workers: Optional[int] = None,
+    cache: Optional[ResponseCache] = None,
+) -> pd.DataFrame:
+    """Run the data pipeline for several artists. The API fetches run in
+    a thread pool and share one rate limiter per API; as soon as the
+    data of an artist is fetched, its cleaning, join and preparation
+    stages are submitted to a process pool. The app data is written to
+    one directory per artist MBID.
+
+    Args:
+        mbids (list): MBIDs of the artists
+        headers (dict): API headers for the setlist.fm API
+        missing_tour_data (DataFrame): tour names for setlists where
+            they are missing
+        out_path (str or Path): output directory. The files of each
+            artist are written to out_path/<mbid>/.
+        fetch_workers (int): number of threads for the API fetches
+        transform_workers (optional, int): number of worker processes
+            for the transform stages. Defaults to the number of CPUs.
+        cache (optional, ResponseCache): response cache for the API
+            calls
+
+    Returns:
+        summary (DataFrame): one row per artist with the fetch and
+            transform timings, row counts and errors
+    """
+    setlist_fm_limiter = TokenBucket(setlist_fm.SETLIST_FM_REQUESTS_PER_SECOND)
+    musicbrainz_limiter = TokenBucket(musicbrainz.MUSICBRAINZ_REQUESTS_PER_SECOND)
+    summary = {mbid: {"mbid": mbid, "error": None} for mbid in mbids}
+    start = time.perf_counter()
+
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers)
+    transform_pool = ProcessPoolExecutor(max_workers=transform_workers)
+
+    with fetch_pool, transform_pool:
+        pending: Dict[Future, Tuple[str, str]] = {
+            fetch_pool.submit(
+                _fetch_artist_data,
+                mbid,
+                headers,
+                setlist_fm_limiter,
+                musicbrainz_limiter,
+                cache,
+            ): (mbid, "fetch")
+            for mbid in mbids
+        }
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                mbid, stage = pending.pop(future)
+
+                try:
+                    result = future.result()
+                except Exception as error:
+                    summary[mbid]["error"] = f"{stage}: {error!r}"
+                    print(f"Artist {mbid}: {stage} failed with {error!r}.")
+                    continue
+
+                if stage == "fetch":
+                    setlists, songs, summary[mbid]["fetch_seconds"] = result
+                    transform = transform_pool.submit(
+                        _transform_and_write,
+                        setlists,
+                        songs,
+                        missing_tour_data,
+                        Path(out_path) / mbid,
+                    )
+                    pending[transform] = (mbid, "transform")
+                else:
+                    summary[mbid].update(result)
+                    print(f"Artist {mbid} completed.")
+
+    summary = pd.DataFrame(list(summary.values()))
+    print(
+        f"{len(mbids)} artists processed in {time.perf_counter() - start:.1f} s, "
+        f"{summary['error'].notna().sum()} failed."
+    )
+
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mbids", nargs="+", help="MBIDs of the artists")
+    parser.add_argument(
+        "--transform-workers",
+        type=int,
+        default=None,
+        help="number of worker processes for the transform stages",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    API_KEY = os.getenv("API_KEY")
+    headers = {
+        "x-api-key": API_KEY,
+        "Accept": "application/json",
+        "Accept-Languate": "en",
+    }
+
+    data_path = Path.cwd() / "data_prep" / "data"
+    missing_tour_data = pd.read_csv(Path(data_path / "missing_tour_data.csv"))
+
+    # Cache the API responses between runs
+    cache = ResponseCache(
+        Path(data_path / "http_cache"),
+        ttls={**setlist_fm.CACHE_TTLS, **musicbrainz.CACHE_TTLS},
+    )
+
+    summary = run_batch_pipeline(
+        args.mbids,
+        headers,
+        missing_tour_data,
+        Path(data_path / "artists"),
+        transform_workers=args.transform_workers,
+        cache=cache,
+    )
+    print(summary.to_string(index=False))
+    summary.to_csv(Path(data_path / "artists" / "run_summary.csv"), index=False)
@@ -1,16 +1,274 @@
 import json
 import os
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 
 import pandas as pd
 
+from app_export import read_app_data, write_app_data
 from clean_album_data import clean_album_data
 from clean_setlists_data import clean_setlists_data
+from concert_db import build_concert_db
 import data_prep
-from join_setlists_albums import join_setlists_albums
+from harmonize_songs import harmonize_song_titles
+from harvest import iter_ndjson, raw_data_path
+from http_cache import ResponseCache
+from http_client import default_client
+from instrumentation import Instrumentation, disabled
+from join_setlists_albums import build_song_dimension, join_setlists_albums
 import musicbrainz
 import setlist_fm
+from setlist_variants import setlist_variants
+from song_index import build_song_index
+from stage_cache import Stage, StageCache, run_stages
+import tour_geo
+
+
+def load_raw_data(json_path: Path) -> List[dict]:
+    """Load raw API data from disk: the JSON file or the NDJSON output of
+    a harvest with the same file name, whichever was written last (see
+    harvest.raw_data_path()). The records are loaded into memory, since
+    the transform stages hash and flatten all of them at once; use
+    clean_setlists_data.clean_setlists_chunked() to stream large
+    harvests instead.
+
+    Args:
+        json_path (Path): path to the JSON file
+
+    Returns:
+        records (list): the raw API records
+    """
+    path = raw_data_path(json_path)
+
+    if path.suffix == ".ndjson":
+        return list(iter_ndjson(path))
+
+    with open(path, "r") as json_file:
+        return json.load(json_file)
+
+
+# The transform stages as a DAG: each stage runs on the named pipeline
+# inputs (setlists, songs, missing_tour_data) or outputs of other stages
+TRANSFORM_STAGES = [
+    Stage(
+        "clean_setlists_data",
+        clean_setlists_data,
+        ["setlists", "missing_tour_data"],
+    ),
+    Stage("clean_album_data", clean_album_data, ["songs"]),
+    Stage(
+        "harmonize_song_titles",
+        harmonize_song_titles,
+        ["clean_setlists_data", "clean_album_data"],
+        outputs=["setlists_harmonized", "albums_harmonized", "song_mapping"],
+    ),
+    Stage(
+        "build_song_dimension",
+        build_song_dimension,
+        ["albums_harmonized"],
+        outputs=["song_dimension", "ambiguous_songs"],
+    ),
+    Stage(
+        "join_setlists_albums",
+        join_setlists_albums,
+        ["setlists_harmonized", "song_dimension"],
+    ),
+    Stage("app_setlist_data", data_prep.prepare_setlists, ["join_setlists_albums"]),
+    Stage(
+        "app_albums_songs",
+        data_prep.prepare_albums_songs_played,
+        ["join_setlists_albums"],
+    ),
+    Stage("play_counts", data_prep.count_plays, ["app_albums_songs"]),
+    Stage(
+        "app_top_albums_songs",
+        data_prep.prepare_top_albums_songs,
+        ["play_counts"],
+    ),
+    Stage("song_titles", data_prep.prepare_song_titles, ["join_setlists_albums"]),
+    Stage("app_map_popups", data_prep.prepare_map_popups, ["app_setlist_data"]),
+    Stage("setlist_variants", setlist_variants, ["join_setlists_albums"]),
+    Stage("app_tour_route", tour_geo.prepare_tour_route, ["app_setlist_data"]),
+    Stage("app_tour_travel", tour_geo.prepare_tour_travel, ["app_tour_route"]),
+    Stage("app_map_clusters", tour_geo.prepare_map_clusters, ["app_map_popups"]),
+]
+
+APP_TABLES = [
+    "app_setlist_data",
+    "app_albums_songs",
+    "app_top_albums_songs",
+    "app_map_popups",
+]
+
+# App tables derived from the setlist data and map popups, updated for
+# the tours of the changed setlists by incremental updates
+GEO_TABLES = ["app_tour_route", "app_tour_travel", "app_map_clusters"]
+
+# Tables kept with the app data for incremental updates, not used by
+# the app. They are only written to the data_prep output directory, so
+# a full run has to create them before the first incremental update
+UPDATE_TABLES = ["play_counts", "song_titles"]
+
+
+def transform_data(
+    setlists: List[dict],
+    songs: List[dict],
+    missing_tour_data: pd.DataFrame,
+    db_path: Optional[Path] = None,
+    song_mapping_path: Optional[Path] = None,
+    stage_cache: Optional[StageCache] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    song_index_path: Optional[Path] = None,
+    setlist_variants_path: Optional[Path] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Run the cleaning, join and preparation stages on the raw API data
+    (see TRANSFORM_STAGES).
+
+    Args:
+        setlists (list): raw setlist.fm setlists data
+        songs (list): raw Musicbrainz releases including their tracks
+        missing_tour_data (DataFrame): tour names for setlists where
+            they are missing
+        db_path (optional, Path): if specified, the normalized concert
+            data is additionally stored in an SQLite db at this path
+        song_mapping_path (optional, Path): if specified, the song title
+            mapping of the harmonization stage is written to this CSV
+            file for review
+        stage_cache (optional, StageCache): cache for the stage outputs.
+            If specified, stages whose inputs and code are unchanged
+            are skipped.
+        instrumentation (optional, Instrumentation): records the
+            metrics of each stage
+        song_index_path (optional, Path): if specified, the song
+            performance index is written to this directory, see
+            song_index.build_song_index()
+        setlist_variants_path (optional, Path): if specified, the
+            setlist variants and anomalies of each tour are written to
+            this CSV file, see setlist_variants.setlist_variants()
+
+    Returns:
+        app_tables (dict): the app DataFrames keyed by file name:
+            app_setlist_data (one row per concert incl. the setlist),
+            app_albums_songs (one row per album song played),
+            app_top_albums_songs (most played albums/songs per tour),
+            app_map_popups (map markers per tour and city),
+            app_tour_route (travel route and leg distances per tour),
+            app_tour_travel (travel distances per tour),
+            app_map_clusters (map markers clustered per zoom level) and
+            the tables used by incremental updates (UPDATE_TABLES):
+            play_counts (plays of each album and song per tour) and
+            song_titles (distinct song titles of the setlists)
+    """
+    targets = APP_TABLES + GEO_TABLES + UPDATE_TABLES
+    if db_path is not None or song_index_path is not None:
+        targets.append("join_setlists_albums")
+    if db_path is not None:
+        targets.append("song_dimension")
+    if song_mapping_path is not None:
+        targets.append("song_mapping")
+    if setlist_variants_path is not None:
+        targets.append("setlist_variants")
+
+    outputs = run_stages(
+        TRANSFORM_STAGES,
+        {
+            "setlists": setlists,
+            "songs": songs,
+            "missing_tour_data": missing_tour_data,
+        },
+        targets,
+        cache=stage_cache,
+        instrumentation=instrumentation,
+    )
+
+    if song_mapping_path is not None:
+        outputs["song_mapping"].to_csv(song_mapping_path, index=False)
+
+    if setlist_variants_path is not None:
+        outputs["setlist_variants"].to_csv(setlist_variants_path, index=False)
+
+    if db_path is not None:
+        build_concert_db(
+            outputs["join_setlists_albums"], outputs["song_dimension"], db_path
+        ).close()
+
+    if song_index_path is not None:
+        build_song_index(outputs["join_setlists_albums"], song_index_path)
+
+    return {name: outputs[name] for name in APP_TABLES + GEO_TABLES + UPDATE_TABLES}
+
+
+def update_data(
+    setlists: List[dict],
+    songs: List[dict],
+    missing_tour_data: pd.DataFrame,
+    app_tables: Dict[str, pd.DataFrame],
+    instrumentation: Optional[Instrumentation] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Update the app tables with new or changed setlists: only these
+    setlists are cleaned, harmonized and joined, and the app tables are
+    updated with them (see data_prep.update_app_tables()). The tour
+    routes and map clusters are only recomputed for the tours of these
+    setlists (see tour_geo.update_tour_geo()).
+    Song titles, including covers and other songs without an album,
+    keep the spelling of the existing app data.
+
+    Args:
+        setlists (list): raw setlist.fm data of the new and changed
+            setlists, e.g., from setlist_fm.sync_setlists()
+        songs (list): raw Musicbrainz releases including their tracks
+        missing_tour_data (DataFrame): tour names for setlists where
+            they are missing
+        app_tables (dict): the existing app DataFrames keyed by file
+            name (APP_TABLES, GEO_TABLES and UPDATE_TABLES), see
+            transform_data()
+        instrumentation (optional, Instrumentation): records the
+            metrics of each stage
+
+    Returns:
+        app_tables (dict): the updated app DataFrames
+    """
+    instrumentation = instrumentation or disabled
+
+    if not setlists:
+        print("No new or updated setlists, the app data is up to date.")
+        return app_tables
+
+    delta = instrumentation.run(
+        "clean_setlists_data", clean_setlists_data, setlists, missing_tour_data
+    )
+    albums = instrumentation.run("clean_album_data", clean_album_data, songs)
+    delta, albums, _ = instrumentation.run(
+        "harmonize_song_titles",
+        harmonize_song_titles,
+        delta,
+        albums,
+        known_titles=app_tables["song_titles"]["song_title"],
+    )
+    song_dimension, _ = instrumentation.run(
+        "build_song_dimension", build_song_dimension, albums
+    )
+    delta = instrumentation.run(
+        "join_setlists_albums", join_setlists_albums, delta, song_dimension
+    )
+
+    # Tours of the changed concerts, before and after
+    setlists = app_tables["app_setlist_data"]
+    changed = data_prep.plain_dtypes(delta[["id", "tour"]])
+    tours = pd.concat(
+        [setlists.loc[setlists["id"].isin(changed["id"]), "tour"], changed["tour"]]
+    ).unique()
+
+    app_tables = instrumentation.run(
+        "update_app_tables", data_prep.update_app_tables, app_tables, delta
+    )
+    app_tables.update(
+        instrumentation.run(
+            "update_tour_geo", tour_geo.update_tour_geo, app_tables, tours
+        )
+    )
+
+    return app_tables
 
 
 def run_data_pipeline(
@@ -18,9 +276,19 @@ def run_data_pipeline(
     headers: Dict[str, str],
     missing_tour_data: pd.DataFrame,
     call_api: bool = True,
-) -> None:
-    """Create an SQLite db for the concert, venue, city, setlist, and
-    album tables.
+    cache: Optional[ResponseCache] = None,
+    incremental: bool = False,
+    db_path: Optional[Path] = None,
+    song_mapping_path: Optional[Path] = None,
+    stage_cache: Optional[StageCache] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    app_tables: Optional[Dict[str, pd.DataFrame]] = None,
+    song_index_path: Optional[Path] = None,
+    setlist_variants_path: Optional[Path] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Query (or load) the raw concert and album data, transform it into
+    the app tables and optionally create an SQLite db for the concert,
+    venue, city, tour, song, album and setlist entry tables.
 
     Args:
         mbid (str): MBID of the artist for which the data should be
@@ -29,44 +297,128 @@ def run_data_pipeline(
         call_api (bool): determines the source of the data. If set to
             True, the data is obtained via API calls. If set to False,
             local data is used instead (e.g., for testing).
+        cache (optional, ResponseCache): response cache for the API
+            calls. If specified, unchanged responses are served from
+            the cache.
+        incremental (bool): if set to True (and call_api is True), the
+            local setlist store is synchronized with setlist.fm, i.e.,
+            only the pages with new or edited setlists are queried.
+        db_path (optional, Path): if specified, the SQLite db is
+            created at this path, see concert_db.build_concert_db()
+        song_mapping_path (optional, Path): if specified, the song title
+            mapping is written to this CSV file, see transform_data()
+        stage_cache (optional, StageCache): cache for the outputs of the
+            transform stages, see transform_data()
+        instrumentation (optional, Instrumentation): records the
+            metrics of the fetch and transform stages
+        app_tables (optional, dict): the existing app DataFrames. If
+            specified together with incremental, only the new and
+            updated setlists are transformed and the app tables are
+            updated with them (see update_data()); the SQLite db, song
+            mapping, song index, setlist variants and stage cache are
+            only used by full runs. The synchronized setlist store has
+            to be committed with setlist_fm.commit_setlist_store() once
+            the updated app tables are written.
+        song_index_path (optional, Path): if specified, the song
+            performance index is written to this directory, see
+            transform_data()
+        setlist_variants_path (optional, Path): if specified, the
+            setlist variants are written to this CSV file, see
+            transform_data()
 
     Returns:
-        None
+        app_tables (dict): the app DataFrames keyed by file name, see
+            transform_data()
     """
+    in_path = Path(Path.cwd() / "data_prep" / "data" / "json_raw")
+    in_setlists_file = "setlist_fm_setlists.json"
+    instrumentation = instrumentation or disabled
+
     if call_api == True:
         # Query setlists from setlist.fm
-        setlists = setlist_fm.get_setlists(mbid, headers)
-        # Query releases for artist MBID from Musicbrainz
-        releases = musicbrainz.get_releases(mbid)
-        # Query songs for each release
-        songs = musicbrainz.get_songs(releases, test=False)
+        if incremental == True:
+            setlists = instrumentation.run(
+                "sync_setlists",
+                setlist_fm.sync_setlists,
+                mbid,
+                headers,
+                Path(in_path / in_setlists_file),
+                changed_only=app_tables is not None,
+            )
+        else:
+            setlists = instrumentation.run(
+                "get_setlists",
+                setlist_fm.get_setlists,
+                mbid,
+                headers,
+                max_workers=4,
+                cache=cache,
+            )
+        # Query songs of the studio album releases from Musicbrainz
+        songs = instrumentation.run(
+            "get_songs_batched", musicbrainz.get_songs_batched, mbid, cache=cache
+        )
     else:
-        in_path = Path(Path.cwd() / "data_prep" / "data" / "json_raw")
-        in_setlists_file = "setlist_fm_setlists.json"
         in_songs_file = "musicbrainz_songs.json"
 
-        with open(Path(in_path / in_setlists_file), "r") as setlists_file:
-            setlists = json.load(setlists_file)
-        with open(Path(in_path / in_songs_file), "r") as songs_file:
-            songs = json.load(songs_file)
-
-    # Initial data cleaning and normalization
-    setlists = clean_setlists_data(setlists, missing_tour_data)
-    albums = clean_album_data(songs)
-    concerts = join_setlists_albums(setlists, albums)
+        setlists = instrumentation.run(
+            "load_setlists", load_raw_data, Path(in_path / in_setlists_file)
+        )
+        songs = instrumentation.run(
+            "load_songs", load_raw_data, Path(in_path / in_songs_file)
+        )
 
-    # Prepare data for app
-    app_setlists = data_prep.prepare_setlists(concerts)
-    app_albums_songs_played = data_prep.prepare_albums_songs_played(concerts)
+    if call_api == True and incremental == True and app_tables is not None:
+        return update_data(
+            setlists,
+            songs,
+            missing_tour_data,
+            app_tables,
+            instrumentation=instrumentation,
+        )
 
-    return app_setlists, app_albums_songs_played
+    return transform_data(
+        setlists,
+        songs,
+        missing_tour_data,
+        db_path=db_path,
+        song_mapping_path=song_mapping_path,
+        stage_cache=stage_cache,
+        instrumentation=instrumentation,
+        song_index_path=song_index_path,
+        setlist_variants_path=setlist_variants_path,
+    )
 
 
 if __name__ == "__main__":
+    import argparse
     import shutil
 
     from dotenv import load_dotenv
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="only sync new and updated setlists and update the existing app data",
+    )
+    args = parser.parse_args()
+
+    out_path = Path.cwd() / "data_prep" / "data" / "csv"
+
+    # Incremental updates start from the app data of a full run
+    if args.update:
+        missing = [
+            name
+            for name in APP_TABLES + GEO_TABLES + UPDATE_TABLES
+            if not (out_path / f"{name}.csv").exists()
+        ]
+        if missing:
+            parser.error(
+                f"missing app data in {out_path}: {', '.join(missing)}; "
+                "run the pipeline without --update first"
+            )
+
     mbid = "ca891d65-d9b0-4258-89f7-e6ba29d83767"
 
     load_dotenv()
@@ -80,24 +432,53 @@ if __name__ == "__main__":
     missing_tour_data_file = Path.cwd() / "data_prep" / "data" / "missing_tour_data.csv"
     missing_tour_data = pd.read_csv(missing_tour_data_file)
 
-    setlists, albums_songs = run_data_pipeline(
-        mbid, headers, missing_tour_data, call_api=True
+    # Cache the API responses between runs
+    cache = ResponseCache(
+        Path.cwd() / "data_prep" / "data" / "http_cache",
+        ttls={**setlist_fm.CACHE_TTLS, **musicbrainz.CACHE_TTLS},
     )
 
-    out_path = Path.cwd() / "data_prep" / "data" / "csv"
+    # Set enabled=False to turn the instrumentation off, trace_memory=True
+    # to record the peak memory of each stage
+    instrumentation = Instrumentation()
 
-    setlists.to_csv(
-        Path(out_path / "app_setlist_data.csv"), index=False, encoding="utf-8"
+    app_tables = run_data_pipeline(
+        mbid,
+        headers,
+        missing_tour_data,
+        call_api=True,
+        cache=cache,
+        incremental=args.update,
+        db_path=Path.cwd() / "data_prep" / "data" / "concerts.sqlite",
+        song_mapping_path=Path.cwd() / "data_prep" / "data" / "song_title_mapping.csv",
+        stage_cache=StageCache(Path.cwd() / "data_prep" / "data" / "stage_cache"),
+        instrumentation=instrumentation,
+        app_tables=(
+            read_app_data(out_path, APP_TABLES + GEO_TABLES + UPDATE_TABLES)
+            if args.update
+            else None
+        ),
+        song_index_path=Path.cwd() / "data_prep" / "data" / "song_index",
+        setlist_variants_path=Path.cwd()
+        / "data_prep"
+        / "data"
+        / "setlist_variants.csv",
     )
-    albums_songs.to_csv(
-        Path(out_path / "app_albums_songs.csv"), index=False, encoding="utf-8"
+    print(instrumentation.summary(default_client))
+    instrumentation.write_report(
+        Path.cwd() / "data_prep" / "data" / "run_report.json", default_client
     )
 
+    out_files = write_app_data(app_tables, out_path)
+
     # Copy files to Shiny app data directory
     app_path = Path.cwd() / "shiny-app" / "data"
-    shutil.copy(
-        Path(out_path / "app_setlist_data.csv"), Path(app_path / "app_setlist_data.csv")
-    )
-    shutil.copy(
-        Path(out_path / "app_albums_songs.csv"), Path(app_path / "app_albums_songs.csv")
-    )
+    for out_file in out_files:
+        if out_file.stem in APP_TABLES + GEO_TABLES:
+            shutil.copy(out_file, Path(app_path / out_file.name))
+
+    # The app data is up to date with the synchronized setlists
+    if args.update:
+        setlist_fm.commit_setlist_store(
+            Path.cwd() / "data_prep" / "data" / "json_raw" / "setlist_fm_setlists.json"
+        )
@@ -1,82 +1,360 @@
+import json
 import math
-import time
-from typing import Optional, List, Dict
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, List, Dict, Union
 
-import requests
+from harvest import NdjsonHarvest
+from http_cache import ResponseCache, get_json
+from rate_limit import TokenBucket
+
+# setlist.fm standard API keys are limited to 2 requests per second
+SETLIST_FM_REQUESTS_PER_SECOND = 2.0
+
+# Cache TTLs in seconds for the setlist.fm endpoints used by this module
+CACHE_TTLS = {"https://api.setlist.fm/rest/1.0/artist/": 24 * 60 * 60}
+
+
+def _get_page(
+    base_request: str,
+    page: int,
+    headers: Dict[str, str],
+    rate_limiter: TokenBucket,
+    cache: Optional[ResponseCache] = None,
+) -> dict:
+    """Fetch a single page of setlists once the rate limiter allows it.
+
+    Args:
+        base_request (str): setlists endpoint of the artist
+        page (int): page number to query
+        headers (dict): API headers
+        rate_limiter (TokenBucket): rate limiter shared by all requests
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        response (dict): the decoded JSON response
+    """
+    return get_json(f"{base_request}?p={page}", headers, cache, rate_limiter)
 
 
 def get_setlists(
-    mbid: str, headers: Dict[str, str], page_limit: Optional[int] = None
+    mbid: str,
+    headers: Dict[str, str],
+    page_limit: Optional[int] = None,
+    max_workers: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
+    cache: Optional[ResponseCache] = None,
 ) -> List[dict]:
-    """Fetch concerts from the setlist.fm API.
+    """Fetch concerts from the setlist.fm API. The first page is queried
+    to obtain the total number of pages; the remaining pages are then
+    queried either sequentially or concurrently. In both cases, the
+    request rate is only limited by the token bucket rate limiter and
+    the setlists are returned in page order.
 
     Args:
         mbid (str): Musicbrainz ID of any given artist
         headers (dict): API headers
         page_limit (optional, int): maximum number of pages to query. If
             unspecified, all pages are queried.
+        max_workers (int): number of threads used to query the remaining
+            pages concurrently. If set to 1, pages are queried one at a
+            time.
+        rate_limiter (optional, TokenBucket): rate limiter for the API
+            requests. If unspecified, a limiter set to the setlist.fm
+            API quota is used.
+        cache (optional, ResponseCache): response cache. If specified,
+            pages are served from the cache where possible.
 
     Returns:
         setlists (list): list of all concerts fetched from the API
     """
     print(f"Querying setlist information for artist mbid {mbid}.")
     base_request = f"https://api.setlist.fm/rest/1.0/artist/{mbid}/setlists"
-    more_results_available = True
-    page = 1
-    setlists = []
 
-    while more_results_available:
-        request = f"{base_request}?p={page}"
-        response = requests.get(request, headers=headers).json()
-        setlists.extend(response["setlist"])
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(SETLIST_FM_REQUESTS_PER_SECOND)
+
+    response = _get_page(base_request, 1, headers, rate_limiter, cache)
+    setlists = list(response["setlist"])
+
+    total_items = response["total"]
+    items_per_page = response["itemsPerPage"]
+    number_of_pages = math.ceil(total_items / items_per_page)
+
+    last_page = number_of_pages
+    if page_limit and page_limit < number_of_pages:
+        last_page = page_limit
+
+    remaining_pages = range(2, last_page + 1)
+
+    if max_workers > 1:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        # map() yields the responses in the order of the pages
+        responses = executor.map(
+            lambda page: _get_page(base_request, page, headers, rate_limiter, cache),
+            remaining_pages,
+        )
+    else:
+        executor = None
+        responses = (
+            _get_page(base_request, page, headers, rate_limiter, cache)
+            for page in remaining_pages
+        )
+
+    try:
+        for page, response in zip(remaining_pages, responses):
+            setlists.extend(response["setlist"])
+
+            if page % 5 == 0:
+                print(f"Page {page} of {number_of_pages} total pages queried.")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if last_page < number_of_pages:
+        print(
+            f"Page {last_page} of {number_of_pages} total pages queried. "
+            f"User-specified page limit of {page_limit} reached."
+        )
+
+    return setlists
+
+
+def harvest_setlists(
+    mbid: str,
+    headers: Dict[str, str],
+    out_path: Union[str, Path],
+    resume: bool = False,
+    rate_limiter: Optional[TokenBucket] = None,
+    cache: Optional[ResponseCache] = None,
+) -> int:
+    """Fetch concerts from the setlist.fm API and stream them to an
+    NDJSON file, one setlist per line. A checkpoint is written after
+    every page, so an interrupted harvest can be resumed without
+    querying the completed pages again. The setlists are not kept in
+    memory.
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        headers (dict): API headers
+        out_path (str or Path): path to the NDJSON output file
+        resume (bool): if True, continue after the last completed page
+            recorded in the checkpoint
+        rate_limiter (optional, TokenBucket): rate limiter for the API
+            requests. If unspecified, a limiter set to the setlist.fm
+            API quota is used.
+        cache (optional, ResponseCache): response cache
+
+    Returns:
+        page (int): number of the last completed page
+    """
+    print(f"Harvesting setlist information for artist mbid {mbid}.")
+    base_request = f"https://api.setlist.fm/rest/1.0/artist/{mbid}/setlists"
+
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(SETLIST_FM_REQUESTS_PER_SECOND)
 
-        total_items = response["total"]
-        items_per_page = response["itemsPerPage"]
-        number_of_pages = math.ceil(total_items / items_per_page)
+    harvest = NdjsonHarvest(out_path, resume)
+    page = harvest.state.get("page", 0)
+    number_of_pages = harvest.state.get("number_of_pages")
+
+    while (number_of_pages is None) or (page < number_of_pages):
+        page += 1
+        response = _get_page(base_request, page, headers, rate_limiter, cache)
+        number_of_pages = math.ceil(response["total"] / response["itemsPerPage"])
+        harvest.commit(response["setlist"], page=page, number_of_pages=number_of_pages)
 
         if page % 5 == 0:
             print(f"Page {page} of {number_of_pages} total pages queried.")
 
-        if page_limit and page >= page_limit:
-            more_results_available = False
-            print(
-                f"Page {page} of {number_of_pages} total pages queried. "
-                f"User-specified page limit of {page_limit} reached."
-            )
+    return page
+
+
+def load_setlist_store(store_path: Union[str, Path]) -> Dict[str, dict]:
+    """Load the local store of raw setlists. The store is a JSON file in
+    the same format as the output of get_setlists().
+
+    Args:
+        store_path (str or Path): path to the JSON store file
+
+    Returns:
+        store (dict): raw setlists keyed by setlist id, in the order of
+            the store file (newest first). Empty if the file does not
+            exist yet.
+    """
+    if not os.path.exists(store_path):
+        return {}
+
+    with open(store_path, "r") as store_file:
+        return {setlist["id"]: setlist for setlist in json.load(store_file)}
 
-        if page >= number_of_pages:
-            more_results_available = False
+
+def save_setlist_store(store: Dict[str, dict], store_path: Union[str, Path]) -> None:
+    """Write the local store of raw setlists to a JSON file.
+
+    Args:
+        store (dict): raw setlists keyed by setlist id
+        store_path (str or Path): path to the JSON store file
+    """
+    os.makedirs(Path(store_path).parent, exist_ok=True)
+    tmp_path = Path(f"{store_path}.tmp")
+
+    with open(tmp_path, "w") as store_file:
+        json.dump(list(store.values()), store_file, indent=4)
+
+    os.replace(tmp_path, store_path)
+
+
+def pending_store_path(store_path: Union[str, Path]) -> Path:
+    """Path of the synchronized setlist store that has not been
+    committed yet, see sync_setlists() and commit_setlist_store().
+    """
+    return Path(f"{store_path}.pending")
+
+
+def commit_setlist_store(store_path: Union[str, Path]) -> None:
+    """Replace the local store of raw setlists with the pending store
+    written by sync_setlists(changed_only=True). Call this after the app
+    data has been updated with the changed setlists, so a failed update
+    is repeated by the next synchronization.
+
+    Args:
+        store_path (str or Path): path to the JSON store file
+    """
+    if os.path.exists(pending_store_path(store_path)):
+        os.replace(pending_store_path(store_path), store_path)
+
+
+def sync_setlists(
+    mbid: str,
+    headers: Dict[str, str],
+    store_path: Union[str, Path],
+    rate_limiter: Optional[TokenBucket] = None,
+    changed_only: bool = False,
+) -> List[dict]:
+    """Incrementally update the local store of raw setlists. setlist.fm
+    returns the setlists newest first, so pages are only queried until a
+    page is reached whose setlists are all stored already and unchanged
+    (same lastUpdated value). New and edited setlists are merged into
+    the store, which is written back to disk. If only the changed
+    setlists are returned, the merged store is written to the pending
+    store (see pending_store_path()) instead: the stored setlists have
+    to stay in sync with the app data, so the store is only replaced by
+    commit_setlist_store() once the app data has been updated.
+
+    Args:
+        mbid (str): Musicbrainz ID of any given artist
+        headers (dict): API headers
+        store_path (str or Path): path to the JSON store file
+        rate_limiter (optional, TokenBucket): rate limiter for the API
+            requests. If unspecified, a limiter set to the setlist.fm
+            API quota is used.
+        changed_only (bool): if True, only the new and updated setlists
+            are returned, e.g., to update the app data incrementally
+            (see data_prep.update_app_tables())
+
+    Returns:
+        setlists (list): all setlists in the updated store (or only the
+            new and updated setlists), newest first
+    """
+    print(f"Synchronizing setlist information for artist mbid {mbid}.")
+    base_request = f"https://api.setlist.fm/rest/1.0/artist/{mbid}/setlists"
+
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(SETLIST_FM_REQUESTS_PER_SECOND)
+
+    store = load_setlist_store(store_path)
+    fetched = {}
+    page = 1
+
+    while True:
+        # Not cached: the first page has to reflect the latest changes
+        response = _get_page(base_request, page, headers, rate_limiter)
+        page_setlists = response.get("setlist", [])
+
+        changed = [
+            setlist
+            for setlist in page_setlists
+            if (setlist["id"] not in store)
+            or (store[setlist["id"]].get("lastUpdated") != setlist.get("lastUpdated"))
+        ]
+
+        for setlist in page_setlists:
+            fetched[setlist["id"]] = setlist
+
+        number_of_pages = math.ceil(response["total"] / response["itemsPerPage"])
+
+        if (not changed) or (page >= number_of_pages):
+            break
 
         page += 1
-        time.sleep(2)
 
-    return setlists
+    new_count = len([id for id in fetched if id not in store])
+    updated_count = len(
+        [
+            id
+            for id, setlist in fetched.items()
+            if id in store
+            and store[id].get("lastUpdated") != setlist.get("lastUpdated")
+        ]
+    )
+    print(
+        f"{page} of {number_of_pages} total pages queried. "
+        f"{new_count} new and {updated_count} updated setlists."
+    )
+
+    # The fetched pages are the newest part of the store
+    merged = dict(fetched)
+    for id, setlist in store.items():
+        if id not in merged:
+            merged[id] = setlist
+
+    if changed_only:
+        save_setlist_store(merged, pending_store_path(store_path))
+
+        return [
+            setlist
+            for id, setlist in fetched.items()
+            if id not in store
+            or store[id].get("lastUpdated") != setlist.get("lastUpdated")
+        ]
+
+    save_setlist_store(merged, store_path)
+
+    return list(merged.values())
 
 
 if __name__ == "__main__":
-    import json
-    import os
-    from pathlib import Path
+    import argparse
     import pprint
 
     from dotenv import load_dotenv
 
+    from harvest import iter_ndjson
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted harvest from its checkpoint",
+    )
+    args = parser.parse_args()
+
     load_dotenv()
     API_KEY = os.getenv("API_KEY")
 
-    # Test get_setlists
+    # Test harvest_setlists
     headers = {
         "x-api-key": API_KEY,
         "Accept": "application/json",
         "Accept-Languate": "en",
     }
     mbid = "ca891d65-d9b0-4258-89f7-e6ba29d83767"  # MBID for Iron Maiden
-    setlists = get_setlists(mbid, headers)
-    pprint.pp(setlists[:2])
 
     out_path = Path.cwd() / "data_prep" / "data" / "json_raw"
-    os.makedirs(out_path, exist_ok=True)
-    out_filename = "setlist_fm_setlists.json"
+    out_filename = "setlist_fm_setlists.ndjson"
+    harvest_setlists(mbid, headers, Path(out_path / out_filename), resume=args.resume)
 
-    with open(Path(out_path / out_filename), "w") as file:
-        json.dump(setlists, file, indent=4)
+    setlists = iter_ndjson(Path(out_path / out_filename))
+    pprint.pp([next(setlists), next(setlists)])
@@ -0,0 +1,354 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Multiplier of the 64-bit polynomial hashes of shingles, LSH bands and
+# setlists (FNV-1 64-bit prime)
+HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _combine(hashes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Combine 64-bit hashes with the next values (wrapping arithmetic)."""
+    with np.errstate(over="ignore"):
+        return (hashes ^ values.astype(np.uint64)) * HASH_MULTIPLIER
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """Scramble 64-bit hashes (splitmix64 finalizer), so that sums of
+    them do not collide for different sets of values.
+    """
+    hashes = hashes.astype(np.uint64)
+    with np.errstate(over="ignore"):
+        hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def minhash_signatures(
+    show_codes: np.ndarray,
+    shingles: np.ndarray,
+    show_count: int,
+    num_perm: int = 64,
+    seed: int = 0,
+) -> np.ndarray:
+    """MinHash signatures of the shingle sets of all shows. The hash
+    functions are multiply-shift hashes of the 64-bit shingle hashes.
+    The shingles are reduced per show with np.minimum.reduceat(), one
+    hash function at a time, so memory is linear in the number of
+    shingles.
+
+    Args:
+        show_codes (np.ndarray): show (0 to show_count - 1) of each
+            shingle, sorted
+        shingles (np.ndarray): 64-bit hash of each shingle
+        show_count (int): number of shows
+        num_perm (int): number of hash functions
+        seed (int): random seed of the hash functions
+
+    Returns:
+        signatures (np.ndarray): show_count x num_perm array (uint32).
+            Shows without shingles have the maximum value everywhere.
+    """
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    multipliers = multipliers * np.uint64(2) + np.uint64(1)
+    increments = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    signatures = np.full((show_count, num_perm), np.iinfo(np.uint32).max, np.uint32)
+    if len(shingles) == 0:
+        return signatures
+
+    starts = np.flatnonzero(np.r_[True, show_codes[1:] != show_codes[:-1]])
+
+    for i in range(num_perm):
+        with np.errstate(over="ignore"):
+            hashes = (shingles * multipliers[i] + increments[i]) >> np.uint64(32)
+        signatures[show_codes[starts], i] = np.minimum.reduceat(hashes, starts)
+
+    return signatures
+
+
+def lsh_clusters(
+    signatures: np.ndarray,
+    groups: np.ndarray,
+    bands: int = 32,
+    min_similarity: float = 0.5,
+    order: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Cluster shows around canonical shows with locality-sensitive
+    hashing. The signatures are split into bands, and only the
+    canonical shows are stored in the band buckets (keyed by group, so
+    shows of different groups are never compared). The shows are
+    visited in the given order: a show joins the most similar canonical
+    show sharing a bucket with it if their estimated Jaccard similarity
+    (fraction of equal signature values) is at least min_similarity,
+    otherwise it becomes the canonical show of a new cluster. Every show
+    is thus verified against the canonical show of its cluster, and
+    dissimilar setlists are not chained into one cluster through
+    intermediate shows.
+
+    Args:
+        signatures (np.ndarray): MinHash signatures, see
+            minhash_signatures()
+        groups (np.ndarray): integer group (tour) of each show
+        bands (int): number of bands; the number of hash functions must
+            be a multiple of it. With r hash functions per band, two
+            shows with a Jaccard similarity s share a bucket with
+            probability 1 - (1 - s^r)^bands.
+        min_similarity (float): minimum estimated Jaccard similarity of
+            a show to the canonical show of its cluster
+        order (optional, np.ndarray): order in which the shows are
+            visited, e.g., the most common setlists first. Defaults to
+            the show order.
+
+    Returns:
+        labels (np.ndarray): cluster label of each show (the canonical
+            show of its cluster)
+    """
+    show_count, num_perm = signatures.shape
+    rows = num_perm // bands
+    order = np.arange(show_count) if order is None else np.asarray(order)
+    rank = np.empty(show_count, dtype=np.int64)
+    rank[order] = np.arange(show_count)
+
+    band_keys = np.empty((show_count, bands), dtype=np.uint64)
+    for band in range(bands):
+        keys = groups.astype(np.uint64)
+        for column in range(band * rows, (band + 1) * rows):
+            keys = _combine(keys, signatures[:, column])
+        band_keys[:, band] = keys
+
+    labels = np.empty(show_count, dtype=np.int64)
+    band_keys = band_keys.tolist()
+    ranks = rank.tolist()
+    # Canonical shows by band and bucket
+    buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+
+    for show in order.tolist():
+        keys = band_keys[show]
+        candidates = set()
+        for bucket, key in zip(buckets, keys):
+            canonical_shows = bucket.get(key)
+            if canonical_shows:
+                candidates.update(canonical_shows)
+
+        if candidates:
+            # Ties go to the canonical show visited first
+            candidates = sorted(candidates, key=ranks.__getitem__)
+            similarity = (signatures[candidates] == signatures[show]).mean(axis=1)
+            best = int(similarity.argmax())
+
+            if similarity[best] >= min_similarity:
+                labels[show] = candidates[best]
+                continue
+
+        labels[show] = show
+        for bucket, key in zip(buckets, keys):
+            bucket.setdefault(key, []).append(show)
+
+    return labels
+
+
+def setlist_variants(
+    concerts_df: pd.DataFrame,
+    num_perm: int = 64,
+    bands: int = 32,
+    max_distance: float = 0.5,
+    min_length_ratio: float = 0.5,
+) -> pd.DataFrame:
+    """Group the shows of each tour into setlist variants and flag
+    anomalous setlists. The shingles of a show are its songs and the
+    pairs of consecutive songs of its setlist, including the start and
+    end of the setlist, so both the selection and the order of the
+    songs count: two swapped or replaced songs in an 18-song setlist
+    are a distance of about 0.3, two 16-song setlists sharing half of
+    their songs a distance of about 0.8. The shows of a tour are
+    clustered with MinHash and LSH around canonical shows (see
+    minhash_signatures() and lsh_clusters()), visiting the exact
+    setlists of the tour from the most common to the least common one,
+    which scales linearly with the number of shows. The canonical
+    setlist of a variant is thus its most common exact setlist (the
+    first show of it in case of ties). The distance of a show is the
+    estimated Jaccard distance between its shingles and those of the
+    canonical setlist, at most max_distance.
+
+    A show is flagged as an anomaly if it has no songs (the "1. nan<br>"
+    setlists of the app data), if it has fewer than min_length_ratio
+    times the songs of its canonical setlist or of the canonical setlist
+    of the tour's main variant (truncated setlists) or if it is the only
+    show of its variant in a tour with other shows, i.e., no other show
+    of the tour is within max_distance of it.
+
+    Args:
+        concerts_df (DataFrame): output of join_setlists_albums()
+        num_perm (int): number of MinHash hash functions
+        bands (int): number of LSH bands, see lsh_clusters()
+        max_distance (float): maximum distance of a show to the
+            canonical setlist of its variant
+        min_length_ratio (float): minimum number of songs of a regular
+            show relative to its canonical setlist and the canonical
+            setlist of the tour's main variant
+
+    Returns:
+        variants (DataFrame): one row per show with the columns id,
+            tour, songs (number of songs), variant (1 = variant with the
+            most shows in the tour, missing for shows without songs),
+            variant_shows (number of shows of the variant),
+            canonical_id (show with the canonical setlist), distance
+            and anomaly
+    """
+    concerts = concerts_df.drop_duplicates(subset=["id", "song_count"])
+    show_codes = pd.factorize(concerts["id"])[0]
+    shows = concerts.drop_duplicates(subset="id")
+    show_count = len(shows)
+    tour_codes = pd.factorize(shows["tour"], use_na_sentinel=False)[0]
+
+    # Songs in setlist order, encoded as integers (0 = start, end_code =
+    # end of a setlist and song_code = single song shingles)
+    songs = concerts[concerts["song_title"].notna()]
+    song_shows = show_codes[concerts["song_title"].notna().to_numpy()]
+    order = np.lexsort((songs["song_count"].to_numpy(), song_shows))
+    song_shows = song_shows[order]
+    song_codes, song_titles = pd.factorize(songs["song_title"].to_numpy()[order])
+    song_codes = song_codes + 1
+    end_code = len(song_titles) + 1
+    song_code = len(song_titles) + 2
+
+    first = np.ones(len(song_shows), dtype=bool)
+    first[1:] = song_shows[1:] != song_shows[:-1]
+    last = np.ones(len(song_shows), dtype=bool)
+    last[:-1] = first[1:]
+    previous = np.where(first, 0, np.roll(song_codes, 1))
+
+    def pair_hashes(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        return _combine(_combine(np.zeros(len(left), np.uint64), left), right)
+
+    shingles = np.concatenate(
+        [
+            pair_hashes(np.full(len(song_codes), song_code), song_codes),
+            pair_hashes(previous, song_codes),
+            pair_hashes(song_codes[last], np.full(last.sum(), end_code)),
+        ]
+    )
+    shingle_shows = np.concatenate([song_shows, song_shows, song_shows[last]])
+
+    # Exact setlist of each show: sum of the scrambled hashes of its
+    # (position, song) pairs
+    starts = np.flatnonzero(first)
+    positions = np.arange(len(song_codes)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(song_codes)])
+    )
+    setlist_hashes = np.zeros(show_count, np.uint64)
+    if len(starts):
+        setlist_hashes[song_shows[starts]] = np.add.reduceat(
+            _mix(pair_hashes(positions, song_codes)), starts
+        )
+
+    # Each exact setlist of a tour is hashed and clustered once
+    # (represented by its first show), the most common setlists first
+    song_counts = np.bincount(song_shows, minlength=show_count)
+    regular_shows = np.flatnonzero(song_counts > 0)
+    setlist_codes = pd.factorize(
+        pd.MultiIndex.from_arrays(
+            [tour_codes[regular_shows], setlist_hashes[regular_shows]]
+        )
+    )[0]
+    setlist_shows = regular_shows[np.unique(setlist_codes, return_index=True)[1]]
+
+    show_setlists = np.full(show_count, -1)
+    show_setlists[setlist_shows] = np.arange(len(setlist_shows))
+    shingle_setlists = show_setlists[shingle_shows]
+    shingle_order = np.flatnonzero(shingle_setlists >= 0)
+    shingle_order = shingle_order[
+        np.argsort(shingle_setlists[shingle_order], kind="stable")
+    ]
+
+    signatures = minhash_signatures(
+        shingle_setlists[shingle_order],
+        shingles[shingle_order],
+        len(setlist_shows),
+        num_perm=num_perm,
+    )
+    setlist_labels = lsh_clusters(
+        signatures,
+        tour_codes[setlist_shows],
+        bands=bands,
+        min_similarity=1 - max_distance,
+        order=np.argsort(-np.bincount(setlist_codes), kind="stable"),
+    )
+
+    # Cluster label of each show: its canonical show
+    labels = np.full(show_count, -1)
+    labels[regular_shows] = setlist_shows[setlist_labels[setlist_codes]]
+
+    variants = pd.DataFrame(
+        {
+            "id": shows["id"].to_numpy(dtype=object),
+            "tour": shows["tour"].to_numpy(dtype=object),
+            "tour_code": tour_codes,
+            "songs": song_counts,
+            "cluster": labels,
+        }
+    )
+    regular = variants.iloc[regular_shows]
+
+    # Variants numbered by their number of shows within the tour
+    clusters = (
+        regular.groupby("cluster")
+        .agg(tour_code=("tour_code", "first"), variant_shows=("id", "size"))
+        .reset_index()
+        .sort_values(
+            by=["tour_code", "variant_shows", "cluster"],
+            ascending=[True, False, True],
+        )
+    )
+    clusters["variant"] = clusters.groupby("tour_code").cumcount() + 1
+    clusters = clusters.set_index("cluster")
+
+    has_songs = song_counts > 0
+    cluster = variants["cluster"].where(has_songs)
+    canonical_codes = labels[has_songs]
+
+    distance = np.full(show_count, np.nan)
+    distance[has_songs] = 1 - (
+        signatures[setlist_codes] == signatures[setlist_labels[setlist_codes]]
+    ).mean(axis=1)
+
+    canonical_songs = np.zeros(show_count)
+    canonical_songs[has_songs] = song_counts[canonical_codes]
+
+    # Songs of the canonical setlist of the main variant of each tour
+    main_clusters = clusters[clusters["variant"] == 1]
+    main_songs = pd.Series(
+        song_counts[main_clusters.index.to_numpy()],
+        index=main_clusters["tour_code"],
+    )
+    canonical_songs = np.maximum(
+        canonical_songs, variants["tour_code"].map(main_songs).fillna(0).to_numpy()
+    )
+
+    variants["variant"] = cluster.map(clusters["variant"]).astype("Int64")
+    variants["variant_shows"] = cluster.map(clusters["variant_shows"]).astype("Int64")
+    variants["canonical_id"] = cluster.map(variants["id"])
+    variants["distance"] = distance.round(3)
+
+    tour_shows = variants.groupby("tour_code")["id"].transform("size")
+    variants["anomaly"] = (
+        (variants["songs"] == 0)
+        | (variants["songs"] < min_length_ratio * canonical_songs)
+        | (variants["variant_shows"].eq(1).fillna(False) & (tour_shows > 1))
+    )
+
+    return variants[
+        [
+            "id",
+            "tour",
+            "songs",
+            "variant",
+            "variant_shows",
+            "canonical_id",
+            "distance",
+            "anomaly",
+        ]
+    ]
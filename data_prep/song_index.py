@@ -0,0 +1,219 @@
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# One entry per performance: concert date, concert number (index into
+# the chronologically sorted concerts) and setlist position
+ENTRY_DTYPE = np.dtype(
+    [("date", "datetime64[D]"), ("concert", "<i4"), ("position", "<i2")]
+)
+
+
+@dataclass
+class Performance:
+    """A single performance of a song."""
+
+    date: np.datetime64
+    concert_id: str
+    position: int
+
+
+def _as_dates(dates: pd.Series) -> np.ndarray:
+    """Convert concert dates (datetime64 or dd-mm-yyyy strings) to
+    datetime64[D]."""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format="%d-%m-%Y")
+    return dates.to_numpy().astype("datetime64[D]")
+
+
+def build_song_index(
+    concerts_df: pd.DataFrame, index_dir: Union[str, Path]
+) -> "SongIndex":
+    """Build an inverted index from song_id to the performances of each
+    song and save it as NumPy arrays (.npy) that can be memory-mapped:
+
+    - concert_ids.npy, concert_dates.npy: all concerts (also those
+      without album songs) sorted by date
+    - entries.npy: the performances sorted by song_id, date and setlist
+      position (see ENTRY_DTYPE)
+    - offsets.npy: the performances of song_id s are
+      entries[offsets[s]:offsets[s + 1]]
+    - titles.npy: the song title of each song_id
+
+    An existing index at index_dir is replaced.
+
+    Args:
+        concerts_df (DataFrame): output of join_setlists_albums()
+        index_dir (str or Path): directory of the index files
+
+    Returns:
+        index (SongIndex): the memory-mapped index
+    """
+    concerts = concerts_df.drop_duplicates(subset=["id", "song_count"])
+
+    # Concert numbers in chronological order
+    shows = concerts.drop_duplicates(subset="id")
+    show_dates = _as_dates(shows["date"])
+    show_order = np.argsort(show_dates, kind="stable")
+    concert_ids = shows["id"].astype(str).to_numpy()[show_order]
+    concert_dates = show_dates[show_order]
+
+    performances = concerts[concerts["song_id"].notna()]
+    song_ids = performances["song_id"].to_numpy(dtype=np.int64)
+    song_count = int(song_ids.max()) + 1 if len(song_ids) else 0
+
+    entries = np.empty(len(performances), dtype=ENTRY_DTYPE)
+    entries["concert"] = pd.Index(concert_ids).get_indexer(
+        performances["id"].astype(str)
+    )
+    entries["date"] = concert_dates[entries["concert"]]
+    entries["position"] = performances["song_count"].to_numpy(dtype=np.int16)
+
+    order = np.lexsort((entries["position"], entries["concert"], song_ids))
+    entries = entries[order]
+    offsets = np.searchsorted(song_ids[order], np.arange(song_count + 1))
+
+    titles = np.full(song_count, "", dtype=object)
+    titles[song_ids] = performances["song_title"].to_numpy(dtype=object)
+
+    # Write the new index next to the old one and swap the directories
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(f"{index_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(tmp_dir / "concert_ids.npy", concert_ids.astype(str))
+    np.save(tmp_dir / "concert_dates.npy", concert_dates)
+    np.save(tmp_dir / "entries.npy", entries)
+    np.save(tmp_dir / "offsets.npy", offsets.astype(np.int64))
+    np.save(tmp_dir / "titles.npy", titles.astype(str))
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+    print(
+        f"Song index with {len(entries)} performances of {len(offsets) - 1} "
+        f"songs in {len(concert_ids)} concerts written to {index_dir.name}."
+    )
+
+    return SongIndex(index_dir)
+
+
+class SongIndex:
+    """Query API of the song index created by build_song_index(). The
+    arrays are memory-mapped, so a query only reads the performances of
+    the queried song (and the song titles) from disk.
+
+    Songs are identified by their song_id or their harmonized title.
+
+    Args:
+        index_dir (str or Path): directory of the index files
+    """
+
+    def __init__(self, index_dir: Union[str, Path]) -> None:
+        index_dir = Path(index_dir)
+
+        def load(name: str) -> np.ndarray:
+            return np.load(index_dir / f"{name}.npy", mmap_mode="r")
+
+        self.concert_ids = load("concert_ids")
+        self.concert_dates = load("concert_dates")
+        self.entries = load("entries")
+        self.offsets = load("offsets")
+        self.titles = load("titles")
+        self._song_ids = None
+
+    def song_id(self, song: Union[int, str]) -> int:
+        """Look up the song_id of a song title (song_ids are returned
+        unchanged). Raises a KeyError for unknown songs.
+        """
+        if isinstance(song, (int, np.integer)):
+            if not 0 <= song < len(self.offsets) - 1:
+                raise KeyError(song)
+            return int(song)
+
+        if self._song_ids is None:
+            self._song_ids = {str(title): id for id, title in enumerate(self.titles)}
+
+        return self._song_ids[song]
+
+    def _entries(self, song: Union[int, str]) -> np.ndarray:
+        song_id = self.song_id(song)
+        return self.entries[self.offsets[song_id] : self.offsets[song_id + 1]]
+
+    def _performance(self, entry) -> Performance:
+        return Performance(
+            entry["date"],
+            str(self.concert_ids[entry["concert"]]),
+            int(entry["position"]),
+        )
+
+    def count(self, song: Union[int, str]) -> int:
+        """Number of performances of a song."""
+        song_id = self.song_id(song)
+        return int(self.offsets[song_id + 1] - self.offsets[song_id])
+
+    def first(self, song: Union[int, str]) -> Optional[Performance]:
+        """First performance of a song (None if it was never played)."""
+        entries = self._entries(song)
+        return self._performance(entries[0]) if len(entries) else None
+
+    def last(self, song: Union[int, str]) -> Optional[Performance]:
+        """Last performance of a song (None if it was never played)."""
+        entries = self._entries(song)
+        return self._performance(entries[-1]) if len(entries) else None
+
+    def performances(self, song: Union[int, str]) -> pd.DataFrame:
+        """All performances of a song with the columns date, id (setlist
+        id of the concert) and position, sorted by date.
+        """
+        entries = np.asarray(self._entries(song))
+
+        return pd.DataFrame(
+            {
+                "date": entries["date"],
+                "id": self.concert_ids[entries["concert"]],
+                "position": entries["position"],
+            }
+        )
+
+    def shows_since(
+        self, song: Union[int, str], date: Optional[np.datetime64] = None
+    ) -> Optional[int]:
+        """Number of concerts since the last performance of a song.
+
+        Args:
+            song (int or str): song_id or title
+            date (optional, datetime64): count the concerts up to and
+                including this date. Defaults to all concerts.
+
+        Returns:
+            shows (int or None): number of concerts after the last
+                performance (up to date), None if the song was not
+                played (before date)
+        """
+        entries = self._entries(song)
+
+        if date is None:
+            total = len(self.concert_dates)
+        else:
+            date = np.datetime64(date, "D")
+            total = int(np.searchsorted(self.concert_dates, date, side="right"))
+            entries = entries[: np.searchsorted(entries["date"], date, side="right")]
+
+        if len(entries) == 0:
+            return None
+
+        return total - int(entries[-1]["concert"]) - 1
+
+    def gaps(self, song: Union[int, str]) -> np.ndarray:
+        """Number of concerts between consecutive performances of a song
+        (0 = played at consecutive concerts).
+        """
+        concerts = self._entries(song)["concert"]
+        return np.diff(concerts) - 1
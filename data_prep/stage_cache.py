@@ -0,0 +1,264 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+from instrumentation import Instrumentation, disabled
+
+
+def hash_data(data: Any) -> str:
+    """Content hash of a pipeline input: DataFrames are hashed by their
+    columns, dtypes and values, all other data (e.g., the raw API data)
+    by its JSON representation.
+
+    Args:
+        data: DataFrame or JSON-serializable data
+
+    Returns:
+        hash (str): hex digest of the content
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(data.columns)).encode())
+        digest.update(repr(list(data.dtypes.astype(str))).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    else:
+        digest.update(json.dumps(data, sort_keys=True, default=str).encode())
+
+    return digest.hexdigest()
+
+
+def code_version(func: Callable) -> str:
+    """Hash of the source file of a function and of all local modules
+    (same directory) it imports from, directly or through other local
+    modules, so a stage is re-run when the function or one of its
+    helpers changes.
+    """
+    source_path = Path(inspect.getsourcefile(func))
+    source_paths = {source_path}
+    modules = [inspect.getmodule(func)]
+
+    # Follow the imports of the local modules (transitive closure)
+    while modules:
+        module = modules.pop()
+
+        for value in vars(module).values():
+            try:
+                path = inspect.getsourcefile(value)
+            except TypeError:
+                continue
+
+            if path is None or Path(path).parent != source_path.parent:
+                continue
+
+            if Path(path) not in source_paths:
+                source_paths.add(Path(path))
+                modules.append(inspect.getmodule(value))
+
+    digest = hashlib.sha256()
+    for path in sorted(source_paths):
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
+class StageCache:
+    """On-disk cache for the outputs of pipeline stages, stored as pickle
+    files keyed by the stage key (see Stage.key()). The least recently
+    used entries are evicted once the cache exceeds its size budget.
+
+    Args:
+        cache_dir (str or Path): directory in which the outputs are
+            stored
+        max_bytes (int): size budget of the cache directory in bytes
+    """
+
+    def __init__(
+        self, cache_dir: Union[str, Path], max_bytes: int = 512 * 1024 * 1024
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Sizes of all entries on disk, used for the size-based eviction
+        self._sizes = {
+            path.name: path.stat().st_size for path in self.cache_dir.glob("*.pkl")
+        }
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def load(self, key: str) -> Any:
+        """Load a stage output and mark it as recently used.
+
+        Args:
+            key (str): stage key
+
+        Returns:
+            output: the cached stage output
+        """
+        path = self._path(key)
+
+        with open(path, "rb") as entry_file:
+            output = pickle.load(entry_file)
+
+        os.utime(path)
+        return output
+
+    def store(self, key: str, output: Any) -> None:
+        """Store a stage output and evict old entries if necessary.
+
+        Args:
+            key (str): stage key
+            output: the stage output
+        """
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+
+        with open(tmp_path, "wb") as entry_file:
+            pickle.dump(output, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_path, path)
+        self._sizes[path.name] = path.stat().st_size
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache is
+        within its size budget.
+        """
+        total_bytes = sum(self._sizes.values())
+
+        if total_bytes <= self.max_bytes:
+            return
+
+        def last_used(name: str) -> float:
+            try:
+                return (self.cache_dir / name).stat().st_mtime
+            except FileNotFoundError:
+                return 0.0
+
+        for name in sorted(self._sizes, key=last_used):
+            if total_bytes <= self.max_bytes:
+                break
+
+            total_bytes -= self._sizes.pop(name)
+            Path(self.cache_dir / name).unlink(missing_ok=True)
+
+
+@dataclass
+class Stage:
+    """A named pipeline stage: func is called with the values of the
+    named inputs (pipeline inputs or outputs of other stages). A stage
+    that returns a tuple can name each element with outputs; otherwise
+    its output is available under the stage name.
+    """
+
+    name: str
+    func: Callable
+    inputs: List[str]
+    outputs: List[str] = field(default_factory=list)
+
+    def key(self, input_keys: List[str]) -> str:
+        """Cache key of the stage: hash of its name, code version and
+        the keys of its inputs.
+        """
+        digest = hashlib.sha256(self.name.encode())
+        digest.update(code_version(self.func).encode())
+
+        for input_key in input_keys:
+            digest.update(input_key.encode())
+
+        return digest.hexdigest()
+
+
+def run_stages(
+    stages: List[Stage],
+    inputs: Dict[str, Any],
+    targets: List[str],
+    cache: Optional[StageCache] = None,
+    instrumentation: Optional[Instrumentation] = None,
+) -> Dict[str, Any]:
+    """Run a DAG of stages and return the requested outputs. The key of
+    a stage is derived from the content hashes of the pipeline inputs
+    and the keys of the upstream stages, so a change of an input only
+    invalidates the stages downstream of it. With a cache, a stage whose
+    key is cached is skipped, and its output is only loaded if it is
+    requested or needed to run a downstream stage.
+
+    Args:
+        stages (list): the stages, in any order
+        inputs (dict): the pipeline inputs by name
+        targets (list): names of the outputs to return
+        cache (optional, StageCache): stage output cache. If None, all
+            required stages are run.
+        instrumentation (optional, Instrumentation): records the metrics
+            of each stage run and cache load
+
+    Returns:
+        outputs (dict): the requested outputs by name
+    """
+    instrumentation = instrumentation or disabled
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs or [stage.name]:
+            producers[output] = stage
+
+    keys: Dict[str, str] = {}
+    values: Dict[str, Any] = {}
+
+    if cache is not None:
+        keys.update({name: hash_data(value) for name, value in inputs.items()})
+
+    def stage_key(stage: Stage) -> str:
+        if stage.name not in keys:
+            keys[stage.name] = stage.key([value_key(name) for name in stage.inputs])
+        return keys[stage.name]
+
+    def value_key(name: str) -> str:
+        if name in inputs:
+            return keys[name]
+        return stage_key(producers[name])
+
+    def resolve(name: str) -> Any:
+        if name in inputs:
+            return inputs[name]
+        if name in values:
+            return values[name]
+
+        stage = producers[name]
+        key = stage_key(stage) if cache is not None else None
+
+        if key is not None and key in cache:
+            output = instrumentation.run(stage.name, cache.load, key, cached=True)
+            print(f"Stage {stage.name}: loaded from cache.")
+        else:
+            args = [resolve(input) for input in stage.inputs]
+            start = time.perf_counter()
+            output = instrumentation.run(stage.name, stage.func, *args)
+            print(f"Stage {stage.name}: ran in {time.perf_counter() - start:.2f} s.")
+
+            if key is not None:
+                cache.store(key, output)
+
+        if stage.outputs:
+            values.update(zip(stage.outputs, output))
+        else:
+            values[stage.name] = output
+
+        return values[name]
+
+    return {name: resolve(name) for name in targets}
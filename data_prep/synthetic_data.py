@@ -0,0 +1,244 @@
+import random
+from typing import Dict, List, Optional
+
+# Number of shows in the setlist.fm snapshot of the app data, the base
+# size of the generated data
+SNAPSHOT_SHOW_COUNT = 2585
+
+# Cities as (name, state code, country, latitude, longitude)
+CITIES = [
+    ("London", None, "United Kingdom", 51.5085, -0.1257),
+    ("Paris", None, "France", 48.8534, 2.3488),
+    ("Berlin", None, "Germany", 52.5244, 13.4105),
+    ("São Paulo", None, "Brazil", -23.5475, -46.6361),
+    ("Tokyo", None, "Japan", 35.6895, 139.6917),
+    ("Helsinki", None, "Finland", 60.1695, 24.9354),
+    ("New York", "NY", "United States", 40.7143, -74.006),
+    ("Los Angeles", "CA", "United States", 34.0522, -118.2437),
+    ("Austin", "TX", "United States", 30.2672, -97.7431),
+    ("Worcester", "MA", "United States", 42.2626, -71.8023),
+]
+
+VENUES = ["Arena", "Stadium", "Hall", "Club", "Festival Grounds", "Theatre"]
+
+# Non-album setlist items: intros played from tape and covers
+INTROS = ["Churchill's Speech", '"633 Squadron" Theme', "Doctor Doctor"]
+COVERS = [("Cross-Eyed Mary", "Jethro Tull"), ("Doctor Doctor", "UFO")]
+
+# Words of the generated song titles
+TITLE_WORDS = (
+    "Aces Angel Beast Blood Brave Children Damned Dance Dark Dawn Death "
+    "Dream Eagle Empire Fear Fire Flight Frontier Ghost Heaven Hills Icarus "
+    "Legacy Machine Mother Night Number Powerslave Prophecy Raven Rime Run "
+    "Sign Soldier Stranger Sun Thunder Time Trooper Wicker Wings Years"
+).split()
+
+# Bonus tracks of releases that the album cleaning has to remove
+JUNK_TRACKS = ["Making of", "Video", "Live at Donington", "2015 Remaster", "日本語"]
+
+
+def generate_catalogue(
+    albums: int = 17, songs_per_album: int = 10, seed: int = 0
+) -> Dict[str, List[str]]:
+    """Generate the studio albums and songs of a synthetic artist. Song
+    titles are unique combinations of TITLE_WORDS.
+
+    Args:
+        albums (int): number of studio albums
+        songs_per_album (int): average number of songs per album
+        seed (int): random seed
+
+    Returns:
+        catalogue (dict): song names by album name
+    """
+    rnd = random.Random(seed)
+    titles = set()
+    catalogue = {}
+
+    for album in range(albums):
+        songs = []
+
+        for _ in range(max(1, songs_per_album + rnd.randint(-2, 2))):
+            title = None
+            while title is None or title in titles:
+                words = rnd.sample(TITLE_WORDS, rnd.randint(1, 3))
+                title = (
+                    " of the ".join(words) if rnd.random() < 0.3 else " ".join(words)
+                )
+
+            titles.add(title)
+            songs.append(title)
+
+        catalogue[f"Album {album + 1}"] = songs
+
+    return catalogue
+
+
+def generate_releases(
+    catalogue: Dict[str, List[str]], releases_per_album: int = 3, seed: int = 0
+) -> List[Dict]:
+    """Generate Musicbrainz-shaped releases (as returned by
+    musicbrainz.get_songs_batched()) for a catalogue: several releases
+    per studio album, some with bonus tracks, plus live albums and
+    compilations with secondary release group types.
+
+    Args:
+        catalogue (dict): song names by album name, see
+            generate_catalogue()
+        releases_per_album (int): number of releases per studio album
+        seed (int): random seed
+
+    Returns:
+        releases (list): the releases including their tracks
+    """
+    rnd = random.Random(seed)
+    all_songs = [song for songs in catalogue.values() for song in songs]
+    release_groups = [(album, songs, []) for album, songs in catalogue.items()]
+
+    # Live albums and compilations, to be filtered by the album cleaning
+    for index in range(max(1, len(catalogue) // 3)):
+        songs = rnd.sample(all_songs, min(len(all_songs), 12))
+        release_groups.append((f"Live Album {index + 1}", songs, ["Live"]))
+        release_groups.append((f"Best of {index + 1}", songs, ["Compilation"]))
+
+    releases = []
+
+    for group_index, (title, songs, secondary_types) in enumerate(release_groups):
+        release_group = {
+            "id": f"rg-{group_index}",
+            "title": title,
+            "primary-type": "Album",
+            "secondary-types": secondary_types,
+        }
+
+        for release_index in range(releases_per_album):
+            tracks = list(songs)
+            if rnd.random() < 0.5:
+                tracks += rnd.sample(JUNK_TRACKS, rnd.randint(1, len(JUNK_TRACKS)))
+
+            # Reissues are split into two discs
+            discs = [tracks] if rnd.random() < 0.7 else [tracks[::2], tracks[1::2]]
+
+            releases.append(
+                {
+                    "id": f"release-{group_index}-{release_index}",
+                    "title": title,
+                    "status": "Official",
+                    "release-group": release_group,
+                    "media": [
+                        {
+                            "position": disc_index + 1,
+                            "tracks": [
+                                {"position": position + 1, "title": track}
+                                for position, track in enumerate(disc)
+                            ],
+                        }
+                        for disc_index, disc in enumerate(discs)
+                    ],
+                }
+            )
+
+    return releases
+
+
+def generate_setlists(
+    shows: int,
+    catalogue: Dict[str, List[str]],
+    tours: int = 20,
+    seed: int = 0,
+) -> List[Dict]:
+    """Generate setlist.fm-shaped setlists (as returned by
+    setlist_fm.get_setlists()) with varying setlist lengths, encores,
+    songs from tape and covers. Some shows have no tour or no setlist.
+
+    Args:
+        shows (int): number of shows
+        catalogue (dict): song names by album name, see
+            generate_catalogue()
+        tours (int): number of tours
+        seed (int): random seed
+
+    Returns:
+        setlists (list): the setlists
+    """
+    rnd = random.Random(seed)
+    all_songs = [song for songs in catalogue.values() for song in songs]
+    setlists = []
+
+    for show in range(shows):
+        city_id = rnd.randrange(len(CITIES))
+        name, state_code, country, latitude, longitude = CITIES[city_id]
+        city = {
+            "id": str(city_id),
+            "name": name,
+            "coords": {"lat": latitude, "long": longitude},
+            "country": {"name": country},
+        }
+        if state_code is not None:
+            city["stateCode"] = state_code
+
+        sets = []
+
+        # A few shows are announced without a setlist
+        if rnd.random() > 0.03:
+            setlist_songs = rnd.sample(
+                all_songs, min(len(all_songs), rnd.randint(5, 18))
+            )
+            main_set = [{"name": rnd.choice(INTROS), "tape": True}]
+            main_set += [{"name": song} for song in setlist_songs]
+
+            if rnd.random() < 0.05:
+                cover, artist = rnd.choice(COVERS)
+                main_set.append({"name": cover, "cover": {"name": artist}})
+
+            sets.append({"song": main_set})
+
+            for encore in range(1, rnd.choice([0, 1, 1, 2]) + 1):
+                sets.append(
+                    {
+                        "encore": encore,
+                        "song": [
+                            {"name": song}
+                            for song in rnd.sample(all_songs, rnd.randint(1, 3))
+                        ],
+                    }
+                )
+
+        setlist = {
+            "id": f"{show:08x}",
+            "eventDate": f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-"
+            f"{rnd.randint(1980, 2024)}",
+            "venue": {"name": f"{name} {rnd.choice(VENUES)}", "city": city},
+            "sets": {"set": sets},
+        }
+
+        if rnd.random() > 0.05:
+            setlist["tour"] = {"name": f"Tour {rnd.randint(1, tours)}"}
+
+        setlists.append(setlist)
+
+    return setlists
+
+
+def generate_artist_data(
+    factor: float = 1, seed: int = 0, shows: Optional[int] = None
+) -> Dict[str, List[Dict]]:
+    """Generate the raw setlists and releases of a synthetic artist at a
+    multiple of the snapshot size.
+
+    Args:
+        factor (float): scaling factor of the number of shows
+        seed (int): random seed
+        shows (optional, int): number of shows at factor 1. Defaults to
+            SNAPSHOT_SHOW_COUNT.
+
+    Returns:
+        data (dict): the raw "setlists" and "songs" (releases)
+    """
+    catalogue = generate_catalogue(seed=seed)
+    shows = int((shows or SNAPSHOT_SHOW_COUNT) * factor)
+
+    return {
+        "setlists": generate_setlists(shows, catalogue, seed=seed),
+        "songs": generate_releases(catalogue, seed=seed),
+    }
@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# The pipeline modules are imported by their file name from data_prep/
+DATA_PREP_PATH = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DATA_PREP_PATH))
+
+from run_data_pipeline import TRANSFORM_STAGES  # noqa: E402
+from stage_cache import run_stages  # noqa: E402
+from synthetic_data import generate_artist_data  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def artist_data():
+    """Raw setlists and releases of a synthetic artist (517 shows)."""
+    return generate_artist_data(factor=0.2)
+
+
+@pytest.fixture(scope="session")
+def missing_tour_data():
+    return pd.read_csv(DATA_PREP_PATH / "data" / "missing_tour_data.csv")
+
+
+@pytest.fixture(scope="session")
+def join_outputs(artist_data, missing_tour_data):
+    return run_stages(
+        TRANSFORM_STAGES,
+        {
+            "setlists": artist_data["setlists"],
+            "songs": artist_data["songs"],
+            "missing_tour_data": missing_tour_data,
+        },
+        ["join_setlists_albums", "song_dimension"],
+    )
+
+
+@pytest.fixture(scope="session")
+def concerts(join_outputs):
+    """Song-level concerts data (output of join_setlists_albums()) of the
+    synthetic artist.
+    """
+    return join_outputs["join_setlists_albums"]
+
+
+@pytest.fixture(scope="session")
+def song_dimension(join_outputs):
+    """Song dimension (see build_song_dimension()) of the synthetic
+    artist.
+    """
+    return join_outputs["song_dimension"]
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from app_export import read_app_data, write_app_data
+
+
+def test_read_app_data_round_trip(tmp_path):
+    app_df = pd.DataFrame(
+        {
+            "tour": ["Tour 15", "1990"],
+            "latitude": [50.348992592592595, None],
+            "n": [27, 3],
+        }
+    )
+
+    write_app_data({"app_table": app_df}, tmp_path, parquet=False)
+    read_df = read_app_data(tmp_path, ["app_table"])["app_table"]
+
+    assert read_df["tour"].tolist() == ["Tour 15", "1990"]
+    assert read_df["latitude"].iloc[0] == 50.348992592592595
+    assert read_df["latitude"].isna().iloc[1]
+    assert read_df["n"].tolist() == [27, 3]
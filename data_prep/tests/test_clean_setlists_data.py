@@ -0,0 +1,29 @@
+import json
+
+from clean_setlists_data import clean_setlists_chunked, clean_setlists_data
+
+
+def test_clean_setlists_chunked_matches_full_cleaning(
+    artist_data, missing_tour_data, tmp_path
+):
+    setlists = artist_data["setlists"][:60]
+    # Chunks of two shows, several of them without a US show
+    assert any(
+        all(
+            setlist["venue"]["city"]["country"]["name"] != "United States"
+            for setlist in setlists[start : start + 2]
+        )
+        for start in range(0, len(setlists), 2)
+    )
+
+    raw_path = tmp_path / "setlists.json"
+    raw_path.write_text(json.dumps(setlists))
+
+    rows = clean_setlists_chunked(
+        raw_path, missing_tour_data, tmp_path / "chunked.csv", chunk_size=2
+    )
+    full = clean_setlists_data(setlists, missing_tour_data, verbose=False)
+    full.to_csv(tmp_path / "full.csv", index=False, date_format="%d-%m-%Y")
+
+    assert rows == len(full)
+    assert (tmp_path / "chunked.csv").read_text() == (tmp_path / "full.csv").read_text()
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from concert_db import build_concert_db, get_song_performances
+from song_index import SongIndex, build_song_index
+
+
+def test_song_ids_match_song_dimension(concerts, song_dimension, tmp_path):
+    connection = build_concert_db(concerts, song_dimension, tmp_path / "db.sqlite")
+    songs = pd.read_sql_query(
+        "SELECT song_id, title, album_id FROM song", connection, index_col="song_id"
+    )
+
+    # Album songs keep their song_id, other titles are numbered after them
+    album_songs = songs.loc[song_dimension["song_id"]]
+    assert album_songs["title"].tolist() == song_dimension["song_name"].tolist()
+    assert album_songs["album_id"].notna().all()
+    other_titles = songs.drop(index=song_dimension["song_id"])
+    assert other_titles.index.min() > song_dimension["song_id"].max()
+    assert other_titles["album_id"].isna().all()
+
+    entries = pd.read_sql_query(
+        "SELECT concert_id, position, song_id FROM setlist_entry", connection
+    )
+    assert len(entries) == concerts["song_title"].notna().sum()
+
+    played = concerts.dropna(subset="song_id")
+    build_song_index(concerts, tmp_path / "song_index")
+    index = SongIndex(tmp_path / "song_index")
+    for song_id, title in (
+        played[["song_id", "song_title"]].drop_duplicates().values[:20]
+    ):
+        assert songs.loc[song_id, "title"] == title
+        assert index.song_id(title) == song_id
+        assert len(get_song_performances(connection, title)) == index.count(title)
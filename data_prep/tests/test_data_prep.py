@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks import iterrows_concatenate_setlists
+from data_prep import concatenate_setlists
+
+
+def setlist_rows(concerts: pd.DataFrame) -> pd.DataFrame:
+    """Input of concatenate_setlists() as built by prepare_setlists()."""
+    return concerts.assign(
+        id=concerts["id"].astype(str),
+        song_title=concerts["song_count"].astype(str)
+        + ". "
+        + concerts["song_title"].astype(str),
+    )[["id", "song_title", "encore"]]
+
+
+def assert_same_setlists(actual: pd.DataFrame, expected: pd.DataFrame) -> None:
+    actual = actual.set_index("id")["song_title"].astype(str).sort_index()
+    expected = expected.set_index("id")["song_title"].astype(str).sort_index()
+    pd.testing.assert_series_equal(actual, expected, check_index_type=False)
+
+
+def test_concatenate_setlists_matches_reference(concerts):
+    rows = setlist_rows(concerts)
+
+    assert_same_setlists(
+        concatenate_setlists(rows), iterrows_concatenate_setlists(rows)
+    )
+
+
+def test_concatenate_setlists_encore_headers():
+    rows = pd.DataFrame(
+        {
+            "id": ["a", "a", "a", "a", "a", "b"],
+            "song_title": ["1. Intro", "2. Aces", "3. Run", "4. Sun", None, "1. X"],
+            "encore": [np.nan, np.nan, 1, 1, 2, np.nan],
+        }
+    )
+
+    setlists = concatenate_setlists(rows).set_index("id")["song_title"]
+
+    assert setlists["a"] == (
+        "1. Intro<br>2. Aces<br><b>Encore 1:</b><br>3. Run<br>4. Sun<br>"
+        "<b>Encore 2:</b><br><br>"
+    )
+    assert setlists["b"] == "1. X<br>"
+    assert_same_setlists(
+        concatenate_setlists(rows), iterrows_concatenate_setlists(rows)
+    )
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from harmonize_songs import harmonize_song_titles
+
+ALBUMS = pd.DataFrame(
+    {
+        "album_name": ["Piece of Mind", "Piece of Mind"],
+        "song_name": ["Flight of Icarus", "I’ve Got the Fire"],
+    }
+)
+
+
+def setlists_frame(cover=None, from_tape=None) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "song_title": ["Flight Of Icarus", "I Got the Fire", "I Got the Fire"],
+            "cover": [None, cover, cover],
+            "from_tape": pd.array([None, from_tape, from_tape], dtype="boolean"),
+        }
+    )
+
+
+def test_similar_title_is_fuzzy_matched():
+    setlists, albums, mapping = harmonize_song_titles(setlists_frame(), ALBUMS)
+
+    assert setlists["song_title"].tolist() == [
+        "Flight Of Icarus",
+        "I’ve Got the Fire",
+        "I’ve Got the Fire",
+    ]
+    assert mapping["method"].tolist().count("fuzzy") == 1
+
+
+def test_covers_and_tapes_are_not_fuzzy_matched():
+    for setlists_df in [
+        setlists_frame(cover="Montrose"),
+        setlists_frame(from_tape=True),
+    ]:
+        setlists, albums, mapping = harmonize_song_titles(setlists_df, ALBUMS)
+
+        assert setlists["song_title"].tolist() == [
+            "Flight Of Icarus",
+            "I Got the Fire",
+            "I Got the Fire",
+        ]
+        assert albums["song_name"].tolist() == ["Flight Of Icarus", "I’ve Got the Fire"]
+        assert "fuzzy" not in mapping["method"].tolist()
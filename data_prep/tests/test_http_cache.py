@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import http_cache
+from http_cache import ResponseCache
+from http_client import HttpClient
+
+
+class StubApi(BaseHTTPRequestHandler):
+    """Stub JSON API: serves the resources of the server with their ETag
+    and Last-Modified headers and answers matching conditional requests
+    with 304. Every request is logged as (path, status, headers).
+    """
+
+    def do_GET(self) -> None:
+        resource = self.server.resources.get(self.path)
+
+        if resource is None:
+            status = 404
+        elif self._not_modified(resource):
+            status = 304
+        else:
+            status = 200
+
+        self.server.requests.append((self.path, status, dict(self.headers)))
+        self.send_response(status)
+
+        if status == 200:
+            body = json.dumps(resource["body"]).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if resource.get("etag"):
+                self.send_header("ETag", resource["etag"])
+            if resource.get("last_modified"):
+                self.send_header("Last-Modified", resource["last_modified"])
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _not_modified(self, resource: dict) -> bool:
+        etag = resource.get("etag")
+        last_modified = resource.get("last_modified")
+
+        if etag and self.headers.get("If-None-Match") == etag:
+            return True
+        return bool(
+            last_modified and self.headers.get("If-Modified-Since") == last_modified
+        )
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubApi)
+    server.resources = {}
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    return HttpClient(max_retries=0, timeout=5)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake clock of the cache, advanced by setting clock.now."""
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(http_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_fresh_entry_is_served_without_request(api, client, tmp_path):
+    api.resources["/setlists"] = {"body": {"page": 1}, "etag": '"v1"'}
+    cache = ResponseCache(tmp_path, default_ttl=3600)
+
+    assert cache.get_json(f"{api.url}/setlists", client=client) == {"page": 1}
+    assert cache.get_json(f"{api.url}/setlists", client=client) == {"page": 1}
+    assert [status for _, status, _ in api.requests] == [200]
+
+
+def test_stale_entry_is_revalidated_with_etag(api, client, clock, tmp_path):
+    api.resources["/setlists"] = {"body": {"page": 1}, "etag": '"v1"'}
+    cache = ResponseCache(tmp_path, default_ttl=60)
+
+    cache.get_json(f"{api.url}/setlists", client=client)
+    clock.now += 61
+
+    assert cache.get_json(f"{api.url}/setlists", client=client) == {"page": 1}
+    assert [status for _, status, _ in api.requests] == [200, 304]
+    assert api.requests[1][2]["If-None-Match"] == '"v1"'
+
+    # A 304 renews the entry
+    clock.now += 30
+    cache.get_json(f"{api.url}/setlists", client=client)
+    assert len(api.requests) == 2
+
+
+def test_stale_entry_is_revalidated_with_last_modified(api, client, clock, tmp_path):
+    last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    api.resources["/release"] = {"body": {"id": 1}, "last_modified": last_modified}
+    cache = ResponseCache(tmp_path, default_ttl=60)
+
+    cache.get_json(f"{api.url}/release", client=client)
+    clock.now += 61
+
+    assert cache.get_json(f"{api.url}/release", client=client) == {"id": 1}
+    assert [status for _, status, _ in api.requests] == [200, 304]
+    assert api.requests[1][2]["If-Modified-Since"] == last_modified
+    assert "If-None-Match" not in api.requests[1][2]
+
+
+def test_changed_resource_is_downloaded_again(api, client, clock, tmp_path):
+    api.resources["/setlists"] = {"body": {"page": 1}, "etag": '"v1"'}
+    cache = ResponseCache(tmp_path, default_ttl=60)
+
+    cache.get_json(f"{api.url}/setlists", client=client)
+    api.resources["/setlists"] = {"body": {"page": 2}, "etag": '"v2"'}
+    clock.now += 61
+
+    assert cache.get_json(f"{api.url}/setlists", client=client) == {"page": 2}
+    clock.now += 61
+    cache.get_json(f"{api.url}/setlists", client=client)
+
+    assert [status for _, status, _ in api.requests] == [200, 200, 304]
+    assert api.requests[2][2]["If-None-Match"] == '"v2"'
+
+
+def test_ttl_expiry_by_url_prefix(api, client, clock, tmp_path):
+    api.resources["/search/setlists"] = {"body": [1], "etag": '"a"'}
+    api.resources["/release/1"] = {"body": [2], "etag": '"b"'}
+    cache = ResponseCache(tmp_path, ttls={f"{api.url}/search": 10}, default_ttl=1000)
+    assert cache.ttl_for(f"{api.url}/search/setlists") == 10
+    assert cache.ttl_for(f"{api.url}/release/1") == 1000
+
+    for path in ["/search/setlists", "/release/1"]:
+        cache.get_json(f"{api.url}{path}", client=client)
+
+    clock.now += 5
+    for path in ["/search/setlists", "/release/1"]:
+        cache.get_json(f"{api.url}{path}", client=client)
+    assert len(api.requests) == 2
+
+    clock.now += 10
+    for path in ["/search/setlists", "/release/1"]:
+        cache.get_json(f"{api.url}{path}", client=client)
+    assert [(path, status) for path, status, _ in api.requests[2:]] == [
+        ("/search/setlists", 304)
+    ]
+
+
+def test_least_recently_used_entries_are_evicted(api, client, tmp_path):
+    for name in "abc":
+        api.resources[f"/{name}"] = {"body": {"name": name * 100}, "etag": name}
+    cache = ResponseCache(tmp_path, default_ttl=3600)
+    urls = {name: f"{api.url}/{name}" for name in "abc"}
+
+    cache.get_json(urls["a"], client=client)
+    cache.get_json(urls["b"], client=client)
+    entry_size = cache._path(urls["a"]).stat().st_size
+    cache.max_bytes = 2 * entry_size + entry_size // 2
+
+    # a was stored first, but is used again after b
+    os.utime(cache._path(urls["a"]), (1000, 1000))
+    os.utime(cache._path(urls["b"]), (2000, 2000))
+    cache.get_json(urls["a"], client=client)
+
+    cache.get_json(urls["c"], client=client)
+
+    assert cache._path(urls["a"]).exists()
+    assert not cache._path(urls["b"]).exists()
+    assert cache._path(urls["c"]).exists()
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.json")) <= (
+        cache.max_bytes
+    )
+
+    # The evicted entry is downloaded again
+    cache.get_json(urls["b"], client=client)
+    assert [path for path, _, _ in api.requests] == ["/a", "/b", "/c", "/b"]
+
+
+def test_client_keeps_recent_metrics_and_totals(api):
+    api.resources["/setlists"] = {"body": {"page": 1}}
+    client = HttpClient(max_retries=0, timeout=5, max_metrics=2)
+
+    for _ in range(5):
+        client.get(f"{api.url}/setlists")
+
+    totals, metrics = client.snapshot()
+    assert len(metrics) == 2
+    assert totals.requests == 5
+    assert totals.bytes == 5 * metrics[-1].bytes
+    assert totals.max_latency >= max(metric.latency for metric in metrics)
+    assert client.summary().startswith("5 requests, 0 retries")
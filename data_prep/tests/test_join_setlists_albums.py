@@ -0,0 +1,39 @@
+import pandas as pd
+
+from join_setlists_albums import build_song_dimension, join_setlists_albums
+
+ALBUMS = pd.DataFrame(
+    {
+        "album_name": ["Killers", "Killers", "Iron Maiden", "Iron Maiden"],
+        "song_name": ["Wrathchild", "Killers", "Iron Maiden", "Wrathchild"],
+    }
+)
+
+
+def test_build_song_dimension():
+    songs, ambiguous_songs = build_song_dimension(ALBUMS)
+
+    assert songs["song_id"].tolist() == [0, 1, 2]
+    assert songs["song_name"].tolist() == ["Wrathchild", "Killers", "Iron Maiden"]
+    assert ambiguous_songs.to_dict("list") == {
+        "song_id": [0, 0],
+        "song_name": ["Wrathchild", "Wrathchild"],
+        "album_name": ["Killers", "Iron Maiden"],
+        "attributed_album": ["Killers", "Killers"],
+    }
+
+
+def test_join_setlists_albums():
+    setlists = pd.DataFrame(
+        {"song_title": ["Iron Maiden", "Doctor Doctor", None, "Wrathchild"]}
+    )
+
+    concerts = join_setlists_albums(setlists, build_song_dimension(ALBUMS)[0])
+
+    assert concerts["song_id"].tolist() == [2, pd.NA, pd.NA, 0]
+    assert concerts["album_name"].astype(object).fillna("-").tolist() == [
+        "Iron Maiden",
+        "-",
+        "-",
+        "Killers",
+    ]
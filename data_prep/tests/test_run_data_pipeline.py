@@ -0,0 +1,121 @@
+import copy
+
+import pandas as pd
+import pytest
+
+from app_export import read_app_data, write_app_data
+from run_data_pipeline import (
+    APP_TABLES,
+    GEO_TABLES,
+    UPDATE_TABLES,
+    transform_data,
+    update_data,
+)
+
+
+@pytest.fixture(scope="module")
+def setlist_history(artist_data):
+    """The synthetic setlists before and after an update: 15 new shows
+    and a few older shows with a shorter setlist, another tour, another
+    city or a missing tour.
+    """
+    after = copy.deepcopy(artist_data["setlists"])
+    before = copy.deepcopy(after[15:])
+
+    changed = [20, 115, 415, 22, 24, 26]
+    for index in changed[:3]:
+        sets = after[index]["sets"]["set"]
+        if sets:
+            sets[0]["song"] = sets[0]["song"][:3]
+    after[22]["tour"] = {"name": "Tour 999"}
+    after[24]["venue"]["city"] = dict(
+        after[24]["venue"]["city"], name="Gotham", coords={"lat": 1.5, "long": 2.5}
+    )
+    after[26].pop("tour", None)
+
+    return before, after, after[:15] + [after[index] for index in changed]
+
+
+def assert_update_matches_full_run(
+    artist_data, missing_tour_data, before, after, delta, tmp_path
+):
+    write_app_data(
+        transform_data(before, artist_data["songs"], missing_tour_data),
+        tmp_path,
+        parquet=False,
+    )
+    updated = update_data(
+        delta,
+        artist_data["songs"],
+        missing_tour_data,
+        read_app_data(tmp_path, APP_TABLES + GEO_TABLES + UPDATE_TABLES),
+    )
+    full = transform_data(after, artist_data["songs"], missing_tour_data)
+
+    # Compare the tables as written to and read from the app data files
+    write_app_data(updated, tmp_path / "updated", parquet=False)
+    write_app_data(full, tmp_path / "full", parquet=False)
+    names = APP_TABLES + GEO_TABLES + UPDATE_TABLES
+
+    for name, table in read_app_data(tmp_path / "updated", names).items():
+        pd.testing.assert_frame_equal(
+            table, read_app_data(tmp_path / "full", [name])[name], obj=name
+        )
+
+
+def test_update_data_matches_full_run(
+    artist_data, missing_tour_data, setlist_history, tmp_path
+):
+    before, after, delta = setlist_history
+
+    assert_update_matches_full_run(
+        artist_data, missing_tour_data, before, after, delta, tmp_path
+    )
+
+
+def test_update_data_without_us_shows(artist_data, missing_tour_data, tmp_path):
+    before = artist_data["setlists"]
+    after = copy.deepcopy(before)
+
+    # Shorter setlists of three shows outside of the US: the delta has no
+    # state codes
+    changed = [
+        index
+        for index, setlist in enumerate(after)
+        if setlist["venue"]["city"]["country"]["name"] != "United States"
+        and setlist["sets"]["set"]
+    ][:3]
+    for index in changed:
+        first_set = after[index]["sets"]["set"][0]
+        after[index]["sets"]["set"] = [dict(first_set, song=first_set["song"][:3])]
+
+    assert_update_matches_full_run(
+        artist_data,
+        missing_tour_data,
+        before,
+        after,
+        [after[index] for index in changed],
+        tmp_path,
+    )
+
+
+def test_update_data_keeps_known_spelling(artist_data, missing_tour_data, tmp_path):
+    setlists = copy.deepcopy(artist_data["setlists"][:40])
+    songs = setlists[0]["sets"]["set"][0]["song"]
+    songs.append({"name": "Intro Tape", "tape": True})
+
+    write_app_data(
+        transform_data(setlists[1:], artist_data["songs"], missing_tour_data),
+        tmp_path,
+        parquet=False,
+    )
+    app_tables = read_app_data(tmp_path, APP_TABLES + GEO_TABLES + UPDATE_TABLES)
+    # A non-album title with a known spelling that differs from the update
+    app_tables["song_titles"] = pd.DataFrame({"song_title": ["INTRO TAPE"]})
+
+    updated = update_data(
+        setlists[:1], artist_data["songs"], missing_tour_data, app_tables
+    )
+
+    assert "INTRO TAPE (from tape)" in updated["app_setlist_data"]["setlist"].iloc[0]
+    assert "INTRO TAPE" in updated["song_titles"]["song_title"].tolist()
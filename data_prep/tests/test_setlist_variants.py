@@ -0,0 +1,132 @@
+import random
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from setlist_variants import lsh_clusters, setlist_variants
+
+SONGS = [f"Song {number}" for number in range(100)]
+
+
+def concerts_frame(setlists: List[Tuple[str, List[Optional[str]]]]) -> pd.DataFrame:
+    """Song-level concerts data with the columns used by
+    setlist_variants() from (tour, songs) tuples.
+    """
+    rows = [
+        (f"{show:06d}", tour, position + 1, title)
+        for show, (tour, songs) in enumerate(setlists)
+        for position, title in enumerate(songs)
+    ]
+    return pd.DataFrame(rows, columns=["id", "tour", "song_count", "song_title"])
+
+
+def swap_songs(songs: List[str], swaps: int, rnd: random.Random) -> List[str]:
+    songs = list(songs)
+    for _ in range(swaps):
+        first, second = rnd.sample(range(len(songs)), 2)
+        songs[first], songs[second] = songs[second], songs[first]
+    return songs
+
+
+def replace_songs(songs: List[str], replacements: int, rnd: random.Random):
+    songs = list(songs)
+    for _ in range(replacements):
+        songs[rnd.randrange(len(songs))] = rnd.choice(SONGS)
+    return songs
+
+
+@pytest.mark.parametrize("change", [swap_songs, replace_songs])
+def test_setlists_sharing_half_of_their_songs_are_separate_variants(change):
+    rnd = random.Random(3)
+    shared = rnd.sample(SONGS, 8)
+    others = [song for song in SONGS if song not in shared]
+    bases = [shared + others[:8], shared + others[8:16]]
+    for base in bases:
+        rnd.shuffle(base)
+
+    setlists = [("Tour", change(base, 1, rnd)) for base in bases for _ in range(150)]
+    variants = setlist_variants(concerts_frame(setlists))
+    variants["base"] = np.repeat([0, 1], 150)
+
+    assert variants.groupby("base")["variant"].nunique().tolist() == [1, 1]
+    assert variants["variant"].nunique() == 2
+    assert not variants["anomaly"].any()
+
+
+@pytest.mark.parametrize("change", [swap_songs, replace_songs])
+def test_small_changes_are_not_anomalies(change):
+    rnd = random.Random(5)
+    base = rnd.sample(SONGS, 18)
+    setlists = [("Tour", base)] + [("Tour", change(base, 2, rnd)) for _ in range(100)]
+
+    variants = setlist_variants(concerts_frame(setlists))
+
+    assert (variants["variant"] == 1).all()
+    assert (variants["canonical_id"] == "000000").all()
+    assert variants["distance"].max() <= 0.5
+    assert not variants["anomaly"].any()
+
+
+def test_anomalies():
+    rnd = random.Random(7)
+    base = rnd.sample(SONGS, 16)
+    regular = [("Tour", replace_songs(base, 1, rnd)) for _ in range(20)]
+    truncated = [("Tour", base[:5]), ("Tour", base[:5])]
+    unrelated = [("Tour", rnd.sample(SONGS, 16))]
+    empty = [("Tour", [None])]
+
+    variants = setlist_variants(
+        concerts_frame(regular + truncated + unrelated + empty)
+    ).set_index("id")
+
+    assert variants["anomaly"].tolist() == [False] * 20 + [True] * 4
+    assert variants["songs"].iloc[-1] == 0
+    assert pd.isna(variants["variant"].iloc[-1])
+    # The identical truncated setlists form their own variant
+    assert variants["variant_shows"].iloc[20:22].tolist() == [2, 2]
+
+
+def test_canonical_setlist_is_the_most_common_setlist():
+    base = SONGS[:12]
+    variation = SONGS[:11] + ["Song 50"]
+    setlists = [("Tour", variation)] + [("Tour", base)] * 3 + [("Tour", variation)]
+
+    variants = setlist_variants(concerts_frame(setlists))
+
+    assert (variants["canonical_id"] == "000001").all()
+    assert variants["variant_shows"].tolist() == [5] * 5
+    assert variants["distance"].tolist()[1:4] == [0, 0, 0]
+
+
+def test_variants_are_separated_by_tour():
+    setlists = [("Tour A", SONGS[:10])] * 3 + [("Tour B", SONGS[:10])] * 2
+
+    variants = setlist_variants(concerts_frame(setlists))
+
+    assert variants["canonical_id"].tolist() == ["000000"] * 3 + ["000003"] * 2
+    assert variants["variant"].tolist() == [1] * 5
+
+
+def test_lsh_clusters_do_not_chain_dissimilar_shows():
+    # b is similar to a and c, but a and c are not similar
+    signatures = np.array(
+        [[0, 0, 0, 0, 1, 1, 1, 1], [0, 0, 0, 0, 0, 0, 2, 2], [0, 0, 3, 3, 3, 3, 2, 2]],
+        dtype=np.uint32,
+    )
+
+    labels = lsh_clusters(
+        signatures, np.zeros(3, dtype=int), bands=4, min_similarity=0.5
+    )
+
+    assert labels.tolist() == [0, 0, 2]
+
+
+def test_synthetic_concerts(concerts):
+    variants = setlist_variants(concerts)
+
+    assert len(variants) == concerts["id"].nunique()
+    assert variants["id"].is_unique
+    assert (variants["distance"].dropna() <= 0.5).all()
+    assert variants["anomaly"][variants["songs"] == 0].all()
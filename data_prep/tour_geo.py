@@ -0,0 +1,340 @@
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# Mean earth radius in km
+EARTH_RADIUS_KM = 6371.0088
+
+# Tile size of the web map (Leaflet) in pixels
+TILE_PIXELS = 256
+
+# Zoom levels for which the map markers are clustered; the app shows
+# one marker per city above the highest level
+CLUSTER_ZOOMS = [2, 3, 4, 5, 6, 7, 8]
+
+# Maximum latitude of the Web Mercator projection
+MAX_LATITUDE = 85.05112878
+
+
+def haversine_km(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """Great-circle distances between two arrays of coordinates (in
+    degrees) with the haversine formula.
+
+    Args:
+        lat1, lon1 (np.ndarray): coordinates of the start points
+        lat2, lon2 (np.ndarray): coordinates of the end points
+
+    Returns:
+        distances (np.ndarray): distances in km
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(values, dtype=float))
+        for values in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def prepare_tour_route(app_setlists: pd.DataFrame) -> pd.DataFrame:
+    """Creates the travel route of each tour for the Shiny app: the
+    concerts with coordinates in chronological order and the distance
+    travelled from the previous concert of the tour (leg). Concerts on
+    the same date keep the reverse order of the setlist data, which
+    lists the newest concerts first, so the route is the same as the
+    reversed rows previously drawn by the app. All legs are computed at
+    once on the sorted concerts of all tours. The tours are sorted by
+    name, like the other tour tables (see update_tour_geo()).
+
+    Args:
+        app_setlists (DataFrame): output of data_prep.prepare_setlists()
+
+    Returns:
+        tour_route (DataFrame): one row per concert with the columns
+            tour, id, date, city, latitude, longitude and leg_km
+            (missing for the first concert of a tour)
+    """
+    route = app_setlists.loc[
+        app_setlists["tour"].notna()
+        & app_setlists["latitude"].notna()
+        & app_setlists["longitude"].notna(),
+        ["tour", "id", "date", "city", "latitude", "longitude"],
+    ].iloc[::-1]
+
+    dates = pd.to_datetime(route["date"], format="%d-%m-%Y")
+    order = np.lexsort((dates.to_numpy(), pd.factorize(route["tour"], sort=True)[0]))
+    route = route.iloc[order].reset_index(drop=True)
+
+    tours = route["tour"].to_numpy()
+    latitude = route["latitude"].to_numpy(dtype=float)
+    longitude = route["longitude"].to_numpy(dtype=float)
+
+    leg_km = np.full(len(route), np.nan)
+    if len(route) > 1:
+        leg_km[1:] = haversine_km(
+            latitude[:-1], longitude[:-1], latitude[1:], longitude[1:]
+        )
+        leg_km[1:][tours[1:] != tours[:-1]] = np.nan
+
+    route["leg_km"] = leg_km.round(1)
+
+    return route
+
+
+def prepare_tour_travel(tour_route: pd.DataFrame) -> pd.DataFrame:
+    """Summarizes the travel route of each tour: number of concerts,
+    total distance and the longest leg.
+
+    Args:
+        tour_route (DataFrame): output of prepare_tour_route()
+
+    Returns:
+        tour_travel (DataFrame): one row per tour with the columns
+            tour, concerts, total_km, longest_leg_km, longest_leg_from,
+            longest_leg_to and longest_leg_date (date of the concert at
+            the end of the longest leg)
+    """
+    previous = tour_route.shift(1)
+    legs = tour_route.assign(
+        from_city=previous["city"], from_date=previous["date"]
+    ).dropna(subset=["leg_km"])
+
+    # First longest leg of each tour
+    longest = legs.sort_values(
+        by=["tour", "leg_km"], ascending=[True, False], kind="stable"
+    ).drop_duplicates(subset="tour")
+
+    tour_travel = (
+        tour_route.groupby("tour", sort=True)
+        .agg(concerts=("id", "size"), total_km=("leg_km", "sum"))
+        .reset_index()
+        .merge(
+            longest[["tour", "leg_km", "from_city", "city", "date"]].rename(
+                columns={
+                    "leg_km": "longest_leg_km",
+                    "from_city": "longest_leg_from",
+                    "city": "longest_leg_to",
+                    "date": "longest_leg_date",
+                }
+            ),
+            on="tour",
+            how="left",
+        )
+    )
+    tour_travel["total_km"] = tour_travel["total_km"].round(1)
+
+    return tour_travel
+
+
+def grid_cells(
+    latitude: np.ndarray, longitude: np.ndarray, zoom: int, cell_pixels: int = 64
+) -> np.ndarray:
+    """Grid cells of coordinates on the Web Mercator map at a zoom
+    level: the map is divided into squares of cell_pixels x cell_pixels
+    screen pixels, so the markers of a cell would overlap on the map.
+
+    Args:
+        latitude, longitude (np.ndarray): coordinates in degrees
+        zoom (int): map zoom level
+        cell_pixels (int): size of a cell in pixels
+
+    Returns:
+        cells (np.ndarray): cell number of each coordinate
+    """
+    cells_per_side = 2**zoom * TILE_PIXELS // cell_pixels
+    latitude = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+
+    x = np.floor((np.asarray(longitude) + 180) / 360 * cells_per_side)
+    y = np.floor((1 - np.arcsinh(np.tan(latitude)) / np.pi) / 2 * cells_per_side)
+    x = np.clip(x, 0, cells_per_side - 1).astype(np.int64)
+    y = np.clip(y, 0, cells_per_side - 1).astype(np.int64)
+
+    return y * cells_per_side + x
+
+
+def prepare_map_clusters(
+    map_popups: pd.DataFrame,
+    zooms: Iterable[int] = CLUSTER_ZOOMS,
+    cell_pixels: int = 64,
+) -> pd.DataFrame:
+    """Clusters the map markers of each tour (including "All Tours") on
+    a grid of screen cells at several zoom levels (see grid_cells()),
+    so the app draws one marker per cell instead of one per city. A
+    cluster is placed at the concert-weighted mean position of its
+    cities. Clusters of a single city keep the city's label and popup,
+    the popups of the other clusters list their cities.
+
+    Args:
+        map_popups (DataFrame): output of data_prep.prepare_map_popups()
+        zooms (iterable): map zoom levels
+        cell_pixels (int): see grid_cells()
+
+    Returns:
+        map_clusters (DataFrame): one row per tour, zoom level and
+            cluster with the columns tour, zoom, latitude, longitude,
+            cities, concerts, label and popup_text
+    """
+    markers = map_popups[
+        map_popups["latitude"].notna() & map_popups["longitude"].notna()
+    ].reset_index(drop=True)
+    markers = markers.assign(
+        latitude=markers["latitude"].astype(float),
+        longitude=markers["longitude"].astype(float),
+        location=markers["city"].fillna("NA") + ", " + markers["country"].fillna("NA"),
+    )
+    markers = markers.assign(
+        weighted_latitude=markers["latitude"] * markers["concerts"],
+        weighted_longitude=markers["longitude"] * markers["concerts"],
+        city_line=markers["location"] + ": " + markers["concerts"].astype(str),
+    )
+
+    # Cities of a cluster are listed by number of concerts
+    markers = markers.iloc[
+        np.lexsort((np.arange(len(markers)), -markers["concerts"].to_numpy()))
+    ]
+
+    clusters = []
+    for zoom in zooms:
+        cells = grid_cells(
+            markers["latitude"].to_numpy(),
+            markers["longitude"].to_numpy(),
+            zoom,
+            cell_pixels,
+        )
+        cluster = (
+            markers.assign(cell=cells)
+            .groupby(["tour", "cell"], sort=False)
+            .agg(
+                cities=("city_line", "size"),
+                concerts=("concerts", "sum"),
+                weighted_latitude=("weighted_latitude", "sum"),
+                weighted_longitude=("weighted_longitude", "sum"),
+                city=("city", "first"),
+                city_latitude=("latitude", "first"),
+                city_longitude=("longitude", "first"),
+                city_popup=("popup_text", "first"),
+                city_list=("city_line", "<br>".join),
+            )
+            .reset_index()
+        )
+        clusters.append(cluster.assign(zoom=zoom))
+
+    clusters = pd.concat(clusters, ignore_index=True)
+    single = clusters["cities"] == 1
+
+    clusters["latitude"] = clusters["city_latitude"].where(
+        single, clusters["weighted_latitude"] / clusters["concerts"]
+    )
+    clusters["longitude"] = clusters["city_longitude"].where(
+        single, clusters["weighted_longitude"] / clusters["concerts"]
+    )
+    clusters["label"] = clusters["city"].where(
+        single, clusters["cities"].astype(str) + " cities"
+    )
+    clusters["popup_text"] = clusters["city_popup"].where(
+        single,
+        "<center><font size = 3><b>"
+        + clusters["concerts"].astype(str)
+        + " concerts in "
+        + clusters["cities"].astype(str)
+        + " cities</b></font></center>"
+        + "<div class='custom-popup'><br><font size = 2>"
+        + clusters["city_list"]
+        + "</font>",
+    )
+
+    return clusters.sort_values(
+        by=["tour", "zoom", "concerts"],
+        ascending=[True, True, False],
+        kind="stable",
+    ).reset_index(drop=True)[
+        [
+            "tour",
+            "zoom",
+            "latitude",
+            "longitude",
+            "cities",
+            "concerts",
+            "label",
+            "popup_text",
+        ]
+    ]
+
+
+def replace_tour_rows(
+    table: pd.DataFrame, tour_rows: pd.DataFrame, tours: Iterable[str]
+) -> pd.DataFrame:
+    """Replaces the rows of the given tours in a table sorted by tour
+    with their recomputed rows. The recomputed rows are inserted in
+    tour order, so the kept rows do not have to be sorted again.
+
+    Args:
+        table (DataFrame): a tour table, sorted by tour
+        tour_rows (DataFrame): the recomputed rows of the tours, sorted
+            by tour
+        tours (iterable): all replaced tours; their rows are removed
+            even if there are no recomputed rows for them
+
+    Returns:
+        table (DataFrame): the updated table
+    """
+    kept = table[~table["tour"].isin(list(tours))]
+    positions = np.searchsorted(
+        kept["tour"].to_numpy(dtype=object), tour_rows["tour"].to_numpy(dtype=object)
+    )
+    order = np.insert(
+        np.arange(len(kept)), positions, len(kept) + np.arange(len(tour_rows))
+    )
+
+    return (
+        pd.concat([kept, tour_rows], ignore_index=True)
+        .take(order)
+        .reset_index(drop=True)
+    )
+
+
+def update_tour_geo(
+    app_tables: Dict[str, pd.DataFrame], tours: Iterable[str]
+) -> Dict[str, pd.DataFrame]:
+    """Updates the tour routes, travel distances and map clusters after
+    the setlists and map popups of some tours have been updated (see
+    data_prep.update_app_tables()): they are only recomputed for these
+    tours and the map clusters for "All Tours" as well; the rows of all
+    other tours are kept.
+
+    Args:
+        app_tables (dict): the updated app DataFrames keyed by file name
+            with the existing app_tour_route, app_tour_travel and
+            app_map_clusters tables
+        tours (iterable): the tours of the changed concerts, before and
+            after the change
+
+    Returns:
+        geo_tables (dict): the updated app_tour_route, app_tour_travel
+            and app_map_clusters tables
+    """
+    tours = [tour for tour in tours if pd.notna(tour)]
+    setlists = app_tables["app_setlist_data"]
+    map_popups = app_tables["app_map_popups"]
+
+    tour_route = prepare_tour_route(setlists[setlists["tour"].isin(tours)])
+    map_clusters = prepare_map_clusters(
+        map_popups[map_popups["tour"].isin([*tours, "All Tours"])]
+    )
+
+    return {
+        "app_tour_route": replace_tour_rows(
+            app_tables["app_tour_route"], tour_route, tours
+        ),
+        "app_tour_travel": replace_tour_rows(
+            app_tables["app_tour_travel"], prepare_tour_travel(tour_route), tours
+        ),
+        "app_map_clusters": replace_tour_rows(
+            app_tables["app_map_clusters"], map_clusters, [*tours, "All Tours"]
+        ),
+    }